@@ -1 +1,4 @@
-from exchanges.bitbank import Exchange, Bitbank
\ No newline at end of file
+from exchanges.bitbank import Exchange, Bitbank
+from exchanges.ratelimit import RateLimiter, SharedRateLimiter, Nonce, SharedNonce
+from exchanges.httppool import HttpPool
+from exchanges.stream import EventStream, LocalStream, LocalStreamServer, BitbankStream
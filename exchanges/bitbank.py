@@ -1,8 +1,16 @@
+import copy
+import json
+import hmac
+import hashlib
+import threading
 from enum import Enum
+from urllib.parse import urlencode, urlparse
 import logging
 import requests
 import pandas as pd
 import python_bitbankcc
+from exchanges.httppool import HttpPool
+from exchanges.ratelimit import Nonce
 from utils import ensure_in_miliseconds
 
 
@@ -26,11 +34,40 @@ class Exchange:
     # Known exceptions that does not impact too much on the process
     KnownExceptions = () 
 
-    def __init__(self, pair: str, max_order_count=10, api_key=None, api_secret=None) -> None:
+    def __init__(self, pair: str, max_order_count=10, api_key=None, api_secret=None, rate_limiter=None) -> None:
         self.max_order_count = max_order_count
         self.pair = pair
         self.api_key = api_key
         self.api_secret = api_secret
+        # Shared by all the clients of the same API key, see `with_pair`
+        self.rate_limiter = rate_limiter
+        # API calls made by this client (not by the others of `with_pair`), see `PollScheduler`
+        self.api_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def http_stats(self):
+        """ Connection reuse of the HTTP pool of the client, see `HttpPool.stats` """
+        return {}
+
+    def with_pair(self, pair, max_order_count=None):
+        """ A client of `pair` sharing the connections, the API key and the rate limiter of this one """
+        ex = copy.copy(self)
+        ex.pair = pair
+        ex.api_calls = 0
+        ex._calls_lock = threading.Lock()
+        if max_order_count is not None:
+            ex.max_order_count = max_order_count
+        return ex
+
+    def _throttle(self):
+        """ Wait for the rate limiter (if any) before calling the private API """
+        self._count_call()
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def _count_call(self):
+        with self._calls_lock:
+            self.api_calls += 1
 
     def get_latest_prices(self):
         raise NotImplementedError()
@@ -44,6 +81,16 @@ class Exchange:
     def get_orders_data(self, order_ids):
         raise NotImplementedError()
 
+    def get_new_trades(self, since=None):
+        raise NotImplementedError()
+
+    def get_latest_trade(self):
+        raise NotImplementedError()
+
+    @classmethod
+    def order_data_from_fills(cls, order_id, start_amount, executed_amount, average_price):
+        raise NotImplementedError()
+
     @classmethod
     def is_order_cancelled(cls, order_data):
         raise NotImplementedError()
@@ -68,11 +115,78 @@ class Exchange:
         return self.name
 
 
+def parse_response(response):
+    """ `data` of a response of the REST API, the error code is in the message of the exception as the official api does """
+    res = response.json()
+    if res.get('success') == 1:
+        return res['data']
+    code = (res.get('data') or {}).get('code')
+    raise Exception(f"エラーコード: {code} 内容: HTTP {response.status_code}")
+
+
+class BitbankPublicExt(python_bitbankcc.public):
+    """ Public api on the connections of `http_pool` instead of a new connection per call """
+
+    def __init__(self, http_pool=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.http_pool = http_pool or HttpPool()
+
+    def _query(self, query_url):
+        return parse_response(self.http_pool.get(query_url))
+
+
 class BitbankPrivateExt(python_bitbankcc.private):
     # https://github.com/bitbankinc/bitbank-api-docs/blob/master/rest-api.md#trade
     # Official doc says the default limit is 1000, but the test shows it's 500
     #  Maybe we should not trust this value
     trade_history_count_limit = 500
+    default_end_point = 'https://api.bitbank.cc/v1'
+
+    def __init__(self, api_key, api_secret, http_pool=None, nonce=None, **kwargs) -> None:
+        super().__init__(api_key, api_secret, **kwargs)
+        self.http_pool = http_pool or HttpPool()
+        # Shared by all the clients (and processes) of the API key, see `SharedNonce`
+        self.nonce = nonce or Nonce()
+
+    # The requests of the official api are sent on a new connection each,
+    #  these are the same requests on the connections of `http_pool`
+    #   https://github.com/bitbankinc/bitbank-api-docs/blob/master/rest-api.md#authorization
+    def _get_query(self, path, query):
+        uri = path + urlencode(query)
+        end_point = getattr(self, 'end_point', self.default_end_point)
+        return self._signed_request(lambda headers: self.http_pool.get(end_point + uri, headers=headers),
+                                    lambda nonce: nonce + urlparse(end_point).path + uri)
+
+    def _post_query(self, path, query):
+        data = json.dumps(query)
+        end_point = getattr(self, 'end_point', self.default_end_point)
+        return self._signed_request(lambda headers: self.http_pool.post(end_point + path, data=data, headers=headers),
+                                    lambda nonce: nonce + data)
+
+    def _signed_request(self, send, message_of):
+        """ `send(headers)` signed right before it is sent.
+                The calls of one API key run concurrently, a request can reach the exchange after one signed later:
+                it is rejected (エラーコード: 20001) before being processed, so it is sent once more with a new nonce
+        """
+        try:
+            return parse_response(send(self._auth_headers(message_of)))
+        except Exception as e:
+            if '20001' not in str(e):
+                raise
+            logger.warning(f"Request rejected by the nonce, retry with a new one: {e}")
+        return parse_response(send(self._auth_headers(message_of)))
+
+    def _auth_headers(self, message_of):
+        """ Headers signing `message_of(nonce)`, the nonce increases even for the calls within a millisecond """
+        nonce = str(self.nonce.next())
+        signature = hmac.new(self.api_secret.encode('utf-8'), message_of(nonce).encode('utf-8'),
+                            hashlib.sha256).hexdigest()
+        return {
+            'Content-Type': 'application/json',
+            'ACCESS-KEY': self.api_key,
+            'ACCESS-NONCE': nonce,
+            'ACCESS-SIGNATURE': signature,
+        }
     
     # This endpoint is not support by the official python api
     # It is strange that this is a private api tho
@@ -113,6 +227,11 @@ class BitbankPrivateExt(python_bitbankcc.private):
 
         return self._get_query('/user/spot/trade_history?', query)
 
+    # Channel and token of the private stream (PubNub)
+    #   https://github.com/bitbankinc/bitbank-api-docs/blob/master/private-stream.md
+    def get_subscribe_info(self):
+        return self._get_query('/user/subscribe', {})
+
 
 class Bitbank(Exchange):
     '''
@@ -151,16 +270,28 @@ class Bitbank(Exchange):
         CancelledUnfilled = "CANCELED_UNFILLED"
         CancelledPartiallyFilled = "CANCELED_PARTIALLY_FILLED"
 
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, http_pool=None, nonce=None, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.pub = python_bitbankcc.public()
-        self.prv = BitbankPrivateExt(api_key=self.api_key, api_secret=self.api_secret)
+        # Shared by the clients of `with_pair` as well
+        self.http_pool = http_pool or HttpPool()
+        self.pub = BitbankPublicExt(http_pool=self.http_pool)
+        self.prv = BitbankPrivateExt(api_key=self.api_key, api_secret=self.api_secret, http_pool=self.http_pool,
+                                    nonce=nonce)
+
+    def http_stats(self):
+        return self.http_pool.stats()
     
     def get_latest_prices(self):
         """Get the latest price, best_ask, best_bid"""
         info = {}
+        self._count_call()
         res = self.pub.get_ticker(self.pair)
-        
+        return self.parse_ticker(res)
+
+    @classmethod
+    def parse_ticker(cls, res):
+        """ Latest prices from the ticker, of the REST API or the realtime stream """
+        info = {}
         info['price'] = float(res['last'])
         info['best_ask'] = float(res['sell'])
         info['best_bid'] = float(res['buy'])
@@ -180,6 +311,7 @@ class Bitbank(Exchange):
         return None
     
     def get_assets(self):
+        self._throttle()
         res = self.prv.get_asset()
         base_amount = self.parse_currency_amount(response=res, part='base')
         quote_amount = self.parse_currency_amount(response=res, part='quote')
@@ -215,6 +347,7 @@ class Bitbank(Exchange):
         if not pair:
             return {}
 
+        self._throttle()
         res = self.prv.get_pairs()
         pair_data = {}
         for pair_data in res['pairs']:
@@ -240,6 +373,7 @@ class Bitbank(Exchange):
 
         try:
             logger.debug(f"Requesting to create order: {side_value} {order.amount} {order.pair} @{order.price}")
+            self._throttle()
             order_data = self.prv.order(pair=order.pair, price=order.price, amount=order.amount, 
                                 side=side_value, order_type=order_type_value, post_only=order.post_only)
         except Exception as e:
@@ -267,12 +401,14 @@ class Bitbank(Exchange):
         if not order_ids:
             return []
         logger.debug(f"Requesting to cancel orders: {order_ids}")
+        self._throttle()
         res = self.prv.cancel_orders(self.pair, order_ids=order_ids)
         # print("Response of cancel order:", res)
         orders_data = res['orders']
         return orders_data
 
     def get_active_orders_data(self):
+        self._throttle()
         res = self.prv.get_active_orders(self.pair)
         # print("Response of get_active_orders_data:", res)
         orders_data = res['orders']
@@ -283,20 +419,69 @@ class Bitbank(Exchange):
             return []
 
         try:
+            self._throttle()
             res = self.prv.get_orders_info(self.pair, order_ids=order_ids)
         except Exception as e:
-            message = e.args[0] if e.args and len(e.args) > 0 else ''
-             # argument of type 'MaxRetryError' is not iterable
-            if isinstance(message, str):
-                if '20001' in message: # エラーコード: 20001 内容: API認証に失敗しました
-                    # This seems to occur oftenly when the same API Key is used in other places at the same time
-                    raise ApiAuthFailedError(message)
-
-            raise e
+            self._raise_api_error(e)
             
         # print("Response of check_order_status:", res)
         orders_data = res['orders']
         return orders_data
+
+    def get_new_trades(self, since=None):
+        """ Trades of the pair executed at or after `since` (in miliseconds), the oldest first.
+                At most `trade_history_count_limit` trades are returned, the rest are left to the next call
+        """
+        try:
+            self._throttle()
+            res = self.prv.get_trade_history(pair=self.pair, order_count=self.prv.trade_history_count_limit,
+                                            since=since, order='asc')
+        except Exception as e:
+            self._raise_api_error(e)
+        return res['trades']
+
+    def get_latest_trade(self):
+        """ The latest trade of the pair (in the format of `get_new_trades`), None if there is none yet """
+        try:
+            self._throttle()
+            res = self.prv.get_trade_history(pair=self.pair, order_count=1, order='desc')
+        except Exception as e:
+            self._raise_api_error(e)
+        trades = res['trades']
+        return trades[0] if trades else None
+
+    def get_stream_subscription(self):
+        """ {'pubnub_channel': ..., 'pubnub_token': ...} to subscribe the private stream """
+        try:
+            self._throttle()
+            return self.prv.get_subscribe_info()
+        except Exception as e:
+            self._raise_api_error(e)
+
+    @classmethod
+    def _raise_api_error(cls, e):
+        message = e.args[0] if e.args and len(e.args) > 0 else ''
+         # argument of type 'MaxRetryError' is not iterable
+        if isinstance(message, str):
+            if '20001' in message: # エラーコード: 20001 内容: API認証に失敗しました
+                # This seems to occur oftenly when the same API Key is used in other places at the same time
+                raise ApiAuthFailedError(message)
+
+        raise e
+
+    @classmethod
+    def order_data_from_fills(cls, order_id, start_amount, executed_amount, average_price):
+        """ Order data (in the format of `get_orders_data`) of an order filled by `executed_amount` in total """
+        remaining_amount = max(round(start_amount - executed_amount, 8), 0)
+        status = cls.OrderStatus.FullyFilled if remaining_amount <= 0 else cls.OrderStatus.PartiallyFilled
+        return {
+            'order_id': order_id,
+            'start_amount': start_amount,
+            'executed_amount': executed_amount,
+            'remaining_amount': remaining_amount,
+            'average_price': average_price,
+            'status': status.value,
+        }
     
     @classmethod
     def is_order_cancelled(cls, order_data):
@@ -340,6 +525,7 @@ class Bitbank(Exchange):
         batch_end = end
 
         while True:
+            self._throttle()
             res = self.prv.get_trade_history(pair=pair, order_count=order_count, since=batch_start, end=batch_end, order=order)
             trades_data = res['trades']
             n_records_batch = len(trades_data)
@@ -0,0 +1,97 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class _CountingAdapter(HTTPAdapter):
+    """ HTTPAdapter counting the connections it opens, including the ones of the pools evicted since """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.connections = 0
+        self._count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(pool_cls):
+            class CountingPool(pool_cls):
+                def _new_conn(self):
+                    with adapter._count_lock:
+                        adapter.connections += 1
+                    return super()._new_conn()
+            return CountingPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': counting(HTTPConnectionPool),
+            'https': counting(HTTPSConnectionPool),
+        }
+
+
+class HttpPool:
+    """ Keep-alive HTTP connections shared by the API clients (and threads) of a process.
+            Up to `pool_size` connections per host are kept open and reused, which saves the TCP / TLS handshake
+            of each call. Requests without a timeout get (`connect_timeout`, `read_timeout`).
+            The connections are not shared across processes: each worker process creates its own pool
+    """
+
+    def __init__(self, pool_size=16, connect_timeout=3.05, read_timeout=10, max_retries=0) -> None:
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # `max_retries` only retries the failures before the request is sent (e.g., connection refused),
+        #  a request reaching the exchange (e.g., creating an order) is never sent twice
+        adapter = _CountingAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._adapter = adapter
+        self._requests = 0
+        self._errors = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        """ Same as `requests.request`, on the pooled connections """
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._requests += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """ {'pool', 'requests', 'connections', 'reused', 'errors'}, `connections` are the ones opened so far:
+                a request not opening a connection reused a kept-alive one
+        """
+        connections = self._adapter.connections
+        with self._lock:
+            requests_count, errors = self._requests, self._errors
+        return {
+            'pool': f"{os.getpid()}-{id(self):x}",
+            'requests': requests_count,
+            'connections': connections,
+            'reused': max(requests_count - connections, 0),
+            'errors': errors,
+        }
+
+    def close(self):
+        self.session.close()
+
+    def __repr__(self) -> str:
+        return f"HttpPool(pool_size={self.pool_size}, timeout={self.timeout})"
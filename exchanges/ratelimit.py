@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+import multiprocessing
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """ Token bucket shared by the exchange clients (and threads) calling the same API key:
+            at most `rate` calls per second on average, bursts of up to `burst` calls.
+            A caller over the budget takes a token in advance and sleeps until it is due
+    """
+
+    def __init__(self, rate, burst=None) -> None:
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """ Take `tokens` from the bucket, blocking until they are available. Returns the seconds waited """
+        with self._lock:
+            self._tokens, self._updated, wait = self._take(self._tokens, self._updated, tokens)
+        if wait > 0:
+            logger.debug(f"Rate limited, wait for {wait:.3f}s")
+            time.sleep(wait)
+        return wait
+
+    def _take(self, available, updated, tokens):
+        """ New state of the bucket (tokens, updated) after taking `tokens`, and the seconds to wait for them """
+        now = time.monotonic()
+        available = min(self.burst, available + (now - updated) * self.rate) - tokens
+        wait = -available / self.rate if available < 0 else 0
+        return available, now, wait
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.rate}/s, burst={self.burst})"
+
+
+class SharedRateLimiter(RateLimiter):
+    """ `RateLimiter` shared by processes: the bucket lives in shared memory.
+            Create it in the parent process and pass it to the worker processes on start
+    """
+
+    def __init__(self, rate, burst=None, ctx=None) -> None:
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        ctx = ctx or multiprocessing.get_context()
+        # [tokens, updated], guarded by the lock of the array
+        self._state = ctx.Array('d', [self.burst, time.monotonic()])
+
+    def acquire(self, tokens=1):
+        state = self._state
+        with state.get_lock():
+            state[0], state[1], wait = self._take(state[0], state[1], tokens)
+        if wait > 0:
+            logger.debug(f"Rate limited, wait for {wait:.3f}s")
+            time.sleep(wait)
+        return wait
+
+
+class Nonce:
+    """ ACCESS-NONCE of the private API calls signed with one API key, increasing on each call:
+            the time in miliseconds, or one more than the last nonce if called within the same milisecond
+    """
+
+    def __init__(self) -> None:
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            self._last = self._next(self._last)
+            return self._last
+
+    @staticmethod
+    def _next(last):
+        return max(last + 1, int(time.time() * 1000))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}()"
+
+
+class SharedNonce(Nonce):
+    """ `Nonce` shared by processes signing with the same API key: the last nonce lives in shared memory.
+            Create it in the parent process and pass it to the worker processes on start
+    """
+
+    def __init__(self, ctx=None) -> None:
+        ctx = ctx or multiprocessing.get_context()
+        self._last = ctx.Value('q', 0)
+
+    def next(self):
+        last = self._last
+        with last.get_lock():
+            last.value = self._next(last.value)
+            return last.value
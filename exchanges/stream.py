@@ -0,0 +1,290 @@
+import json
+import socket
+import logging
+import threading
+import socketserver
+from collections import defaultdict
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventStream:
+    """ Base of the push streams of the exchange events.
+
+        An event is a dict of {'type': ..., 'pair': ..., 'data': ...}, by type the data is
+            ticker: the latest prices, in the format of `Exchange.get_latest_prices`
+            order: the data of an order, in the format of `Exchange.get_orders_data`
+            trade: an executed trade, in the format of `Exchange.get_new_trades`
+        The events of a pair are passed to the handlers subscribed to the pair, in the thread of the stream
+    """
+    event_types = ('ticker', 'order', 'trade')
+
+    def __init__(self) -> None:
+        self._handlers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, pair, handler):
+        with self._lock:
+            self._handlers[pair].append(handler)
+
+    def unsubscribe(self, pair, handler):
+        with self._lock:
+            if handler in self._handlers[pair]:
+                self._handlers[pair].remove(handler)
+
+    def dispatch(self, event):
+        if event.get('type') not in self.event_types:
+            logger.warning(f"Unknown event from {self}: {event}")
+            return
+        with self._lock:
+            handlers = list(self._handlers[event['pair']])
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.exception(f"Error handling the event {event}: {e}")
+
+    @property
+    def pairs(self):
+        with self._lock:
+            return [pair for pair, handlers in self._handlers.items() if handlers]
+
+    def start(self):
+        raise NotImplementedError()
+
+    def stop(self):
+        raise NotImplementedError()
+
+
+class LocalStream(EventStream):
+    """ Client of `LocalStreamServer`: the events are JSON lines over a local socket.
+            Reconnects after `retry_interval` seconds when the connection is lost
+    """
+    # Seconds between the checks of `stop` while waiting for the events
+    read_timeout = 0.2
+
+    def __init__(self, host='127.0.0.1', port=8765, retry_interval=1) -> None:
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+        self.connected = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=f"stream-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=self.read_timeout) as sock:
+                    self.connected.set()
+                    self._read_events(sock)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Stream {self.host}:{self.port} disconnected: {e}")
+            self.connected.clear()
+            self._stopped.wait(self.retry_interval)
+
+    def _read_events(self, sock):
+        """ Dispatch the events (one per line) until the server leaves or the stream is stopped """
+        buffer = b''
+        while not self._stopped.is_set():
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                # Check whether the stream is stopped
+                continue
+            if not data:
+                raise ConnectionError("Closed by the server")
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                self.dispatch(json.loads(line))
+
+    def __repr__(self) -> str:
+        return f"LocalStream({self.host}:{self.port})"
+
+
+class LocalStreamServer:
+    """ Stand-in of the exchange stream (e.g., for tests): `publish` sends an event to all the connected clients.
+            Binds a free port if `port` is 0
+    """
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.server.owner._add_client(self)
+            # Keep the connection until the client leaves
+            try:
+                while self.rfile.read(1024):
+                    pass
+            except OSError:
+                pass
+            self.server.owner._remove_client(self)
+
+    class Server(socketserver.ThreadingTCPServer):
+        # Restart on the same port right after stopping
+        allow_reuse_address = True
+        daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0) -> None:
+        self._server = self.Server((host, port), self.Handler)
+        self._server.owner = self
+        self._clients = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def _add_client(self, handler):
+        with self._lock:
+            self._clients.append(handler)
+
+    def _remove_client(self, handler):
+        with self._lock:
+            if handler in self._clients:
+                self._clients.remove(handler)
+
+    @property
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, event):
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        with self._lock:
+            clients = list(self._clients)
+        for handler in clients:
+            try:
+                handler.wfile.write(line)
+                handler.wfile.flush()
+            except OSError:
+                self._remove_client(handler)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stream-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop serving and drop the connections of the clients """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for handler in clients:
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class BitbankStream(EventStream):
+    """ Realtime APIs of bitbank:
+            ticker: public stream (Socket.IO), https://github.com/bitbankinc/bitbank-api-docs/blob/master/public-stream.md
+            order / trade: private stream (PubNub), https://github.com/bitbankinc/bitbank-api-docs/blob/master/private-stream.md
+        Requires `python-socketio[client]` and `pubnub`
+    """
+    public_url = 'wss://stream.bitbank.cc'
+    pubnub_subscribe_key = 'sub-c-ecebae8e-dd60-11e6-b6b1-02ee2ddab7fe'
+
+    def __init__(self, exchange) -> None:
+        super().__init__()
+        self.exchange = exchange
+        self._sio = None
+        self._pubnub = None
+
+    def subscribe(self, pair, handler):
+        joined = pair in self.pairs
+        super().subscribe(pair, handler)
+        if self._sio and self._sio.connected and not joined:
+            self._sio.emit('join-room', f"ticker_{pair}")
+
+    def start(self):
+        self._start_public()
+        self._start_private()
+
+    def stop(self):
+        if self._sio:
+            self._sio.disconnect()
+        if self._pubnub:
+            self._pubnub.unsubscribe_all()
+            self._pubnub.stop()
+
+    #################
+    # Public stream
+    def _start_public(self):
+        import socketio
+
+        sio = socketio.Client(reconnection=True)
+
+        @sio.event
+        def connect():
+            # Also on reconnection: the rooms are left on disconnection
+            for pair in self.pairs:
+                sio.emit('join-room', f"ticker_{pair}")
+
+        @sio.on('message')
+        def on_message(message):
+            room = message.get('room_name', '')
+            if room.startswith('ticker_'):
+                pair = room[len('ticker_'):]
+                price_info = self.exchange.parse_ticker(message['message']['data'])
+                self.dispatch({'type': 'ticker', 'pair': pair, 'data': price_info})
+
+        sio.connect(self.public_url, transports=['websocket'])
+        self._sio = sio
+
+    #################
+    # Private stream
+    def _start_private(self):
+        from pubnub.pnconfiguration import PNConfiguration
+        from pubnub.pubnub import PubNub
+        from pubnub.callbacks import SubscribeCallback
+        from pubnub.enums import PNStatusCategory
+
+        info = self.exchange.get_stream_subscription()
+        config = PNConfiguration()
+        config.subscribe_key = self.pubnub_subscribe_key
+        config.uuid = info['pubnub_channel']
+        pubnub = PubNub(config)
+        pubnub.set_token(info['pubnub_token'])
+        stream = self
+
+        class Listener(SubscribeCallback):
+            def status(self, pubnub, status):
+                if status.category == PNStatusCategory.PNAccessDeniedCategory:
+                    # The token expires, get a new one
+                    new_info = stream.exchange.get_stream_subscription()
+                    pubnub.set_token(new_info['pubnub_token'])
+                    pubnub.reconnect()
+
+            def message(self, pubnub, message):
+                stream._on_private_message(message.message)
+
+        pubnub.add_listener(Listener())
+        pubnub.subscribe().channels([info['pubnub_channel']]).execute()
+        self._pubnub = pubnub
+
+    def _on_private_message(self, message):
+        """ {'method': 'spot_order' / 'spot_trade' / ..., 'params': [data, ...]} """
+        method = message.get('method', '')
+        event_type = {'spot_order': 'order', 'spot_order_new': 'order', 'spot_trade': 'trade'}.get(method)
+        if not event_type:
+            return
+        for data in message.get('params', []):
+            self.dispatch({'type': event_type, 'pair': data.get('pair'), 'data': data})
+
+    def __repr__(self) -> str:
+        return f"BitbankStream({self.pairs})"
@@ -1,5 +1,6 @@
 from grid_trade.orders import Order
 from grid_trade.base import GridBot
+from grid_trade.async_bot import AsyncGridBot
 from utils import init_formatted_properties
 
 
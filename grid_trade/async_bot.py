@@ -0,0 +1,379 @@
+import sys
+sys.path.append('.')
+
+import asyncio
+import functools
+import logging
+from grid_trade.base import GridBot
+from grid_trade.orders import OrderStatus
+from utils import make_async
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundCalls:
+    """ Proxy of a blocking client (e.g., db, notifier) whose method calls run in an executor in the background
+            The calls return None immediately and are executed one after another in the calling order.
+            Outside of a running event loop the calls are executed directly
+    """
+
+    def __init__(self, target, executor=None) -> None:
+        self.target = target
+        self.executor = executor
+        self._last_task = None
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            self._schedule(functools.partial(attr, *args, **kwargs))
+        return call
+
+    def _schedule(self, func):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            func()
+            return
+        self._last_task = asyncio.ensure_future(self._run_after(self._last_task, func))
+
+    async def _run_after(self, previous, func):
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            await make_async(func, executor=self.executor)
+        except Exception as e:
+            logger.error(f"Background call {func.func.__qualname__} failed: {e}")
+
+    async def flush(self):
+        """ Wait until all the calls scheduled so far are done """
+        if self._last_task:
+            await asyncio.wait([self._last_task])
+
+    def __repr__(self) -> str:
+        return f"BackgroundCalls({self.target})"
+
+
+class AsyncGridBot(GridBot):
+    """ GridBot driven by an asyncio event loop
+            The exchange calls are awaited in `executor` (the default executor of the loop if None),
+            the db and notifier calls run in the background while the exchange is being waited for.
+            The order manager is the same as the one of GridBot and stays synchronous.
+            Many bots can share one event loop (and one executor)
+    """
+
+    def __init__(self, exchange=None, executor=None, **kwargs) -> None:
+        super().__init__(exchange=exchange, **kwargs)
+        self.executor = executor
+        # Loop of the bot, the stream events are passed into it from the thread of the stream
+        self._loop = None
+        self._async_lock = None
+
+    async def _call(self, func, *args, **kwargs):
+        return await make_async(func, *args, executor=self.executor, **kwargs)
+
+    def _in_background(self, additional_info):
+        info = dict(additional_info)
+        for key in ['db', 'notifier']:
+            client = info.get(key, None)
+            if client is not None and not isinstance(client, BackgroundCalls):
+                info[key] = BackgroundCalls(client, executor=self.executor)
+        return info
+
+    async def flush(self):
+        """ Wait for the db and notifier calls running in the background """
+        for client in [self.db, self.notifier]:
+            if isinstance(client, BackgroundCalls):
+                await client.flush()
+
+    #################
+    # Core logic
+    async def init_and_start(self, param, additional_info={}):
+        """ Init the order manager and start the bot """
+        self._loop = asyncio.get_running_loop()
+        if not self._init_order_manager(param=param, additional_info=self._in_background(additional_info)):
+            return
+        # The trades of the orders created from here on are after the latest one
+        await self._restart_trade_cursor([], swept_all=True)
+        await self._commit_create_orders()
+        self.om.print_stacks()
+        self.save_snapshot()
+        await self.flush()
+
+    async def warm_start(self, param, additional_info={}, snapshot=None):
+        """ Same as `GridBot.warm_start` """
+        self._loop = asyncio.get_running_loop()
+        if not self._init_order_manager(param=param, additional_info=self._in_background(additional_info)):
+            return
+        orders_data = await self._call(self._retrieve_live_orders_data) if snapshot and snapshot['orders'] else []
+        order_ids_to_cancel = self._adopt_orders(orders_data, snapshot=snapshot)
+        # All the live orders are read, the trades so far are in their executed amounts
+        await self._restart_trade_cursor(orders_data or [], swept_all=True)
+        if order_ids_to_cancel:
+            try:
+                await self._call(self.exchange.cancel_orders, order_ids_to_cancel)
+            except Exception as e:
+                self.notify_error(f"Cancel orders failed for {self.exchange} for orders: {order_ids_to_cancel}. Please check manually!")
+        await self._commit_create_orders()
+        self.om.print_stacks()
+        self.save_snapshot()
+        await self.flush()
+
+    async def stop_and_hand_over(self):
+        super().stop_and_hand_over()
+        await self.flush()
+
+    async def cancel_and_stop(self):
+        """ Cancel all orders and stop the bot. """
+        if not self.om:
+            logger.warning(f"Stopping a bot while it is not started yet. Skip.")
+            return
+
+        order_ids = self.om.active_order_ids
+        try:
+            await self._call(self.exchange.cancel_orders, order_ids)
+        except Exception as e:
+            self.notify_error(f"Cancel orders failed for {self.exchange}. Please check manually!")
+        self._stop()
+        await self.flush()
+
+    async def sync_and_adjust(self):
+        """ Sync the orders status from exchange and adjust the stacks (refill new orders, balance stacks etc.) """
+        try:
+            async with self.async_lock:
+                with self.latency.time('sync'):
+                    await self._sync_and_adjust()
+        finally:
+            await self.flush()
+
+    @property
+    def async_lock(self) -> asyncio.Lock:
+        """ The syncs and the stream events are applied one at a time, created in the loop of the bot """
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    def on_stream_event(self, event):
+        """ Called from the thread of the stream: the event is applied in the loop of the bot """
+        if self._loop is None or self._loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._on_stream_event(event), self._loop)
+        future.add_done_callback(self._on_stream_event_done)
+        return future
+
+    def _on_stream_event_done(self, future):
+        """ Nobody waits for the events applied in the loop, report their errors here """
+        if future.cancelled():
+            return
+        e = future.exception()
+        if e is not None:
+            self.notify_error(f"Error applying the stream event from {self.exchange}: {e!r}")
+
+    async def _on_stream_event(self, event):
+        try:
+            async with self.async_lock:
+                with self.latency.time(f"event_{event['type']}"):
+                    await self._apply_stream_event(event)
+        finally:
+            await self.flush()
+
+    async def _apply_stream_event(self, event):
+        orders_data = self._orders_data_from_event(event)
+        if not orders_data:
+            return
+
+        counter = self._sync_order_status(orders_data=orders_data)
+        self.notify_execution_report()
+        if counter.total <= 0:
+            return
+
+        self._check_traded_counter(counter)
+        price_info = self.price_info or await self._call(self.exchange.get_latest_prices)
+        new_price = await self._adjust_orders(price_info=price_info)
+        if not new_price:
+            return
+
+        self._on_orders_adjusted(counter, new_price=new_price)
+
+    async def _sync_and_adjust(self):
+        latency = self.latency
+        price_info, price_task = None, None
+        if self.selective_polling:
+            # The ticker decides which orders to poll, fetch it first
+            with latency.time('get_latest_prices'):
+                price_info = await self._call(self.exchange.get_latest_prices)
+            self.price_info = price_info
+        else:
+            # The latest prices are only needed when orders are traded,
+            #  fetch them speculatively while the orders are being retrieved
+            price_task = asyncio.ensure_future(self._call(latency.timed('get_latest_prices', self.exchange.get_latest_prices)))
+            # Also retrieves the exception (if any) of an unused fetch, to keep the loop quiet about it
+            price_task.add_done_callback(self._keep_price_info)
+
+        orders_data = None
+        if self.detect_fills_by_trades:
+            with latency.time('retrieve_fills'):
+                orders_data = await self._retrieve_fills_data()
+        if orders_data is None:
+            # Poll the order status, also the fallback of the fill detection from trades
+            order_ids = self._select_order_ids(price_info)
+            with latency.time('retrieve_orders'):
+                orders_data = await self._retrieve_orders_data(order_ids)
+            if self.detect_fills_by_trades:
+                # The trades of the polled orders covered by this sweep are not counted again
+                with latency.time('restart_trade_cursor'):
+                    await self._restart_trade_cursor(orders_data, swept_all=self._swept_all(orders_data))
+
+        with latency.time('sync_order_status'):
+            counter = self._sync_order_status(orders_data=orders_data)
+
+        with latency.time('notify_report'):
+            self.notify_execution_report()
+
+        if counter.total <= 0:
+            # No orders traded, but the price may have drifted away from the grid:
+            #  judged on the ticker of this sync, the speculative fetch is waited for only when re-centering is on
+            if self.recenter_drift and price_task:
+                try:
+                    with latency.time('wait_prices'):
+                        price_info = await price_task
+                except Exception as e:
+                    logger.warning(f"Failed to get the latest prices, the drift is judged on the previous ones: {e}")
+            price_info = price_info or self.price_info
+            if self._drift_cells(price_info['price'] if price_info else None):
+                await self._adjust_orders(price_info=price_info)
+            return
+
+        self._check_traded_counter(counter)
+
+        if price_task:
+            with latency.time('wait_prices'):
+                price_info = await price_task
+        new_price = await self._adjust_orders(price_info=price_info)
+        if not new_price:
+            return
+
+        self._on_orders_adjusted(counter, new_price=new_price)
+
+    async def _retrieve_orders_data(self, order_ids=None):
+        orders_data = []
+        if order_ids is None:
+            order_ids = self.om.active_order_ids
+        if len(order_ids) <= 0:
+            # Nothing in reach of the price
+            return orders_data
+        try:
+            orders_data = await self._call(self.exchange.get_orders_data, order_ids=order_ids)
+        except self.exchange.KnownExceptions as e:
+            logger.error(f"Known error during retrieving orders: {e}")
+        except Exception as e:
+            self.notify_error(f"Error during retrieving orders from {self.exchange.name}: {e}")
+        return orders_data
+
+    async def _retrieve_fills_data(self):
+        if self._full_sweep_due() or self._trade_cursor is None:
+            return None
+        try:
+            trades = await self._call(self.exchange.get_new_trades, since=self._trade_cursor_start())
+        except self.exchange.KnownExceptions as e:
+            logger.error(f"Known error during retrieving trades: {e}")
+            return None
+        except Exception as e:
+            self.notify_error(f"Error during retrieving trades from {self.exchange.name}: {e}")
+            return None
+        return self._orders_data_from_trades(trades)
+
+    async def _restart_trade_cursor(self, orders_data, swept_all=False):
+        if not self.detect_fills_by_trades or (not orders_data and not swept_all):
+            return
+        try:
+            latest_trade = await self._call(self.exchange.get_latest_trade)
+        except self.exchange.KnownExceptions as e:
+            logger.error(f"Known error during retrieving the latest trade: {e}")
+            return
+        except Exception as e:
+            self.notify_error(f"Error during retrieving the latest trade from {self.exchange.name}: {e}")
+            return
+        self._apply_latest_trade(orders_data, swept_all, latest_trade)
+
+    async def _adjust_orders(self, price_info):
+        latency = self.latency
+        with latency.time('prepare_orders'):
+            new_price = self._prepare_orders(price_info=price_info)
+        if not new_price:
+            return False
+
+        with latency.time('commit_traded'):
+            self._commit_orders_traded()
+        with latency.time('commit_cancel'):
+            await self._commit_cancel_orders()
+        with latency.time('commit_create'):
+            await self._commit_create_orders()
+        # The db and notifier calls only schedule the background calls here
+        with latency.time('db_update'):
+            self.update_bot_info_to_db(fields=['traded_count', 'latest_price'])
+        with latency.time('snapshot'):
+            self.save_snapshot()
+        return new_price
+
+    async def _commit_cancel_orders(self):
+        orders_to_cancel = self.om.pending_changes(OrderStatus.ToCancel)
+        if len(orders_to_cancel) <= 0:
+            return
+        # Create a map of order_id => order
+        orders_map = {o.order_id: o for o in orders_to_cancel}
+        try:
+            orders_data = await self._call(self.exchange.cancel_orders, list(orders_map.keys()))
+            self._on_orders_cancelled(orders_map, orders_data=orders_data)
+        except Exception as e:
+            self.notify_error(f"Cancel orders failed in {self.exchange} for orders: {orders_map.keys()}")
+
+    async def _commit_create_orders(self):
+        orders = self._orders_to_create()
+        if len(orders) <= 0:
+            return
+        # Waiters acquire the semaphore in the creation order of the tasks, i.e. nearest to the price first
+        semaphore = asyncio.Semaphore(self.create_concurrency)
+        sent = set()
+
+        async def create(order):
+            async with semaphore:
+                sent.add(order)
+                await self._call(self.exchange.create_order, order)
+
+        tasks = [asyncio.ensure_future(create(o)) for o in orders]
+        cancelled = None
+        try:
+            await asyncio.shield(asyncio.gather(*tasks, return_exceptions=True))
+        except asyncio.CancelledError as e:
+            # The bot is cancelled (e.g., SIGINT): the creations sent to the exchange go on in the executor,
+            #  wait for their order ids so that they are cancelled on stop. The ones not sent yet are dropped
+            cancelled = e
+            for o, task in zip(orders, tasks):
+                if o not in sent:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # A cancelled creation is not confirmed either (CancelledError is not an Exception)
+        errors = [task.exception() if not task.cancelled() else asyncio.CancelledError() for task in tasks]
+        cancelled = cancelled or next((e for e in errors if isinstance(e, asyncio.CancelledError)), None)
+        try:
+            self._on_orders_created(orders, errors=errors)
+        finally:
+            if cancelled is not None:
+                # Go on with the cancellation once the other results are applied,
+                #  the cancelled orders stay to be created
+                raise cancelled
+
+    #################
+    # Notification / Message related
+    def notify_error(self, message):
+        # The traceback of the exception being handled is only available in this thread
+        notifier = self.notifier
+        target = notifier.target if isinstance(notifier, BackgroundCalls) else notifier
+        get_traceback_message = getattr(target, 'get_traceback_message', None)
+        if get_traceback_message:
+            message = str(message) + get_traceback_message()
+        super().notify_error(message)
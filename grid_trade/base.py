@@ -1,13 +1,19 @@
 import sys
 sys.path.append('.')
 
+import os
 import time
+import json
 import logging
 import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable
 from enum import Enum
 from grid_trade.mixins import FieldFormatMixin
-from grid_trade.orders import Order, OrderManager, OrderSide, OrderCounter
+from grid_trade.orders import Order, OrderManager, OrderSide, OrderStatus, OrderCounter
+from grid_trade.orderbook import OrderBook
+from grid_trade.latency import LatencyRecorder
 from exchanges import Exchange
 from exchanges.bitbank import ExceedOrderLimitError, InvalidPriceError
 from utils import format_float, format_rate, init_formatted_properties, ensure_in_miliseconds
@@ -29,6 +35,11 @@ class GridBot:
     enum_values = {
         'status': BotStatus,
     }
+    # Storage backends of the orders, selected by `order_storage` in additional_info
+    order_storages = {
+        'object': OrderManager,
+        'array': OrderBook,
+    }
 
     class Parameter(FieldFormatMixin):
         # A new property of `NAME_s` will be added for each of the `NAME` variables
@@ -47,7 +58,9 @@ class GridBot:
         }
 
         def __init__(self, unit_amount, price_interval, init_base, init_quote, init_price,
-                    grid_num, pair=None, fee=0, unused_base = 0, unused_quote = 0) -> None:
+                    grid_num, pair=None, fee=0, unused_base = 0, unused_quote = 0,
+                    price_precision=None, amount_precision=None) -> None:
+            """ `price_precision` / `amount_precision` of the pair, the class-level precision is used if None """
             self.unit_amount = unit_amount
             self.price_interval = price_interval
             self.init_base = init_base
@@ -58,7 +71,26 @@ class GridBot:
             self.fee = fee
             self.unused_base = unused_base
             self.unused_quote = unused_quote
-            self.round_obj(self)  # Round up the fields defined in fields_to_format
+            self.price_precision = price_precision
+            self.amount_precision = amount_precision
+            # Round up the fields defined in fields_to_format
+            for key in self.fields_to_format.keys():
+                try:
+                    setattr(self, key, round(getattr(self, key), self.get_field_precision(key)))
+                except AttributeError:
+                    pass
+
+        def get_field_precision(self, key, default=None):
+            """ Precision of `key` of this pair if set, otherwise `default` or the class-level one """
+            _type = self.fields_to_format.get(key, {}).get('_type', '')
+            precision = None
+            if _type == 'price':
+                precision = self.price_precision
+            elif _type == 'amount':
+                precision = self.amount_precision
+            if precision is None:
+                precision = default if default is not None else self.get_precision(key=key)
+            return precision
         
         @property
         def lowest_price(self):
@@ -84,7 +116,8 @@ class GridBot:
             return self.price_interval / second_highest_price - 2 * self.fee
 
         @classmethod
-        def calc_grid_params_by_support(cls, init_base, init_quote, init_price, support, grid_num=100, pair=None, fee=0):
+        def calc_grid_params_by_support(cls, init_base, init_quote, init_price, support, grid_num=100, pair=None, fee=0,
+                                        price_precision=None, amount_precision=None):
             """ Calculate the grid setup parameters by fixing the support line
 
                 init_base: initial amount of base currency (e.g., BTC): 0.01
@@ -98,10 +131,12 @@ class GridBot:
             price_interval = (init_price - support) / half_grid_num
 
             return cls.calc_grid_params_by_interval(init_base=init_base, init_quote=init_quote, init_price=init_price,
-                                            price_interval=price_interval, grid_num=grid_num, fee=fee)
+                                            price_interval=price_interval, grid_num=grid_num, fee=fee,
+                                            price_precision=price_precision, amount_precision=amount_precision)
 
         @classmethod
-        def calc_grid_params_by_interval(cls, init_base, init_quote, init_price, price_interval, grid_num=100, pair=None, fee=0):
+        def calc_grid_params_by_interval(cls, init_base, init_quote, init_price, price_interval, grid_num=100, pair=None, fee=0,
+                                        price_precision=None, amount_precision=None):
             """ Calculate the grid setup parameters by fixing the price_interval
 
                 init_base: initial amount of base currency (e.g., BTC): 0.01
@@ -110,6 +145,7 @@ class GridBot:
                 price_interval: interval price between two grid lines (the height of the cell in quote)
                 grid_num: the number of grids in total (it will be divided into two equal parts)
                 fee: the fee rate for makers
+                price_precision, amount_precision: digits of the pair, the class-level precision is used if None
             """
             unused_base = 0
             unused_quote = 0
@@ -129,9 +165,20 @@ class GridBot:
 
             param = cls(unit_amount=unit_amount, price_interval=price_interval, init_price=init_price,
                         init_base=init_base, init_quote=init_quote, grid_num=grid_num, pair=pair, fee=fee,
-                        unused_base=unused_base, unused_quote=unused_quote)
+                        unused_base=unused_base, unused_quote=unused_quote,
+                        price_precision=price_precision, amount_precision=amount_precision)
             return param
 
+        def align_with(self, other):
+            """ Move `init_price` to the nearest grid line of `other` (with the same price interval),
+                    so that the orders left by a bot of `other` sit on the grid lines of this one
+            """
+            if other is None or other.price_interval != self.price_interval:
+                return self
+            ticks = round((self.init_price - other.init_price) / self.price_interval)
+            self.init_price = round(other.init_price + ticks * self.price_interval, self.get_field_precision('init_price'))
+            return self
+
         #############################
         # Serialiazation
         def get_dict_to_serialize(self):
@@ -268,37 +315,140 @@ class GridBot:
         self.started_at = started_at
         self.stopped_at = stopped_at
         self.latest_price = None
+        # The latest ticker seen, fetched by every sync
+        self.price_info = None
         self.traded_count = OrderCounter()
         self.execution_report = GridBot.ExecutionReport(param)   
         self._last_report_time = 0     
         self._last_check_order_count = -1
+        # Thread pool for the exchange calls made in parallel, created on demand
+        self._thread_pool = None
+        # Selective polling: price range (low, high) of the last ticker, time of the last full sweep
+        self._last_price_range = None
+        self._last_full_sweep_time = 0
+        # Fill detection from trades: cursor (executed_at, trade_id) of the last trade seen (None until read from the exchange),
+        #  order_id => [executed amount, executed cost] of the orders filled so far,
+        #  order_id => trade_id up to which the trades of the order are in the executed amount read by a status poll
+        self._trade_cursor = None
+        self._partial_fills = {}
+        self._trades_swept = {}
+        # Grid lines the grid has been shifted by in total, see `_recenter_on_drift`
+        self.recentered_cells = 0
+        # Durations of the phases of the syncs, see `get_latency_stats`
+        self.latency = LatencyRecorder()
+        # The syncs and the stream events (pushed from the thread of the stream) are applied one at a time
+        self._sync_lock = threading.RLock()
 
     #################
     # Core logic
     def init_and_start(self, param, additional_info={}):
         """ Init the order manager and start the bot """
+        if not self._init_order_manager(param=param, additional_info=additional_info):
+            return
+        # The trades of the orders created from here on are after the latest one
+        self._restart_trade_cursor([], swept_all=True)
+        self._commit_create_orders()
+        self.om.print_stacks()
+        self.save_snapshot()
+
+    def _init_order_manager(self, param, additional_info):
+        """ Init the order manager with the initial orders to create, False if already initiated """
         if self.om:
             self.notify_error("The grid trade bot is already initiated. Skip.")
-            return
+            return False
 
         self.started_at = time.time()
         self._last_report_time = self.started_at
         self.param = param
         self.execution_report = GridBot.ExecutionReport(param)
         self.additional_info = additional_info
+        self.latency = LatencyRecorder(window=self.latency_window)
         self.status = BotStatus.Running
         self.save_bot_info_to_db()
         self.notify_info("-" * 80 + "\n" +\
                         f"GridBot v{__version__} (`{self.uid}`) starting with param:\n```\n{self.param.full_markdown}\n```")
-        self.om = OrderManager(price_interval=param.price_interval,
+        om_class = self.order_storages[additional_info.get('order_storage', None) or 'object']
+        # The orders are formatted with the precision of this pair (the class-level one if None)
+        om_info = dict(additional_info, price_precision=param.price_precision, amount_precision=param.amount_precision)
+        self.om = om_class(price_interval=param.price_interval,
                                 unit_amount=param.unit_amount,
                                 grid_num=param.grid_num,
                                 order_limit=self.exchange.max_order_count,
-                                additional_info=additional_info,
+                                additional_info=om_info,
                             )
         self.om.init_stacks(init_price=param.init_price)
+        return True
+
+    def warm_start(self, param, additional_info={}, snapshot=None):
+        """ Start the bot adopting the orders left on the exchange by the bot of `snapshot` (see `stop_and_hand_over`).
+                The live orders sitting on the grid lines of the initial orders are taken over as they are,
+                only the rest of them are cancelled and only the missing initial orders are created
+        """
+        if not self._init_order_manager(param=param, additional_info=additional_info):
+            return
+        orders_data = self._retrieve_live_orders_data() if snapshot and snapshot['orders'] else []
+        order_ids_to_cancel = self._adopt_orders(orders_data, snapshot=snapshot)
+        # All the live orders are read, the trades so far are in their executed amounts
+        self._restart_trade_cursor(orders_data or [], swept_all=True)
+        if order_ids_to_cancel:
+            try:
+                self.exchange.cancel_orders(order_ids_to_cancel)
+            except Exception as e:
+                self.notify_error(f"Cancel orders failed for {self.exchange} for orders: {order_ids_to_cancel}. Please check manually!")
         self._commit_create_orders()
         self.om.print_stacks()
+        self.save_snapshot()
+
+    def _retrieve_live_orders_data(self):
+        try:
+            return self.exchange.get_active_orders_data()
+        except Exception as e:
+            self.notify_error(f"Error during retrieving active orders from {self.exchange.name}: {e}")
+            return None
+
+    def _adopt_orders(self, orders_data, snapshot):
+        """ Take over the live orders (of the bot of `snapshot`) on the grid lines of the orders to create.
+                Returns the ids of the orders of that bot left to cancel.
+                Orders not placed by that bot (e.g., manual ones) are left untouched
+        """
+        own_order_ids = {o['order_id'] for o in snapshot['orders']} if snapshot else set()
+        # The orders that bot was cancelling are cancelled, never adopted
+        order_ids_cancelling = {o['order_id'] for o in snapshot['orders']
+                                if o.get('status') == OrderStatus.ToCancel.value} if snapshot else set()
+        if orders_data is None:
+            # The live orders are unknown, cancel all the orders of the previous bot
+            return sorted(own_order_ids)
+
+        to_create = {(o.side, o.tick): o for o in self.om.orders_to_create}
+        order_ids_to_cancel = []
+        adopted = 0
+        for order_data in orders_data:
+            order_id = order_data['order_id']
+            if order_id not in own_order_ids:
+                continue
+            if order_id in order_ids_cancelling:
+                order_ids_to_cancel.append(order_id)
+                continue
+            price = float(order_data['price'])
+            tick = self.om.grid.tick_of(price)
+            order = to_create.pop((OrderSide(order_data['side']), tick), None)
+            if order is None or abs(order.price - price) > 1e-9 * self.param.price_interval:
+                order_ids_to_cancel.append(order_id)
+                continue
+            order.order_id = order_id
+            order.amount = float(order_data['start_amount'])
+            order.ordered_at = order_data.get('ordered_at')
+            self.om.order_create_ok(order)
+            adopted += 1
+        logger.info(f"Adopted {adopted} order(s), cancelling {len(order_ids_to_cancel)} order(s)")
+        return order_ids_to_cancel
+
+    def stop_and_hand_over(self):
+        """ Stop the bot leaving its orders on the exchange, for the next bot to adopt them (see `warm_start`) """
+        if not self.om:
+            logger.warning(f"Stopping a bot while it is not started yet. Skip.")
+            return
+        self._stop(hand_over=True)
 
     def cancel_and_stop(self):
         """ Cancel all orders and stop the bot. """
@@ -312,45 +462,291 @@ class GridBot:
             self.exchange.cancel_orders(order_ids)
         except Exception as e:
             self.notify_error(f"Cancel orders failed for {self.exchange}. Please check manually!")
-        self.om.cancel_all()
+        self._stop()
+
+    def _stop(self, hand_over=False):
+        """ Drop all the orders and mark the bot as stopped, after the orders are cancelled in the exchange.
+                With `hand_over`, the orders are left in the snapshot instead
+        """
+        if self._thread_pool:
+            self._thread_pool.shutdown(wait=True)
+            self._thread_pool = None
+        if not hand_over:
+            self.om.cancel_all()
+        self.save_snapshot()
         self.stopped_at = time.time()
         self.status = BotStatus.Stopped
         self.update_bot_info_to_db()
         self.notify_info(f"GridBot v{__version__} (`{self.uid}`) stopped with param:\n```\n{self.param.full_markdown}```")
         self.notify_execution_report(force=True)
 
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if not self._thread_pool:
+            self._thread_pool = ThreadPoolExecutor(max_workers=max(self.create_concurrency, 2),
+                                                thread_name_prefix=f"gridbot-{self.uid[:8]}")
+        return self._thread_pool
+
     def sync_and_adjust(self):
         """ Sync the orders status from exchange and adjust the stacks (refill new orders, balance stacks etc.) """
-
-        orders_data = self._retrieve_orders_data()
-
-        counter = self._sync_order_status(orders_data=orders_data)
-        
-        self.notify_execution_report()
+        with self._sync_lock, self.latency.time('sync'):
+            self._sync_and_adjust()
+
+    def _sync_and_adjust(self):
+        latency = self.latency
+        price_info, price_future = None, None
+        if self.selective_polling:
+            # The ticker decides which orders to poll, fetch it first
+            with latency.time('get_latest_prices'):
+                price_info = self.exchange.get_latest_prices()
+            self.price_info = price_info
+        else:
+            # The latest prices are only needed when orders are traded,
+            #  fetch them speculatively while the orders are being retrieved
+            price_future = self.thread_pool.submit(latency.timed('get_latest_prices', self.exchange.get_latest_prices))
+            price_future.add_done_callback(self._keep_price_info)
+
+        orders_data = None
+        if self.detect_fills_by_trades:
+            with latency.time('retrieve_fills'):
+                orders_data = self._retrieve_fills_data()
+        if orders_data is None:
+            # Poll the order status, also the fallback of the fill detection from trades
+            order_ids = self._select_order_ids(price_info)
+            with latency.time('retrieve_orders'):
+                orders_data = self._retrieve_orders_data(order_ids)
+            if self.detect_fills_by_trades:
+                # The trades of the polled orders covered by this sweep are not counted again
+                with latency.time('restart_trade_cursor'):
+                    self._restart_trade_cursor(orders_data, swept_all=self._swept_all(orders_data))
+
+        with latency.time('sync_order_status'):
+            counter = self._sync_order_status(orders_data=orders_data)
+
+        with latency.time('notify_report'):
+            self.notify_execution_report()
 
         if counter.total <= 0:
-            # No orders traded
+            # No orders traded, but the price may have drifted away from the grid:
+            #  judged on the ticker of this sync, the speculative fetch is waited for only when re-centering is on
+            if self.recenter_drift and price_future:
+                try:
+                    with latency.time('wait_prices'):
+                        price_info = price_future.result()
+                except Exception as e:
+                    logger.warning(f"Failed to get the latest prices, the drift is judged on the previous ones: {e}")
+            price_info = price_info or self.price_info
+            if self._drift_cells(price_info['price'] if price_info else None):
+                self._adjust_orders(price_info=price_info)
             return
 
-        if counter.total > 1:
-            # logger.warning(f"Care: more than 1 orders are traded during one sync: {counter.preview}")
-            if counter.both_sides:
-                self.notify_error(f"Oders on both sides are traded during one sync: {counter.preview}")
+        self._check_traded_counter(counter)
 
-        price_info = self.exchange.get_latest_prices()
+        if price_future:
+            with latency.time('wait_prices'):
+                price_info = price_future.result()
         new_price = self._adjust_orders(price_info=price_info)
         if not new_price:
             return
         
+        self._on_orders_adjusted(counter, new_price=new_price)
+
+    def on_stream_event(self, event):
+        """ Apply an event pushed by the stream (see `exchanges.stream.EventStream`) and refill the orders traded.
+                The polling by `sync_and_adjust` stays as the backstop for the events missed
+        """
+        with self._sync_lock, self.latency.time(f"event_{event['type']}"):
+            orders_data = self._orders_data_from_event(event)
+            if not orders_data:
+                return
+
+            counter = self._sync_order_status(orders_data=orders_data)
+            self.notify_execution_report()
+            if counter.total <= 0:
+                return
+
+            self._check_traded_counter(counter)
+            price_info = self.price_info or self.exchange.get_latest_prices()
+            new_price = self._adjust_orders(price_info=price_info)
+            if not new_price:
+                return
+
+            self._on_orders_adjusted(counter, new_price=new_price)
+
+    def _orders_data_from_event(self, event):
+        """ Orders data of the orders of this bot updated by `event`, the ticker is kept as the latest one """
+        if self.status != BotStatus.Running or not self.om:
+            return []
+        if event['type'] == 'ticker':
+            self.price_info = event['data']
+            return []
+        if event['type'] == 'order':
+            order_data = event['data']
+            # Orders of the other bots, or already synced
+            return [order_data] if self.om.get_order_by_id(order_data['order_id']) else []
+        if event['type'] == 'trade':
+            if self._trade_cursor is None:
+                if self.detect_fills_by_trades:
+                    # Not known yet where the trades counted so far end, left to the status polling
+                    return []
+                # The trades are only pushed, not read from the history: any trade seen here is new
+                self._trade_cursor = (None, 0)
+            self._trade_cursor_start()
+            return self._orders_data_from_trades([event['data']])
+        return []
+
+    def _keep_price_info(self, future):
+        """ Keep the ticker fetched by `future` as the latest one, failures are left to whoever waits for it """
+        if not future.cancelled() and future.exception() is None:
+            self.price_info = future.result()
+
+    def _check_traded_counter(self, counter: OrderCounter):
+        if counter.total > 1:
+            # logger.warning(f"Care: more than 1 orders are traded during one sync: {counter.preview}")
+            if counter.both_sides:
+                self.notify_error(f"Oders on both sides are traded during one sync: {counter.preview}")
+
+    def _on_orders_adjusted(self, counter: OrderCounter, new_price):
         logger.info(f"Order(s) traded: {counter.preview} "
                     f"Current price [{new_price}]"
                     )
         self.om.print_stacks()
         self._check_orders_decreased()
 
-    def _retrieve_orders_data(self):
+    def _select_order_ids(self, price_info=None):
+        """ Ids of the orders to poll: all the active orders, or in selective mode (`price_info` provided)
+                only the orders in reach of the prices seen by the last and the current ticker.
+                All the active orders are polled once per `full_sweep_interval_sec` in case the price moved further in between
+        """
+        now = time.time()
+        if price_info is None:
+            self._last_full_sweep_time = now
+            return self.om.active_order_ids
+
+        prices = [price_info['price'], price_info['best_bid'], price_info['best_ask']]
+        low, high = min(prices), max(prices)
+        last_range = self._last_price_range
+        self._last_price_range = (low, high)
+
+        if last_range is None or self._full_sweep_due(now):
+            self._last_full_sweep_time = now
+            return self.om.active_order_ids
+        return self.om.order_ids_in_reach(low=min(low, last_range[0]), high=max(high, last_range[1]))
+
+    def _full_sweep_due(self, now=None):
+        now = now or time.time()
+        return now - self._last_full_sweep_time >= self.full_sweep_interval_sec
+
+    def _retrieve_fills_data(self):
+        """ Orders data of the orders filled since the last sync, built from the new trades in the trade history.
+                None if the order status should be polled instead: on the full sweep (orders may be cancelled
+                by the exchange as well) or when the trade history is not available
+        """
+        if self._full_sweep_due() or self._trade_cursor is None:
+            return None
+        try:
+            trades = self.exchange.get_new_trades(since=self._trade_cursor_start())
+        except self.exchange.KnownExceptions as e:
+            logger.error(f"Known error during retrieving trades: {e}")
+            return None
+        except Exception as e:
+            self.notify_error(f"Error during retrieving trades from {self.exchange.name}: {e}")
+            return None
+        return self._orders_data_from_trades(trades)
+
+    def _swept_all(self, orders_data):
+        """ Whether `orders_data` covers all the active orders """
+        return {od['order_id'] for od in orders_data} >= set(self.om.active_order_ids)
+
+    def _restart_trade_cursor(self, orders_data, swept_all=False):
+        """ Mark the trades of the orders of `orders_data` (just polled) as counted, up to the latest trade of the exchange:
+                the fills so far are in their executed amounts. The cursor itself only moves when `swept_all`,
+                the trades of the orders not polled are still to be read.
+                Read after the orders, a trade in between is skipped rather than counted twice (the next sweep sees it)
+        """
+        if not self.detect_fills_by_trades or (not orders_data and not swept_all):
+            return
+        try:
+            latest_trade = self.exchange.get_latest_trade()
+        except self.exchange.KnownExceptions as e:
+            logger.error(f"Known error during retrieving the latest trade: {e}")
+            return
+        except Exception as e:
+            self.notify_error(f"Error during retrieving the latest trade from {self.exchange.name}: {e}")
+            return
+        self._apply_latest_trade(orders_data, swept_all, latest_trade)
+
+    def _apply_latest_trade(self, orders_data, swept_all, latest_trade):
+        """ See `_restart_trade_cursor` """
+        executed_at, trade_id = (int(latest_trade['executed_at']), int(latest_trade['trade_id'])) if latest_trade else (None, 0)
+        if swept_all and (self._trade_cursor is None or trade_id > self._trade_cursor[1]):
+            self._trade_cursor = (executed_at, trade_id)
+        for order_data in orders_data:
+            order_id = order_data['order_id']
+            executed_amount = float(order_data.get('executed_amount') or 0)
+            if self.om.get_order_by_id(order_id) is None:
+                continue
+            self._trades_swept[order_id] = trade_id
+            if executed_amount > 0:
+                self._partial_fills[order_id] = [executed_amount, executed_amount * float(order_data['average_price'])]
+            else:
+                self._partial_fills.pop(order_id, None)
+
+    def _trade_cursor_start(self):
+        """ Time (in miliseconds) of the exchange to retrieve the trades from """
+        _, last_trade_id = self._trade_cursor
+        # Orders may be gone (e.g., synced by the status polling) with their trades partially seen
+        for order_id in [oid for oid in self._partial_fills if self.om.get_order_by_id(oid) is None]:
+            del self._partial_fills[order_id]
+        for order_id in [oid for oid, swept in self._trades_swept.items()
+                        if swept <= last_trade_id or self.om.get_order_by_id(oid) is None]:
+            del self._trades_swept[order_id]
+        return self._trade_cursor[0]
+
+    def _orders_data_from_trades(self, trades):
+        """ Move the trade cursor over `trades` and build the orders data of the orders filled by them """
+        executed_at, last_trade_id = self._trade_cursor
+        fills = self._partial_fills
+        filled_orders = {}
+        for trade in trades:
+            trade_id = int(trade['trade_id'])
+            if trade_id <= last_trade_id:
+                # Seen in the last sync, trades executed at the cursor time are retrieved again
+                continue
+            executed_at, last_trade_id = int(trade['executed_at']), trade_id
+            order = self.om.get_order_by_id(trade['order_id'])
+            if order is None or trade_id <= self._trades_swept.get(order.order_id, 0):
+                # Not an order of this bot, already synced by the status polling,
+                #  or in the executed amount read by it
+                continue
+            amount = float(trade['amount'])
+            fill = fills.setdefault(order.order_id, [0, 0])
+            fill[0] += amount
+            fill[1] += amount * float(trade['price'])
+            order.executed_at = executed_at
+            filled_orders[order.order_id] = order
+        self._trade_cursor = (executed_at, last_trade_id)
+
         orders_data = []
-        order_ids = self.om.active_order_ids
+        for order_id, order in filled_orders.items():
+            executed_amount, cost = fills[order_id]
+            order_data = self.exchange.order_data_from_fills(order_id=order_id, start_amount=order.amount,
+                                                            executed_amount=executed_amount,
+                                                            average_price=cost / executed_amount)
+            if self.exchange.is_order_fullyfilled(order_data=order_data):
+                del fills[order_id]
+            else:
+                logger.info(f"Order partially filled: {order.short} Executed: {format_float(executed_amount)}")
+            orders_data.append(order_data)
+        return orders_data
+
+    def _retrieve_orders_data(self, order_ids=None):
+        orders_data = []
+        if order_ids is None:
+            order_ids = self.om.active_order_ids
+        if len(order_ids) <= 0:
+            # Nothing in reach of the price
+            return orders_data
         try:
             orders_data = self.exchange.get_orders_data(order_ids=order_ids)
         except self.exchange.KnownExceptions as e:
@@ -360,58 +756,61 @@ class GridBot:
         return orders_data
 
     def _sync_order_status(self, orders_data):
-        total_traded_this_sync = len(list(filter(self.exchange.is_order_fullyfilled, orders_data)))
-        counter = OrderCounter()
-        for order_data in orders_data:
-            if self.exchange.is_order_fullyfilled(order_data=order_data):
-                oid = order_data['order_id']
-                # CARE: The following line needs to be executed before 
-                #  `self.om.order_traded(order_id=oid)`
-                #  since the order will be removed from the stack by then
-                order = self.om.get_order_by_id(order_id=oid)
-
-                # Update the average_price of the order
-                order.average_price = order_data['average_price']
-
-                # Mark the order that is traded in this sync
-                self.om.mark_order_on_traded(order_id=oid)
-
-                if order:
-                    counter.increase(order.side)
-                    self.traded_count.increase(order.side) # This need to be updated imediately right before the notification
-                    batch_info = f" [{counter.total}/{total_traded_this_sync}]" if total_traded_this_sync > 1 else ""
-                    self.notify_order_traded(order, more=batch_info)
-                    # irregular_msg = self._check_irregular_price(order=order, price_info=price_info)
-                    # if irregular_msg:
-                        # self.notify_error(message=irregular_msg)
-                else:
-                    self.notify_error(f"Traded order not found during sync. Order id: `{oid}`")
-            elif self.exchange.is_order_cancelled(order_data=order_data):
-                oid = order_data['order_id']
-                order = self.om.get_order_by_id(order_id=oid)
-                if order:
-                    ts = time.time()
-                    now = ensure_in_miliseconds(ts)
-                    elapsed = (now - order.ordered_at) / 1000
-                    if elapsed < 2:
-                        msg = f"Order possibly failed during creation: "
-                    else:
-                        msg = f"Order possibly cancelled by the user: "
-                    msg +=  f"{order.short}. Elapsed: {elapsed} s."
-                    self.notify_error(msg)
-                    
-                    # Force cancel the order
-                    self.om.order_force_cancelled(order_id=oid)
-
-        return counter
+        result = self.om.apply_sync_results(orders_data, exchange=self.exchange)
+        total_traded_this_sync = result.total_traded
+        for i, order in enumerate(result.traded_orders, start=1):
+            self.traded_count.increase(order.side) # This need to be updated imediately right before the notification
+            batch_info = f" [{i}/{total_traded_this_sync}]" if total_traded_this_sync > 1 else ""
+            self.notify_order_traded(order, more=batch_info)
+            # irregular_msg = self._check_irregular_price(order=order, price_info=price_info)
+            # if irregular_msg:
+                # self.notify_error(message=irregular_msg)
+
+        for oid in result.missing_order_ids:
+            self.notify_error(f"Traded order not found during sync. Order id: `{oid}`")
+
+        for order in result.cancelled_orders:
+            ts = time.time()
+            now = ensure_in_miliseconds(ts)
+            elapsed = (now - order.ordered_at) / 1000
+            if elapsed < 2:
+                msg = f"Order possibly failed during creation: "
+            else:
+                msg = f"Order possibly cancelled by the user: "
+            msg +=  f"{order.short}. Elapsed: {elapsed} s."
+            self.notify_error(msg)
+
+        return result.counter
 
     def  _adjust_orders(self, price_info):
+        latency = self.latency
+        with latency.time('prepare_orders'):
+            new_price = self._prepare_orders(price_info=price_info)
+        if not new_price:
+            return False
+
+        with latency.time('commit_traded'):
+            self._commit_orders_traded()
+        with latency.time('commit_cancel'):
+            self._commit_cancel_orders()
+        with latency.time('commit_create'):
+            self._commit_create_orders()
+        with latency.time('db_update'):
+            self.update_bot_info_to_db(fields=['traded_count', 'latest_price'])
+        with latency.time('snapshot'):
+            self.save_snapshot()
+        return new_price
+
+    def _prepare_orders(self, price_info):
+        """ Prepare the orders to create / cancel based on the latest price, False if the price is out of range """
         # mid_price = self.exchange.get_mid_price()
         new_price = price_info['price']
         self.latest_price = new_price
-        if new_price > self.param.highest_price or new_price < self.param.lowest_price:
+        self._recenter_on_drift(new_price)
+        lowest_price, highest_price = self.price_range
+        if new_price > highest_price or new_price < lowest_price:
             logger.warning(f"Current price (`{new_price}`) exceeds price range: " + \
-                        f"[{self.param.lowest_price_s} ~ {self.param.highest_price_s}]")
+                        f"[{self.om.grid.lowest_price} ~ {self.om.grid.highest_price}]")
             # self.notify_error(f"Current price (`{new_price}`) exceeds price range: " + \
                             #   f"[{self.param.lowest_price_s} ~ {self.param.highest_price_s}]")
             return False
@@ -421,14 +820,39 @@ class GridBot:
         self.om.refill_orders_at_opposite_position()
 
         # Balance the stacks if necessary
-        self.om.balance_stacks()
-
-        self._commit_orders_traded()
-        self._commit_cancel_orders()
-        self._commit_create_orders()
-        self.update_bot_info_to_db(fields=['traded_count', 'latest_price'])
+        self.om.balance_stacks(price=new_price)
         return new_price
     
+    @property
+    def price_range(self):
+        """ (lowest, highest) price of the grid, moved along by the re-centering """
+        shift = self.om.grid.center_tick * self.param.price_interval
+        return self.param.lowest_price + shift, self.param.highest_price + shift
+
+    def _drift_cells(self, price):
+        """ Grid lines to shift the grid by to center it around `price`,
+                0 unless the price drifted away from the center by `recenter_drift` of the half grid
+        """
+        drift = self.recenter_drift
+        if not drift or price is None:
+            return 0
+        grid = self.om.grid
+        distance = (price - grid.center_price) / grid.price_interval
+        if abs(distance) < drift * grid.half_grid_num:
+            return 0
+        return int(round(distance))
+
+    def _recenter_on_drift(self, price):
+        """ Re-center the grid around `price` if it drifted too far, the traded orders and counts are kept as they are """
+        cells = self._drift_cells(price)
+        if cells == 0:
+            return False
+        self.om.recenter(cells, price=price)
+        self.recentered_cells += cells
+        self.notify_info(f"Grid re-centered by {cells} grid line(s) around {price}: "
+                        f"[{self.om.grid.lowest_price} ~ {self.om.grid.highest_price}]")
+        return True
+
     def _check_irregular_price(self, order: Order, price_info):
         """ Check whether the prcice jumpped back """
         new_price = price_info['price']
@@ -473,6 +897,46 @@ class GridBot:
             self.notify_error(f"The number of orders decreased to {current_count}. Current stack: {self.om.stack_brief_info}")
             self._last_check_order_count = current_count
 
+    #################
+    # Local snapshot
+    @property
+    def snapshot_path(self):
+        try:
+            return self.additional_info.get('snapshot_path', None)
+        except Exception:
+            return None
+
+    def snapshot(self):
+        """ State of the bot with its orders on the exchange (active or still to cancel), to restart from """
+        data = self.to_dict()
+        orders = [*self.om.active_orders, *self.om.pending_changes(OrderStatus.ToCancel)] if self.om else []
+        data['orders'] = [o.to_dict() for o in orders if o.order_id is not None]
+        return data
+
+    def save_snapshot(self):
+        path = self.snapshot_path
+        if not path:
+            return
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Failed to save the snapshot to {path}: {e}")
+
+    @classmethod
+    def load_snapshot(cls, path):
+        """ Snapshot saved by `save_snapshot`, None if there is none """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load the snapshot from {path}: {e}")
+            return None
+
     #################
     # DB related
     # TODO: add method to recover from db
@@ -518,8 +982,61 @@ class GridBot:
             self._last_report_time = now
             duration_hour = (now - self.started_at) / (60 * 60)
             report = self.execution_report.from_order_counter(self.traded_count, duration_hour=duration_hour)
+            latency_report = self.latency.to_markdown()
+            if latency_report:
+                report += "\n\n" + latency_report
             self.notify_info(f"Execution Report:\n```{report}```")
 
+    @property
+    def create_concurrency(self):
+        """ Max number of orders being created in the exchange at the same time """
+        try:
+            return max(int(self.additional_info.get('create_concurrency', 1)), 1)
+        except Exception:
+            return 1
+
+    @property
+    def selective_polling(self):
+        """ Poll only the orders in reach of the ticker prices (`order_polling: selective`) instead of all of them """
+        try:
+            return self.additional_info.get('order_polling', 'full') == 'selective'
+        except Exception:
+            return False
+
+    @property
+    def detect_fills_by_trades(self):
+        """ Detect the fills from the new trades in the trade history (`fill_detection: trades`) instead of the order status """
+        try:
+            return self.additional_info.get('fill_detection', 'status') == 'trades'
+        except Exception:
+            return False
+
+    @property
+    def recenter_drift(self):
+        """ Re-center the grid once the price drifted this ratio of the half grid away from its center, never if None """
+        try:
+            return self.additional_info.get('recenter_drift', None)
+        except Exception:
+            return None
+
+    @property
+    def latency_window(self):
+        """ Number of the latest durations of each sync phase kept for the percentiles """
+        default_window = 1024
+        try:
+            return self.additional_info.get('latency_window', default_window) or default_window
+        except Exception:
+            return default_window
+
+    @property
+    def full_sweep_interval_sec(self):
+        """ Interval of polling the status of all the active orders, in selective mode or with the fills from trades """
+        default_interval = 60
+        try:
+            return self.additional_info.get('full_sweep_interval_sec', default_interval)
+        except Exception:
+            return default_interval
+
     @property
     def report_interval_sec(self):
         default_interval = 99999999
@@ -546,34 +1063,73 @@ class GridBot:
     #################
     # Private methods
     def _commit_cancel_orders(self):
-        if len(self.om.orders_to_cancel) <= 0:
+        orders_to_cancel = self.om.pending_changes(OrderStatus.ToCancel)
+        if len(orders_to_cancel) <= 0:
             # print('Nothing to cancel')
             return
         # Create a map of order_id => order
-        orders_map = {o.order_id: o for o in self.om.orders_to_cancel}
+        orders_map = {o.order_id: o for o in orders_to_cancel}
         try:
             orders_data = self.exchange.cancel_orders(list(orders_map.keys()))
-            for od in orders_data:
-                oid = od['order_id']
-                order = orders_map.get(oid, None)
-                if order:
-                    if self.exchange.is_order_cancelled(order_data=od):
-                        self.om.order_cancel_ok(order=order)
-                    else:
-                        self.notify_error(f"Requested to cancel the order but it is still active in the exchange: {od}")
-                else:
-                    self.notify_error(f"The exchange {self.exchange} returned an irrelevant order data during cancellation: {od}")
+            self._on_orders_cancelled(orders_map, orders_data=orders_data)
         except Exception as e:
             self.notify_error(f"Cancel orders failed in {self.exchange} for orders: {orders_map.keys()}")
 
+    def _on_orders_cancelled(self, orders_map, orders_data):
+        """ Apply the result of cancellation, orders_map: order_id => order requested to cancel """
+        for od in orders_data:
+            oid = od['order_id']
+            order = orders_map.get(oid, None)
+            if order:
+                if self.exchange.is_order_cancelled(order_data=od):
+                    self.om.order_cancel_ok(order=order)
+                else:
+                    self.notify_error(f"Requested to cancel the order but it is still active in the exchange: {od}")
+            else:
+                self.notify_error(f"The exchange {self.exchange} returned an irrelevant order data during cancellation: {od}")
+
     def _commit_create_orders(self):
-        for o in self.om.orders_to_create:
-            try:
-                self.exchange.create_order(o)
+        orders = self._orders_to_create()
+        if len(orders) <= 0:
+            return
+        concurrency = min(self.create_concurrency, len(orders))
+        if concurrency <= 1:
+            errors = [self._try_create_order(o) for o in orders]
+        else:
+            # The pool picks the orders up in the submission order, i.e. nearest to the price first
+            errors = list(self.thread_pool.map(self._try_create_order, orders))
+        self._on_orders_created(orders, errors=errors)
+
+    def _try_create_order(self, order):
+        """ Create `order` in the exchange, return the exception raised (None on success) """
+        try:
+            self.exchange.create_order(order)
+        except Exception as e:
+            return e
+        return None
+
+    def _orders_to_create(self):
+        """ Orders waiting to be created, nearest to the current price first """
+        orders = self.om.pending_changes(OrderStatus.ToCreate)
+        price = self.latest_price if self.latest_price else self.param.init_price
+        return sorted(orders, key=lambda o: abs(o.price - price))
+
+    def _on_orders_created(self, orders, errors):
+        """ Apply the result of creation, `errors[i]` is the exception raised when creating `orders[i]` (None on success)
+                Unexpected exceptions are raised after all the results are applied,
+                the orders failed with them stay to be created in the next commit
+        """
+        unexpected_error = None
+        for o, e in zip(orders, errors):
+            if e is None:
                 self.om.order_create_ok(order=o)
-            except (InvalidPriceError, ExceedOrderLimitError):
+            elif isinstance(e, (InvalidPriceError, ExceedOrderLimitError)):
                 self.om.order_force_cancelled(order=o)
                 self.notify_error(f"Create order failed in {self.exchange} for order: {o}")
+            elif unexpected_error is None:
+                unexpected_error = e
+        if unexpected_error:
+            raise unexpected_error
 
     def _commit_orders_traded(self):
         self.om.orders_traded()
@@ -599,6 +1155,25 @@ class GridBot:
             res = dest
         return res
 
+    def get_stats(self):
+        """ Brief state of the bot, e.g., for the supervisor of many bots """
+        stats = self.to_dict(fields=['uid', 'status', 'started_at', 'latest_price'])
+        stats['pair'] = self.param.pair if self.param else None
+        stats['traded_count'] = dict(self.traded_count)
+        stats['active_orders'] = len(self.om.active_order_ids) if self.om else 0
+        stats['recentered_cells'] = self.recentered_cells
+        stats['latency'] = self.get_latency_stats()
+        # Of the pool shared with the other bots of the process, see `HttpPool.stats`
+        stats['http'] = self.exchange.http_stats() if self.exchange else {}
+        return stats
+
+    def get_latency_stats(self, phases=None):
+        """ Percentiles of the durations (ms) of the sync phases: phase => {'count', 'p50', 'p95', 'p99', 'max'} """
+        summary = self.latency.summary()
+        if phases:
+            return {phase: summary[phase] for phase in phases if phase in summary}
+        return dict(summary)
+
     @classmethod
     def from_dict(cls, source):
         raise NotImplementedError('Not tested yet.')
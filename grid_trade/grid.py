@@ -0,0 +1,115 @@
+import sys
+sys.path.append('.')
+
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PriceGrid:
+    """ The grid lines of a bot laid out once: tick <=> price
+            Tick 0 is `init_price`, ticks run from -grid_num//2 (lowest_price) to grid_num//2 (highest_price).
+            The table (`prices`) covers the initial range, ticks out of it are still valid: their prices are
+            calculated instead of looked up.
+            `shift` only moves the range by whole grid lines, the tick of each price and the table stay the same
+    """
+
+    def __init__(self, init_price, price_interval, grid_num, price_precision) -> None:
+        self.init_price = init_price
+        self.price_interval = price_interval
+        self.price_precision = price_precision
+        self.half_grid_num = grid_num // 2
+        self.lowest_tick = -self.half_grid_num
+        self.highest_tick = self.half_grid_num
+        self._lay_out()
+
+    def _lay_out(self):
+        self._table_lowest_tick = self.lowest_tick
+        prices = [self._calc_price(tick) for tick in range(self.lowest_tick, self.highest_tick + 1)]
+        self._price_list = prices
+        self.prices = np.array(prices, dtype=np.float64)
+        self.prices.flags.writeable = False
+        self._ticks = {price: tick for tick, price in enumerate(prices, start=self.lowest_tick)}
+
+    def shift(self, cells):
+        """ Move the range of the grid by `cells` grid lines, upwards if positive """
+        self.lowest_tick += cells
+        self.highest_tick += cells
+
+    @property
+    def center_tick(self):
+        return self.lowest_tick + self.half_grid_num
+
+    @property
+    def center_price(self):
+        return self.price_of(self.center_tick)
+
+    @property
+    def lowest_price(self):
+        return self.price_of(self.lowest_tick)
+
+    @property
+    def highest_price(self):
+        return self.price_of(self.highest_tick)
+
+    def _calc_price(self, tick):
+        return round(self.init_price + tick * self.price_interval, self.price_precision)
+
+    def price_of(self, tick):
+        """ Price of the grid line `tick` """
+        index = tick - self._table_lowest_tick
+        if 0 <= index < len(self._price_list):
+            return self._price_list[index]
+        return self._calc_price(tick)
+
+    def tick_of(self, price, round_func=round):
+        """ Map `price` to the tick of a grid line.
+            Prices on the grid map exactly, other prices are rounded by `round_func`
+        """
+        tick = self._ticks.get(price)
+        if tick is not None:
+            return tick
+        distance = (price - self.init_price) / self.price_interval
+        nearest = round(distance)
+        if math.isclose(distance, nearest, abs_tol=1e-9):
+            return int(nearest)
+        return int(round_func(distance))
+
+    def _is_on_line(self, price, tick):
+        return abs(price - self.price_of(tick)) <= 1e-9 * self.price_interval
+
+    def floor_tick(self, price):
+        """ Tick of the highest grid line at or below `price` """
+        tick = self._ticks.get(price)
+        if tick is not None:
+            return tick
+        if self._price_list[0] < price < self._price_list[-1]:
+            index = int(np.searchsorted(self.prices, price, side='right')) - 1
+            tick = index + self._table_lowest_tick
+            # Snap to the upper line when `price` only misses it by float error
+            if self._is_on_line(price, tick + 1):
+                tick += 1
+            return tick
+        return self.tick_of(price, round_func=math.floor)
+
+    def ceil_tick(self, price):
+        """ Tick of the lowest grid line at or above `price` """
+        tick = self._ticks.get(price)
+        if tick is not None:
+            return tick
+        if self._price_list[0] < price < self._price_list[-1]:
+            index = int(np.searchsorted(self.prices, price, side='left'))
+            tick = index + self._table_lowest_tick
+            # Snap to the lower line when `price` only misses it by float error
+            if self._is_on_line(price, tick - 1):
+                tick -= 1
+            return tick
+        return self.tick_of(price, round_func=math.ceil)
+
+    def __len__(self) -> int:
+        return self.highest_tick - self.lowest_tick + 1
+
+    def __repr__(self) -> str:
+        return f"PriceGrid({self.lowest_price} ~ {self.highest_price}, interval={self.price_interval})"
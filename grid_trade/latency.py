@@ -0,0 +1,81 @@
+import sys
+sys.path.append('.')
+
+import time
+import logging
+import functools
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyRecorder:
+    """ Durations of the phases of the sync cycle, the latest `window` samples of each phase.
+            Recording is a clock read and a deque append, the percentiles are only calculated on `summary`
+    """
+    percentiles = (50, 95, 99)
+
+    def __init__(self, window=1024) -> None:
+        self.window = window
+        # phase => recent durations (seconds), in the order of the first record
+        self._samples = OrderedDict()
+        self._counts = {}
+
+    def record(self, phase, seconds):
+        samples = self._samples.get(phase)
+        if samples is None:
+            samples = self._samples.setdefault(phase, deque(maxlen=self.window))
+        samples.append(seconds)
+        self._counts[phase] = self._counts.get(phase, 0) + 1
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def timed(self, phase, func):
+        """ `func` recording its duration as `phase`, e.g., to be run in another thread """
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            with self.time(phase):
+                return func(*args, **kwargs)
+        return call
+
+    def summary(self):
+        """ phase => {'count', 'p50', 'p95', 'p99', 'max'} in milliseconds, `count` is the number of all the records """
+        result = OrderedDict()
+        for phase, samples in list(self._samples.items()):
+            values = np.fromiter(list(samples), dtype=np.float64) * 1000
+            if len(values) <= 0:
+                continue
+            stats = {'count': self._counts[phase]}
+            for p, value in zip(self.percentiles, np.percentile(values, self.percentiles)):
+                stats[f"p{p}"] = float(value)
+            stats['max'] = float(values.max())
+            result[phase] = stats
+        return result
+
+    def to_markdown(self):
+        summary = self.summary()
+        if not summary:
+            return ""
+        max_len = max(len(phase) for phase in summary)
+        header = "{} : {:>7} {:>7} {:>7} {:>7}  (ms, {} latest)".format(
+            'Phase'.ljust(max_len), 'p50', 'p95', 'p99', 'max', self.window)
+        lines = [header]
+        for phase, stats in summary.items():
+            lines.append("{} : {:>7.1f} {:>7.1f} {:>7.1f} {:>7.1f}".format(
+                phase.ljust(max_len), stats['p50'], stats['p95'], stats['p99'], stats['max']))
+        return "\n".join(lines)
+
+    def reset(self):
+        self._samples.clear()
+        self._counts.clear()
+
+    def __repr__(self) -> str:
+        return f"LatencyRecorder(phases={list(self._samples.keys())}, window={self.window})"
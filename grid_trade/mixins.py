@@ -1,4 +1,5 @@
 class FieldFormatMixin:
+    __slots__ = ()
     # A new property of `NAME_s` will be added for each of the `NAME` variables
     fields_to_format = {}
     price_precision = 0
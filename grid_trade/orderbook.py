@@ -0,0 +1,535 @@
+import sys
+sys.path.append('.')
+
+import logging
+import numpy as np
+from grid_trade.grid import PriceGrid
+from grid_trade.orders import Order, OrderContext, OrderSide, OrderStatus, SyncResult
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBook:
+    """ Struct-of-arrays alternative to `OrderManager`, exposing the same API.
+
+        Each order is a row of the arrays (tick, side, status, amount, order_id),
+        rows are recycled through a free-list. `Order` objects are only materialized
+        for the rows handed out to the caller (e.g., `orders_to_create`).
+
+        Side codes are the `inner` direction flags: buy = 1, sell = -1,
+            so the `outer` neighbour of a tick is `tick - side`
+    """
+    BUY = 1
+    SELL = -1
+
+    class SideStack:
+        """ The orders of one side of the book, standing in for `OrderManager.OrderStack` in the lookups """
+
+        def __init__(self, book, side: OrderSide) -> None:
+            self.book = book
+            self.side = side
+
+        def get_order(self, order_id):
+            order = self.book.get_order_by_id(order_id=order_id)
+            return order if order is not None and order.side == self.side else None
+
+        @property
+        def all_orders(self):
+            return self.book.orders_of_side(self.side)
+
+        def __repr__(self) -> str:
+            return f"SideStack({self.side.name})"
+
+    status_list = list(OrderStatus)
+    status_codes = {status: code for code, status in enumerate(status_list)}
+    # Orders in these status occupy their price on the grid
+    live_codes = [status_codes[OrderStatus.ToCreate], status_codes[OrderStatus.Created]]
+
+    def __init__(self, price_interval, unit_amount, grid_num, order_limit, balance_threshold=2, additional_info=None,
+                capacity=64) -> None:
+        """
+            balance_threshold: balance the size of two stacks when the size of either stack is <= this threshold
+            capacity: initial number of rows, doubled whenever the free-list runs out
+        """
+        self.price_interval = price_interval
+        self.unit_amount = unit_amount
+        self.grid_num = grid_num
+        self.order_limit = order_limit
+        self.balance_threshold = balance_threshold
+        self.additional_info = additional_info
+        self.init_price = 0
+        # Price table of the grid lines, laid out in `init_stacks`
+        self.grid = None
+        self.context = OrderContext(pair=self.pair, user=self.user, exchange=self.exchange, db=self.db,
+                                    price_precision=self.get_additional('price_precision'),
+                                    amount_precision=self.get_additional('amount_precision'))
+
+        self.tick = np.zeros(capacity, dtype=np.int64)
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.amount = np.zeros(capacity, dtype=np.float64)
+        self.order_id = np.full(capacity, -1, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        # Rows of each side from the inner-most to the outer-most (the same tick in the insertion order) and their keys,
+        #  updated on adding / freeing rows only: the status transitions do not move the rows
+        self._side_rows = {side: np.zeros(0, dtype=np.int64) for side in [self.BUY, self.SELL]}
+        self._side_keys = {side: np.zeros(0, dtype=np.int64) for side in [self.BUY, self.SELL]}
+
+        # Materialized orders: row => Order and Order => row
+        self._orders = {}
+        self._rows = {}
+        # order_id => row
+        self._rows_by_id = {}
+        self.buy_stack = self.SideStack(self, OrderSide.Buy)
+        self.sell_stack = self.SideStack(self, OrderSide.Sell)
+
+    @property
+    def capacity(self):
+        return len(self.used)
+
+    @property
+    def active_limit(self):
+        return self.order_limit // 2
+
+    @classmethod
+    def side_code(cls, side: OrderSide):
+        return cls.BUY if side == OrderSide.Buy else cls.SELL
+
+    @classmethod
+    def code_to_side(cls, code):
+        return OrderSide.Buy if code == cls.BUY else OrderSide.Sell
+
+    def price_to_tick(self, price, round_func=round):
+        """ Map `price` to the index of a grid line relative to `init_price`, the same as `OrderStack.price_to_tick` """
+        return self.grid.tick_of(price, round_func=round_func)
+
+    def tick_to_price(self, tick):
+        return self.grid.price_of(int(tick))
+
+    #################
+    # Row storage
+    def _grow(self):
+        old = self.capacity
+        new = old * 2
+        for name in ['tick', 'side', 'status', 'amount', 'used']:
+            arr = getattr(self, name)
+            grown = np.zeros(new, dtype=arr.dtype)
+            grown[:old] = arr
+            setattr(self, name, grown)
+        order_id = np.full(new, -1, dtype=np.int64)
+        order_id[:old] = self.order_id
+        self.order_id = order_id
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def _add_rows(self, side, ticks):
+        """ Add ToCreate orders at `ticks`, skipping ticks that are already live. Returns the number added """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        if len(ticks) == 0:
+            return 0
+        _, first = np.unique(ticks, return_index=True)
+        ticks = ticks[np.sort(first)]
+        live = self.tick[self._sorted_rows(side, codes=self.live_codes)]
+        exist = np.isin(ticks, live)
+        for tick in ticks[exist]:
+            logger.warning(f"Price [{self.tick_to_price(tick)}] already exists in {self.code_to_side(side).value} book. Skip.")
+        ticks = ticks[~exist]
+        n = len(ticks)
+        while len(self._free) < n:
+            self._grow()
+        rows = np.array([self._free.pop() for _ in range(n)], dtype=np.int64)
+        self.tick[rows] = ticks
+        self.side[rows] = side
+        self.status[rows] = self.status_codes[OrderStatus.ToCreate]
+        self.amount[rows] = self.unit_amount
+        self.order_id[rows] = -1
+        self.used[rows] = True
+        self._insert_sorted_rows(side, rows)
+        return n
+
+    def _insert_sorted_rows(self, side, rows):
+        """ Insert the new `rows` into the sorted rows of `side`, after the rows of the same tick """
+        keys = -self.tick[rows] * side
+        order = np.argsort(keys, kind='stable')
+        rows, keys = rows[order], keys[order]
+        pos = np.searchsorted(self._side_keys[side], keys, side='right')
+        self._side_rows[side] = np.insert(self._side_rows[side], pos, rows)
+        self._side_keys[side] = np.insert(self._side_keys[side], pos, keys)
+
+    def _free_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        for side in [self.BUY, self.SELL]:
+            keep = ~np.isin(self._side_rows[side], rows)
+            self._side_rows[side] = self._side_rows[side][keep]
+            self._side_keys[side] = self._side_keys[side][keep]
+        for row in rows:
+            row = int(row)
+            order = self._orders.pop(row, None)
+            if order is not None:
+                order.owner = None
+                del self._rows[order]
+            oid = int(self.order_id[row])
+            if self._rows_by_id.get(oid) == row:
+                del self._rows_by_id[oid]
+            self.used[row] = False
+            self.order_id[row] = -1
+            self._free.append(row)
+
+    def _sorted_rows(self, side, codes=None):
+        """ Rows of `side` (with status in `codes` if provided), from the inner-most to the outer-most """
+        rows = self._side_rows[side]
+        if codes is None:
+            return rows
+        status = self.status[rows]
+        if len(codes) == 1:
+            return rows[status == codes[0]]
+        return rows[np.isin(status, codes)]
+
+    def _rows_of(self, status: OrderStatus):
+        code = [self.status_codes[status]]
+        return np.concatenate([self._sorted_rows(self.BUY, codes=code), self._sorted_rows(self.SELL, codes=code)])
+
+    def _orders_at(self, rows):
+        orders = self._orders
+        return [orders.get(row) or self._order_at(row) for row in rows.tolist()]
+
+    def _set_status_rows(self, rows, status: OrderStatus):
+        """ Vectorized transition of `rows` to `status`, keeping the materialized orders in sync """
+        self.status[rows] = self.status_codes[status]
+        for row in rows:
+            order = self._orders.get(int(row))
+            if order is not None:
+                order.status = status
+
+    def _order_at(self, row) -> Order:
+        """ Materialize (or return the materialized) order of `row` """
+        row = int(row)
+        order = self._orders.get(row)
+        if order is None:
+            oid = int(self.order_id[row])
+            order = Order(price=self.tick_to_price(self.tick[row]), amount=float(self.amount[row]),
+                        side=self.code_to_side(self.side[row]), tick=int(self.tick[row]),
+                        order_id=oid if oid >= 0 else None,
+                        status=self.status_list[self.status[row]], context=self.context)
+            order.owner = self
+            self._orders[row] = order
+            self._rows[order] = row
+        return order
+
+    def _on_status_changed(self, order: Order, old_status):
+        """ Called by a materialized `order` on each status transition """
+        row = self._rows.get(order)
+        if row is not None:
+            self.status[row] = self.status_codes[order.status]
+
+    def _row_of_order(self, order: Order, status=None):
+        row = self._rows.get(order)
+        if row is None or (status is not None and order.status != status):
+            return None
+        return row
+
+    #################
+    # Same API as OrderManager
+    def init_stacks(self, init_price):
+        self.init_price = init_price
+        precision = self.context.price_precision
+        if precision is None:
+            precision = Order.get_precision('price')
+        self.grid = PriceGrid(init_price=init_price, price_interval=self.price_interval,
+                                grid_num=self.grid_num, price_precision=precision)
+        for side in [self.BUY, self.SELL]:
+            self._reshape(side, inner_tick=-side, size=self.active_limit)
+
+    @property
+    def orders_to_create(self):
+        return self._orders_at(self._rows_of(OrderStatus.ToCreate))
+
+    def pending_changes(self, status):
+        """ Orders waiting to be committed at `status`, buy orders first and each side from the inner-most """
+        return self._orders_at(self._rows_of(status))
+
+    @property
+    def orders_to_cancel(self):
+        return self._orders_at(self._rows_of(OrderStatus.ToCancel))
+
+    @property
+    def active_orders(self):
+        return self._orders_at(self._rows_of(OrderStatus.Created))
+
+    @property
+    def active_order_ids(self):
+        return self.order_id[self._rows_of(OrderStatus.Created)].tolist()
+
+    def best_active_prices(self):
+        """ Prices of the inner-most active buy and sell orders, the same as `OrderManager.best_active_prices` """
+        code = [self.status_codes[OrderStatus.Created]]
+        prices = []
+        for side in [self.BUY, self.SELL]:
+            rows = self._sorted_rows(side, codes=code)
+            prices.append(self.tick_to_price(self.tick[rows[0]]) if len(rows) > 0 else None)
+        return tuple(prices)
+
+    def order_ids_in_reach(self, low, high):
+        """ Ids of the active orders the price may have traded through, the same as `OrderManager.order_ids_in_reach` """
+        code = [self.status_codes[OrderStatus.Created]]
+        buy_rows = self._sorted_rows(self.BUY, codes=code)
+        sell_rows = self._sorted_rows(self.SELL, codes=code)
+        buy_rows = buy_rows[self.tick[buy_rows] >= self.grid.ceil_tick(low)]
+        sell_rows = sell_rows[self.tick[sell_rows] <= self.grid.floor_tick(high)]
+        return self.order_id[np.concatenate([buy_rows, sell_rows])].tolist()
+
+    def order_create_ok(self, order):
+        """ Set the status of the order to Created """
+        row = self._row_of_order(order, status=OrderStatus.ToCreate)
+        if row is None:
+            self._print_order_not_found_error(order, action='Creating', place='to_create')
+            return
+        order.create_ok()
+        if order.order_id is not None:
+            self.order_id[row] = order.order_id
+            self._rows_by_id[order.order_id] = row
+
+    def order_force_cancelled(self, order_id=None, order=None):
+        """ Set the status of the order to Cancelled by force
+            Either order_id or order is ok, order_id takes the priority
+        """
+        if not order_id and not order:
+            logger.error(f"In order_force_cancelled: at least one must be provided: [order_id | order]")
+            return False
+        if order_id:
+            order = self.get_order_by_id(order_id=order_id)
+            if not order:
+                logger.error(f"In order_force_cancelled: order not found by id: {order_id}")
+                return False
+        row = self._row_of_order(order)
+        if row is None:
+            self._print_order_not_found_error(order, action='Force cancelling', place='_orders')
+            return
+        order.cancel_ok(force=True)
+        self._free_rows([row])
+
+    def order_cancel_ok(self, order):
+        """ Set the status of the order to Cancelled """
+        row = self._row_of_order(order, status=OrderStatus.ToCancel)
+        if row is None:
+            self._print_order_not_found_error(order, action='Cancelling', place='to_cancel')
+            return
+        order.cancel_ok()
+        self._free_rows([row])
+
+    def get_order_by_id(self, order_id) -> Order:
+        row = self._rows_by_id.get(order_id) if order_id is not None else None
+        return self._order_at(row) if row is not None else None
+
+    def get_order_and_stack_by_order_id(self, order_id):
+        """ Find the order and the stack (view) of its side if exists """
+        order = self.get_order_by_id(order_id=order_id)
+        if order is None:
+            return None, None
+        return order, self.buy_stack if order.side == OrderSide.Buy else self.sell_stack
+
+    def mark_order_on_traded(self, order_id):
+        """ Set the status of the order to OnTraded """
+        self.mark_orders_on_traded([order_id])
+
+    def mark_orders_on_traded(self, order_ids):
+        """ Set the status of the orders to OnTraded in one vectorized step """
+        rows = np.array([self._rows_by_id.get(oid, -1) for oid in order_ids], dtype=np.int64)
+        found = rows >= 0
+        rows = rows[found]
+        created = self.status[rows] == self.status_codes[OrderStatus.Created]
+        for oid in np.asarray(order_ids)[found][~created]:
+            logger.warning(f"Mark Traded order, however order {oid} is not active")
+        self._set_status_rows(rows[created], OrderStatus.OnTraded)
+
+    def apply_sync_results(self, orders_data, exchange) -> SyncResult:
+        """ Apply the orders data retrieved from `exchange` in one pass:
+                fully filled orders are marked OnTraded in bulk, cancelled ones are force cancelled
+        """
+        result = SyncResult()
+        traded = []
+        for order_data in orders_data:
+            if exchange.is_order_fullyfilled(order_data=order_data):
+                order = self.get_order_by_id(order_data['order_id'])
+                if order:
+                    order.average_price = order_data['average_price']
+                    traded.append(order)
+                else:
+                    result.missing_order_ids.append(order_data['order_id'])
+            elif exchange.is_order_cancelled(order_data=order_data):
+                order = self.get_order_by_id(order_data['order_id'])
+                if order:
+                    self.order_force_cancelled(order=order)
+                    result.cancelled_orders.append(order)
+
+        self.mark_orders_on_traded([o.order_id for o in traded])
+        for order in traded:
+            result.add_traded(order)
+        return result
+
+    def orders_traded(self):
+        """ Set the status of the orders to Traded """
+        rows = self._rows_of(OrderStatus.OnTraded)
+        for order in self._orders_at(rows):
+            order.trade_ok()
+        self._free_rows(rows)
+
+    def cancel_all(self):
+        for order in self.active_orders:
+            order.cancel_ok(force=True)
+        self._free_rows(np.flatnonzero(self.used))
+
+    def refill_orders_at_opposite_position(self):
+        filled_count = self._refill_by_pairing(side=self.SELL)
+        if filled_count <= 0:
+            # Sell side takes the priority, i.e. only refill buy side if sell is not filled
+            self._refill_by_pairing(side=self.BUY)
+
+    def _refill_by_pairing(self, side):
+        """ Prepare orders on `side` at the opposite positions of the OnTraded orders of the other side """
+        other = -side
+        rows = self._sorted_rows(other, codes=[self.status_codes[OrderStatus.OnTraded]])
+        # The opponent of an order is its `inner` neighbour
+        return self._add_rows(side, self.tick[rows] + other)
+
+    def expected_size(self, side):
+        return len(self._sorted_rows(side, codes=self.live_codes))
+
+    def balance_stacks(self, price=None):
+        """ Reshape both sides in one pass when either of them is too thin (or the orders exceed the limit),
+                the same as `OrderManager.balance_stacks`
+        """
+        exp_buy_size = self.expected_size(self.BUY)
+        exp_sell_size = self.expected_size(self.SELL)
+
+        logger.debug(f"Expected size "
+                    f"[buy: {exp_buy_size}, "
+                    f"sell: {exp_sell_size}]")
+
+        exceed_limit = exp_buy_size + exp_sell_size > self.order_limit
+        if exceed_limit:
+            logger.warning(f"The number of orders exceeds the limit {self.order_limit}")
+
+        trigger_balance = min(exp_buy_size, exp_sell_size) <= self.balance_threshold
+        if not (exceed_limit or trigger_balance):
+            return
+
+        buy_tick, sell_tick = self._window_origins(price=price)
+        if buy_tick is None or sell_tick is None:
+            logger.warning(f"Cannot balance the stacks without any live order or the current price.")
+            return
+
+        size = self.order_limit // 2
+        logger.debug(f"Balancing the stacks to {size} orders each from "
+                    f"[buy: {self.tick_to_price(buy_tick)}, "
+                    f"sell: {self.tick_to_price(sell_tick)}]")
+        self._reshape(self.BUY, inner_tick=buy_tick, size=size)
+        self._reshape(self.SELL, inner_tick=sell_tick, size=size)
+
+    def recenter(self, cells, price=None):
+        """ Shift the grid and reshape both sides onto it, the same as `OrderManager.recenter` """
+        self.grid.shift(cells)
+        buy_tick, sell_tick = self._window_origins(price=price)
+        if buy_tick is None or sell_tick is None:
+            return
+        size = self.order_limit // 2
+        self._reshape(self.BUY, inner_tick=buy_tick, size=size)
+        self._reshape(self.SELL, inner_tick=sell_tick, size=size)
+
+    def _best_live_tick(self, side):
+        rows = self._sorted_rows(side, codes=self.live_codes)
+        return int(self.tick[rows[0]]) if len(rows) > 0 else None
+
+    def _window_origins(self, price=None):
+        """ Ticks of the inner-most grid lines of the buy and sell windows """
+        buy_tick = self._best_live_tick(self.BUY)
+        sell_tick = self._best_live_tick(self.SELL)
+        if price is not None:
+            if buy_tick is None:
+                # The highest grid line below the price
+                buy_tick = self.grid.ceil_tick(price) - 1
+                if sell_tick is not None:
+                    buy_tick = min(buy_tick, sell_tick - 1)
+            if sell_tick is None:
+                # The lowest grid line above the price
+                sell_tick = self.grid.floor_tick(price) + 1
+                sell_tick = max(sell_tick, buy_tick + 1)
+        elif buy_tick is None and sell_tick is not None:
+            buy_tick = sell_tick - 2
+        elif sell_tick is None and buy_tick is not None:
+            sell_tick = buy_tick + 2
+        return buy_tick, sell_tick
+
+    def virtual_size(self, side, inner_tick):
+        """ Number of grid lines on `side` of the grid from `inner_tick` to the edge """
+        edge = self.grid.lowest_tick if side == self.BUY else self.grid.highest_tick
+        return max((inner_tick - edge) * side + 1, 0)
+
+    def _reshape(self, side, inner_tick, size):
+        """ Make the live orders of `side` fill exactly `size` grid lines outwards from `inner_tick`
+                (clipped by the edge of the grid), the same as `OrderStack.slide_window`
+        """
+        size = min(size, self.virtual_size(side, inner_tick))
+        rows = self._sorted_rows(side, codes=self.live_codes)
+        # Positions of the orders in the window, the window grows outwards (-side)
+        offset = (self.tick[rows] - inner_tick) * -side
+        inside = (offset >= 0) & (offset < size)
+        outside = rows[~inside]
+        status = self.status[outside]
+        self._set_status_rows(outside[status == self.status_codes[OrderStatus.Created]], OrderStatus.ToCancel)
+        to_drop = outside[status == self.status_codes[OrderStatus.ToCreate]]
+        self._set_status_rows(to_drop, OrderStatus.Cancelled)
+        self._free_rows(to_drop)
+
+        ticks = inner_tick - side * np.arange(size)
+        self._add_rows(side, ticks[~np.isin(ticks, self.tick[rows[inside]])])
+
+    def _print_order_not_found_error(self, order, action='Creating', place='to_create'):
+        logger.warning(f"{action} order, however order not found in {place} of the book: {order}")
+
+    # Additional information
+    def get_additional(self, key):
+        if self.additional_info and key in self.additional_info:
+            return self.additional_info[key]
+        return None
+
+    @property
+    def pair(self):
+        return self.get_additional('pair')
+
+    @property
+    def user(self):
+        return self.get_additional('user')
+
+    @property
+    def exchange(self):
+        return self.get_additional('exchange')
+
+    @property
+    def db(self):
+        return self.get_additional('db')
+
+    ##########################
+    # Debug print
+    def orders_of_side(self, side: OrderSide):
+        """ All the orders of `side`, from the inner-most to the outer-most """
+        return self._orders_at(self._sorted_rows(self.side_code(side)))
+
+    def print_stacks(self):
+        self.print_stacks_size()
+        msg = ["\n"]
+        for o in [*reversed(self.orders_of_side(OrderSide.Sell)), *self.orders_of_side(OrderSide.Buy)]:
+            msg.append(f"OID <{o.order_id}> {o.side.name} @[{o.price_s}] - {o.status.value}")
+        logger.info("\n".join(msg))
+
+    def print_stacks_size(self):
+        logger.info(f"Stack size [buy: {self._size(self.BUY)}, sell: {self._size(self.SELL)}]")
+
+    @property
+    def stack_brief_info(self):
+        return f"[+{self._size(self.BUY)}, -{self._size(self.SELL)}]"
+
+    def _size(self, side):
+        return len(self._sorted_rows(side))
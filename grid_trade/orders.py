@@ -2,12 +2,17 @@ import sys
 from typing import Sequence
 sys.path.append('.')
 
+import bisect
+import heapq
+import itertools
+import collections.abc
 from enum import Enum
 from functools import reduce
 from collections import defaultdict
 import math
 import logging
 from grid_trade.mixins import FieldFormatMixin
+from grid_trade.grid import PriceGrid
 from utils import init_formatted_properties, setup_logging
 
 logger = logging.getLogger(__name__)
@@ -33,9 +38,31 @@ class OrderStatus(Enum):
     Cancelled = 'Cancelled'
 
 
+class OrderContext:
+    """ Per-bot constants shared by all the orders of one bot.
+            A precision of None falls back to the class-level precision of `Order`
+    """
+    __slots__ = ('pair', 'user', 'exchange', 'db', 'price_precision', 'amount_precision')
+
+    def __init__(self, pair='', user='', exchange='', db=None, price_precision=None, amount_precision=None) -> None:
+        self.pair = pair
+        self.user = user
+        self.exchange = exchange
+        self.db = db
+        self.price_precision = price_precision
+        self.amount_precision = amount_precision
+
+    def __repr__(self) -> str:
+        return f"OrderContext(pair={self.pair}, user={self.user}, exchange={self.exchange})"
+
+
 class Order(FieldFormatMixin):
-    # Exclude these fields from serializing
-    _to_exclude = ['db']
+    __slots__ = ('order_id', 'price', 'amount', 'side', 'couple_id', 'order_type', 'average_price',
+                'ordered_at', 'executed_at', 'post_only', 'status', 'tick', 'owner', 'context')
+    # Fields to serialize, in order
+    _fields_to_serialize = ('order_id', 'price', 'amount', 'side', 'couple_id', 'pair', 'order_type',
+                            'average_price', 'ordered_at', 'executed_at', 'post_only', 'status',
+                            'user', 'exchange', 'tick')
     enum_values = {
         'side': OrderSide,
         'status': OrderStatus,
@@ -48,43 +75,75 @@ class Order(FieldFormatMixin):
         'average_price': {'precision': 0, '_type': 'price'},
     }
 
-    def __init__(self, price, amount, pair, order_type=OrderType.Limit, order_id=None, couple_id=None, 
+    def __init__(self, price, amount, pair='', order_type=OrderType.Limit, order_id=None, couple_id=None, 
                 side=OrderSide.Buy, average_price=0, status=OrderStatus.ToCreate, 
                 executed_at=None, ordered_at=None, post_only=False, user='', exchange='',
-                db=None):
+                db=None, tick=None, context=None):
+        """ `pair`, `user`, `exchange` and `db` are only used when `context` is not provided """
         self.order_id = order_id
         self.price = price
         self.amount = amount
         self.side = side
         self.couple_id = couple_id
-        self.pair = pair
         self.order_type = order_type
         self.average_price = average_price
         self.ordered_at = ordered_at
         self.executed_at = executed_at
         self.post_only = post_only
         self.status = status
-        self.user = user
-        self.exchange = exchange
-        self.db = db
+        # Index of the grid line this order sits on, relative to the grid origin
+        self.tick = tick
+        # The stack holding this order, notified on every status transition
+        self.owner = None
+        if context is None:
+            context = OrderContext(pair=pair, user=user, exchange=exchange, db=db)
+        self.context = context
+
+    @property
+    def pair(self):
+        return self.context.pair
+
+    @property
+    def user(self):
+        return self.context.user
+
+    @property
+    def exchange(self):
+        return self.context.exchange
+
+    @property
+    def db(self):
+        return self.context.db
+
+    def get_field_precision(self, key, default=None):
+        """ Precision of `key` from the context if set, otherwise `default` or the class-level one """
+        _type = self.fields_to_format.get(key, {}).get('_type', '')
+        precision = None
+        if _type == 'price':
+            precision = self.context.price_precision
+        elif _type == 'amount':
+            precision = self.context.amount_precision
+        if precision is None:
+            precision = default if default is not None else self.get_precision(key=key)
+        return precision
     
     @property
     def cost(self):
         cost = self.amount * self.price
         # Hard coding the precision of `cost` to be the same as `price`
-        cost = round(cost, self.fields_to_format['price']['precision'])
+        cost = round(cost, self.get_field_precision('price'))
         return cost
         
     def mark_cancel(self):
         if self.status == OrderStatus.Created:
-            self.status = OrderStatus.ToCancel
+            self._set_status(OrderStatus.ToCancel)
         elif self.status == OrderStatus.ToCreate:
             # print(f"This order is not created yet when being cancelled: {self}")
-            self.status = OrderStatus.Cancelled
+            self._set_status(OrderStatus.Cancelled)
     
     def create_ok(self):
         if self.status == OrderStatus.ToCreate:
-            self.status = OrderStatus.Created
+            self._set_status(OrderStatus.Created)
             logger.info(f"Order created: {self.short}")
             if self.db:
                 self.db.create_order(self.to_dict())
@@ -93,13 +152,13 @@ class Order(FieldFormatMixin):
     
     def create_fail(self):
         if self.status == OrderStatus.ToCreate:
-            self.status = OrderStatus.Cancelled
+            self._set_status(OrderStatus.Cancelled)
             if self.db:
                 self.db.delete_order(self.order_id)
 
     def cancel_ok(self, force=False):
         if self.status == OrderStatus.ToCancel or force:
-            self.status = OrderStatus.Cancelled
+            self._set_status(OrderStatus.Cancelled)
             force_tag = "force" if force else ""
             logger.info(f"Order {force_tag} cancelled: {self.short}")
             self.save_status_to_db()
@@ -108,18 +167,24 @@ class Order(FieldFormatMixin):
 
     def mark_traded(self):
         if self.status == OrderStatus.Created:
-            self.status = OrderStatus.OnTraded
+            self._set_status(OrderStatus.OnTraded)
         else:
             self._print_error_message(exp_status='Created', action='OnTraded')
 
     def trade_ok(self):
         if self.status == OrderStatus.OnTraded:
-            self.status = OrderStatus.Traded
+            self._set_status(OrderStatus.Traded)
             logger.info(f"Order traded: {self.short}")
             self.save_status_to_db()
         else:
             self._print_error_message(exp_status='OnTraded', action='Traded')
     
+    def _set_status(self, status):
+        old_status = self.status
+        self.status = status
+        if self.owner:
+            self.owner._on_status_changed(self, old_status=old_status)
+
     def _print_error_message(self, action='Traded', exp_status='Created'):
         logger.warning(f"Order was not at status {exp_status} when being {action}. {self}") 
     
@@ -134,11 +199,31 @@ class Order(FieldFormatMixin):
     def copy(self, price_interval, direction='inner', status=OrderStatus.ToCreate):
         flag = self.get_direction_flag(self.side, direction=direction)
         new_price = self.price + flag * price_interval
-        dest = vars(self).copy()
-        dest['price'] = new_price
-        dest['status'] = status
-        dest['order_id'] = None
-        obj = self.__class__(**dest)
+        new_tick = self.tick + flag if self.tick is not None else None
+        return self.clone(price=new_price, tick=new_tick, status=status, order_id=None)
+
+    def clone(self, **changes):
+        """ Copy the order without going through `__init__`, sharing the same context.
+                The clone is not held by any stack
+        """
+        cls = self.__class__
+        obj = cls.__new__(cls)
+        obj.order_id = self.order_id
+        obj.price = self.price
+        obj.amount = self.amount
+        obj.side = self.side
+        obj.couple_id = self.couple_id
+        obj.order_type = self.order_type
+        obj.average_price = self.average_price
+        obj.ordered_at = self.ordered_at
+        obj.executed_at = self.executed_at
+        obj.post_only = self.post_only
+        obj.status = self.status
+        obj.tick = self.tick
+        obj.owner = None
+        obj.context = self.context
+        for name, value in changes.items():
+            setattr(obj, name, value)
         return obj
     
     @classmethod
@@ -152,12 +237,15 @@ class Order(FieldFormatMixin):
     def get_opponent_price(self, price_interval):
         flag = self.get_direction_flag(self.side, direction='inner')
         return self.price + flag * price_interval
+
+    def get_opponent_tick(self):
+        if self.tick is None:
+            return None
+        flag = self.get_direction_flag(self.side, direction='inner')
+        return self.tick + flag
     
     def get_dict_to_serialize(self):
-        dest = vars(self).copy()
-        for k in self._to_exclude:
-            del dest[k]
-        return dest
+        return {k: getattr(self, k) for k in self._fields_to_serialize}
 
     @classmethod
     def from_dict(cls, source):
@@ -186,18 +274,129 @@ class Order(FieldFormatMixin):
         return f"[{self.side.value}] {self.amount_s} @ {self.price_s} with {self.cost}. ({self.order_id})"
 
 
+class SortedOrders(collections.abc.Sequence):
+    """ A read-only sequence of orders kept sorted by `key` with bisect
+            Finding the position is O(log n), inserting or removing there is O(n) (list shifting,
+            a memmove that stays cheap for the few hundred orders of a grid).
+            Orders with equal keys keep their insertion order
+    """
+
+    def __init__(self, key) -> None:
+        self._key = key
+        self._keys = []
+        self._orders = []
+
+    def add(self, order: Order):
+        k = self._key(order)
+        pos = bisect.bisect_right(self._keys, k)
+        self._keys.insert(pos, k)
+        self._orders.insert(pos, order)
+
+    def remove(self, order: Order):
+        pos = self._index_of(order)
+        if pos < 0:
+            return False
+        del self._keys[pos]
+        del self._orders[pos]
+        return True
+
+    def clear(self):
+        self._keys.clear()
+        self._orders.clear()
+
+    def _index_of(self, order: Order):
+        k = self._key(order)
+        pos = bisect.bisect_left(self._keys, k)
+        while pos < len(self._keys) and self._keys[pos] == k:
+            if self._orders[pos] is order:
+                return pos
+            pos += 1
+        return -1
+
+    def __contains__(self, order) -> bool:
+        return self._index_of(order) >= 0
+
+    def __getitem__(self, index):
+        return self._orders[index]
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __iter__(self):
+        return iter(self._orders)
+
+    def __repr__(self) -> str:
+        return f"SortedOrders({self._orders})"
+
+
+class ChangeSet:
+    """ Orders waiting to be committed (created, cancelled or settled), grouped by status
+            Orders are added on entering one of these status and discarded on leaving it,
+            so the commit step only visits the changes instead of all the orders held
+    """
+    pending_status_list = (OrderStatus.ToCreate, OrderStatus.ToCancel, OrderStatus.OnTraded)
+
+    def __init__(self) -> None:
+        # Dicts are used as insertion-ordered identity sets
+        self._pending = {status: {} for status in self.pending_status_list}
+
+    def add(self, order: Order):
+        pending = self._pending.get(order.status)
+        if pending is not None:
+            pending[order] = None
+
+    def discard(self, order: Order, status):
+        pending = self._pending.get(status)
+        if pending is not None:
+            pending.pop(order, None)
+
+    def get(self, status):
+        return list(self._pending[status])
+
+    def count(self, status):
+        return len(self._pending[status])
+
+    def clear(self):
+        for pending in self._pending.values():
+            pending.clear()
+
+    def __len__(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    def __repr__(self) -> str:
+        return "ChangeSet({})".format(", ".join(f"{s.value}={len(p)}" for s, p in self._pending.items()))
+
+
 class OrderManager:
     class OrderStack:
+        # Orders in these status occupy their price on the grid
+        live_status_list = (OrderStatus.ToCreate, OrderStatus.Created)
+
         def __init__(self, om, side: OrderSide) -> None:
             self.om = om
             self.init_price = 0
             self.side = side
-            self._orders = []
+            # All orders, kept sorted from the inner-most to the outer-most
+            self._orders = SortedOrders(key=self._sort_key)
+            # Identity set of `_orders` for O(1) membership checks
+            self._order_set = set()
+            # Orders grouped by status, each kept in the same order as `_orders`
+            self._buckets = {status: SortedOrders(key=self._sort_key) for status in OrderStatus}
+            # Number of live (ToCreate / Created) orders at each tick, for duplicate detection
+            self._live_ticks = defaultdict(int)
+
+        def _sort_key(self, order: Order):
+            """ Buy orders are sorted by price descending, sell orders ascending """
+            return -order.tick if self.side == OrderSide.Buy else order.tick
         
         @property
         def price_interval(self):
             return self.om.price_interval
 
+        @property
+        def grid(self) -> PriceGrid:
+            return self.om.grid
+
         @property
         def unit_amount(self):
             return self.om.unit_amount
@@ -217,7 +416,6 @@ class OrderManager:
         def _get_best_worst_order(self, is_best, status='all') -> Order:
             pos = 0 if is_best else -1
             collection = self.all_orders if status == 'all' else self.active_orders
-            self.sort()
             return collection[pos] if len(collection) > 0 else None
         
         @property
@@ -241,55 +439,140 @@ class OrderManager:
             return self._get_best_worst_order(is_best=False, status='active')
 
         @property
-        def to_create(self):
-            return self.get_orders_by_status(status_list=[OrderStatus.ToCreate])
+        def best_live_tick(self):
+            """ Tick of the inner-most order to be created or already created, None if there is none """
+            order = self.best_live_order
+            return order.tick if order else None
 
         @property
-        def to_cancel(self):
-            return self.get_orders_by_status(status_list=[OrderStatus.ToCancel])
+        def best_live_order(self) -> Order:
+            """ The inner-most order to be created or already created """
+            candidates = [bucket[0] for bucket in (self.to_create, self.active_orders) if len(bucket) > 0]
+            return min(candidates, key=self._sort_key) if candidates else None
 
         @property
-        def active_orders(self):
-            return self.get_orders_by_status(status_list=[OrderStatus.Created])
+        def worst_live_order(self) -> Order:
+            """ The outer-most order to be created or already created """
+            candidates = [bucket[-1] for bucket in (self.to_create, self.active_orders) if len(bucket) > 0]
+            return max(candidates, key=self._sort_key) if candidates else None
 
         @property
-        def on_traded_orders(self):
-            return self.get_orders_by_status(status_list=[OrderStatus.OnTraded])
+        def to_create(self) -> SortedOrders:
+            return self._buckets[OrderStatus.ToCreate]
 
         @property
-        def all_orders(self):
+        def to_cancel(self) -> SortedOrders:
+            return self._buckets[OrderStatus.ToCancel]
+
+        @property
+        def active_orders(self) -> SortedOrders:
+            return self._buckets[OrderStatus.Created]
+
+        @property
+        def on_traded_orders(self) -> SortedOrders:
+            return self._buckets[OrderStatus.OnTraded]
+
+        @property
+        def all_orders(self) -> SortedOrders:
             return self._orders
 
         def get_orders_by_status(self, status_list):
-            return list(filter(lambda o: o.status in status_list, self._orders))
+            """ Orders in any of `status_list`, sorted as `all_orders`: the sorted buckets are merged """
+            buckets = [self._buckets[status] for status in dict.fromkeys(status_list)]
+            if len(buckets) == 1:
+                return buckets[0]
+            return list(heapq.merge(*buckets, key=self._sort_key))
 
-        def sort(self):
-            desc = self.side == OrderSide.Buy
-            self._orders.sort(key=lambda x: x.price, reverse=desc)
-        
         def get_order(self, order_id):
-            for o in self._orders:
-                if order_id == o.order_id:
-                    return o
-            return None
+            order, stack = self.om.lookup_order_id(order_id)
+            return order if stack is self else None
+
+        def _add_order(self, order: Order):
+            if order.tick is None:
+                order.tick = self.price_to_tick(order.price)
+            self._orders.add(order)
+            self._order_set.add(order)
+            self._buckets[order.status].add(order)
+            self._count_live_tick(order, status=order.status, delta=1)
+            order.owner = self
+            self.om._index_order(order, stack=self)
+            self.om.changes.add(order)
+
+        def _remove_order(self, order: Order):
+            self._orders.remove(order)
+            self._order_set.discard(order)
+            self._buckets[order.status].remove(order)
+            self._count_live_tick(order, status=order.status, delta=-1)
+            order.owner = None
+            self.om._unindex_order(order)
+            self.om.changes.discard(order, order.status)
+
+        def _on_status_changed(self, order: Order, old_status):
+            """ Called by `order` on each status transition to move it between the buckets """
+            self._buckets[old_status].remove(order)
+            self._buckets[order.status].add(order)
+            self._count_live_tick(order, status=old_status, delta=-1)
+            self._count_live_tick(order, status=order.status, delta=1)
+            self.om.changes.discard(order, old_status)
+            self.om.changes.add(order)
+
+        def _count_live_tick(self, order: Order, status, delta):
+            if status not in self.live_status_list:
+                return
+            tick = order.tick
+            self._live_ticks[tick] += delta
+            if self._live_ticks[tick] <= 0:
+                del self._live_ticks[tick]
+
+        def _has_order(self, order: Order, status=None):
+            """ Check whether `order` is held by this stack (and at `status` if provided) """
+            if order not in self._order_set:
+                return False
+            return status is None or order.status == status
         
         def prepare_init(self, init_price):
             """ Init stack with limited numbers of orders, based on init_price """
             self.init_price = init_price
-            for price in self.get_price_grid(origin=init_price, direction='outer', start=1, count=self.active_limit):
-                self.prepare_order_at_price(price=price)
+            self.om.init_grid(init_price=init_price)
+            inner_tick = next(self.get_tick_grid(origin=init_price, direction='outer', start=1, count=1))
+            self.slide_window(inner_tick=inner_tick, size=self.active_limit)
 
         def prepare_order_at_price(self, price):
-            if self._price_exist_in_active_orders(price=price):
+            """ Prepare an order at the grid line nearest to `price` """
+            return self.prepare_order_at_tick(tick=self.price_to_tick(price))
+
+        def prepare_order_at_tick(self, tick):
+            price = self.tick_to_price(tick)
+            if self._tick_exist_in_live_orders(tick=tick):
                 logger.warning(f"Price [{price}] already exists in {self}. Skip.")
                 return False
-            o = Order(price=price, amount=self.unit_amount, side=self.side, pair=self.om.pair, 
-                    user=self.om.user, exchange=self.om.exchange, db=self.om.db)
-            self._orders.append(o)
+            o = Order(price=price, amount=self.unit_amount, side=self.side, tick=tick, context=self.om.context)
+            self._add_order(o)
             return True
         
-        def _price_exist_in_active_orders(self, price):
-            return price in [o.price for o in self.active_orders]
+        def _tick_exist_in_live_orders(self, tick):
+            """ Whether an order to be created or already created sits at grid line `tick` """
+            return tick in self._live_ticks
+
+        def price_to_tick(self, price, round_func=round):
+            """ Map `price` to the index of a grid line relative to `init_price`.
+                Prices on the grid map exactly, other prices are rounded by `round_func`
+            """
+            return self.grid.tick_of(price, round_func=round_func)
+
+        def tick_to_price(self, tick):
+            return self.grid.price_of(tick)
+        
+        def get_tick_grid(self, origin, direction='outer', start=0, count=None):
+            """ Same as `get_price_grid` but yields the ticks of the grid lines """
+            flag = Order.get_direction_flag(self.side, direction=direction)
+            origin_tick = self.grid.ceil_tick(origin) if flag>0 else self.grid.floor_tick(origin)
+            return self._tick_range(origin_tick, flag=flag, start=start, count=count)
+
+        def _tick_range(self, origin_tick, flag, start=0, count=None):
+            length = count if count else self.capacity
+            for i in range(start, length + start):
+                yield origin_tick + flag * i
         
         def get_price_grid(self, origin, direction='outer', start=0, count=None):
             """ Returns a generator of `count` prices on grid, starting from `origin`, towards `direction`, 
@@ -306,15 +589,8 @@ class OrderManager:
                     output => 300, 400 ...
 
             """
-            flag = Order.get_direction_flag(self.side, direction=direction)
-            round_func = math.ceil if flag>0 else math.floor
-            distance = origin - self.init_price
-            origin_on_grid = round_func(distance / self.price_interval) * self.price_interval + self.init_price
-            
-            length = count if count else self.capacity
-            for i in range(start, length + start):
-                price = origin_on_grid + flag * self.price_interval * i
-                yield price
+            for tick in self.get_tick_grid(origin, direction=direction, start=start, count=count):
+                yield self.tick_to_price(tick)
         
         # def to_ideal_size(self, new_price):
         #     """
@@ -379,12 +655,11 @@ class OrderManager:
                 #  Let's try to take the best/worst order from the full list (where OnTraded orders should exist)
                 reference_order = self.worst_order_of_all if direction == "outer" else self.best_order_of_all
             if reference_order:
-                origin = reference_order.price
+                flag = Order.get_direction_flag(self.side, direction=direction)
                 # Since the origin is on the grid, we need to skip it by setting start=1
-                prices = list(self.get_price_grid(origin, direction=direction, start=1, count=count))
-                for price in prices:
-                    self.prepare_order_at_price(price=price)
-                self.sort()
+                ticks = list(self._tick_range(reference_order.tick, flag=flag, start=1, count=count))
+                for tick in ticks:
+                    self.prepare_order_at_tick(tick=tick)
             else:
                 raise ValueError(f"In refill_orders, refrenece_order is None. {self}")
         
@@ -397,11 +672,13 @@ class OrderManager:
                 if not o.status in expected_status:
                     logger.warning(f"Trying to create an opposite order but the reference order {o} is not with status: {expected_status}")
                 
-                new_price = o.get_opponent_price(self.price_interval)
-                filled = self.prepare_order_at_price(price=new_price)
+                new_tick = o.get_opponent_tick()
+                if new_tick is None:
+                    filled = self.prepare_order_at_price(price=o.get_opponent_price(self.price_interval))
+                else:
+                    filled = self.prepare_order_at_tick(tick=new_tick)
                 if filled:
                     filled_count += 1
-            self.sort()
             return filled_count
 
         def shrink_outer(self, count=1):
@@ -411,55 +688,114 @@ class OrderManager:
             for o in self._orders[-count:]:
                 o.mark_cancel()
         
+        def virtual_size(self, inner_tick):
+            """ Number of grid lines on this side of the grid from `inner_tick` to the edge,
+                    i.e. the virtual orders that the live orders are a window of
+            """
+            flag = Order.get_direction_flag(self.side, direction='outer')
+            edge = self.grid.lowest_tick if self.side == OrderSide.Buy else self.grid.highest_tick
+            return max((edge - inner_tick) * flag + 1, 0)
+
+        def slide_window(self, inner_tick, size):
+            """ Slide the window of live orders to `size` grid lines outwards from `inner_tick`
+                    (clipped by the edge of the grid). Only the boundaries of the window are touched:
+                    live orders out of the window are cancelled (orders not created yet are dropped directly)
+                    and the grid lines newly covered are prepared
+            """
+            flag = Order.get_direction_flag(self.side, direction='outer')
+            size = min(size, self.virtual_size(inner_tick))
+
+            def offset_of(order):
+                return (order.tick - inner_tick) * flag
+
+            # Orders beyond the outer boundary, then the ones within the inner boundary
+            order = self.worst_live_order
+            while order and offset_of(order) >= size:
+                self._drop_live_order(order)
+                order = self.worst_live_order
+            order = self.best_live_order
+            while order and offset_of(order) < 0:
+                self._drop_live_order(order)
+                order = self.best_live_order
+
+            best, worst = self.best_live_order, self.worst_live_order
+            if not best:
+                offsets = range(size)
+            elif self.expected_size == offset_of(worst) - offset_of(best) + 1:
+                # No holes in between, only extend both ends
+                offsets = [*range(offset_of(best)), *range(offset_of(worst) + 1, size)]
+            else:
+                offsets = range(size)
+            for offset in offsets:
+                tick = inner_tick + flag * offset
+                if not self._tick_exist_in_live_orders(tick):
+                    self.prepare_order_at_tick(tick=tick)
+
+        def _drop_live_order(self, order: Order):
+            order.mark_cancel()
+            if order.status == OrderStatus.Cancelled:
+                # Not created yet, nothing to cancel on the exchange
+                self._remove_order(order)
+
         def order_create_ok(self, order):
-            if order in self.to_create:
+            if self._has_order(order, status=OrderStatus.ToCreate):
                 order.create_ok()
+                # The order id is assigned by the exchange, index it from now on
+                self.om._index_order(order, stack=self)
             else:
                 self._print_order_not_found_error(order, action='Creating', place='to_create')
 
         def order_create_fail(self, order):
-            if order in self.to_create:
+            if self._has_order(order, status=OrderStatus.ToCreate):
                 order.create_fail()
-                self._orders.remove(order)
+                self._remove_order(order)
             else:
                 self._print_order_not_found_error(order, action='Removing failed', place='to_create')
         
         def order_cancel_ok(self, order):
-            if order in self.to_cancel:
+            if self._has_order(order, status=OrderStatus.ToCancel):
                 order.cancel_ok()
-                self._orders.remove(order)
+                self._remove_order(order)
             else:
                 self._print_order_not_found_error(order, action='Cancelling', place='to_cancel')
 
         def order_force_cancelled(self, order: Order):
-            if order in self._orders:
+            if self._has_order(order):
                 order.cancel_ok(force=True)
-                self._orders.remove(order)
+                self._remove_order(order)
             else:
                 self._print_order_not_found_error(order, action='Force cancelling', place='_orders')
         
         def mark_order_on_traded(self, order: Order):
-            if order in self.active_orders:
+            if self._has_order(order, status=OrderStatus.Created):
                 order.mark_traded()
             else:
                 self._print_order_not_found_error(order, action='Mark Traded', place='active_orders')
         
         def orders_traded(self):
-            for order in self.on_traded_orders:
+            for order in list(self.on_traded_orders):
                 order.trade_ok()
-                self._orders.remove(order)
+                self._remove_order(order)
 
         def cancel_all(self):
-            for order in self.active_orders:
+            for order in list(self.active_orders):
                 order.cancel_ok(force=True)
+            for order in self._orders:
+                order.owner = None
+                self.om._unindex_order(order)
+                self.om.changes.discard(order, order.status)
             self._orders.clear()
+            self._order_set.clear()
+            for bucket in self._buckets.values():
+                bucket.clear()
+            self._live_ticks.clear()
 
         def _print_order_not_found_error(self, order, action='Creating', place='to_create'):
             logger.warning(f"{action} order, however order not found in {place} in {self.side} stack: {order}")
         
         @property
         def expected_size(self):
-            return len(self.get_orders_by_status(status_list=[OrderStatus.ToCreate, OrderStatus.Created]))
+            return len(self.to_create) + len(self.active_orders)
         
         def __repr__(self) -> str:
             return f"OrderStack(side={self.side.value})"
@@ -476,10 +812,30 @@ class OrderManager:
         self.sell_stack = self.OrderStack(om=self, side = OrderSide.Sell)
         self.balance_threshold = balance_threshold
         self.additional_info = additional_info
+        # Index of order_id => (order, stack), maintained by the stacks
+        self._orders_by_id = {}
+        # Orders waiting to be committed, maintained by the stacks
+        self.changes = ChangeSet()
+        # Price table of the grid lines, laid out once the init price is known
+        self.grid = None
+        # Shared by all the orders of this manager
+        self.context = OrderContext(pair=self.pair, user=self.user, exchange=self.exchange, db=self.db,
+                                    price_precision=self.get_additional('price_precision'),
+                                    amount_precision=self.get_additional('amount_precision'))
     
     def init_stacks(self, init_price):
         self.buy_stack.prepare_init(init_price=init_price)
         self.sell_stack.prepare_init(init_price=init_price)
+
+    def init_grid(self, init_price):
+        """ Lay out the price table of the grid around `init_price` (once) """
+        if self.grid is not None and self.grid.init_price == init_price:
+            return
+        precision = self.context.price_precision
+        if precision is None:
+            precision = Order.get_precision('price')
+        self.grid = PriceGrid(init_price=init_price, price_interval=self.price_interval,
+                                grid_num=self.grid_num, price_precision=precision)
     
     @property
     def orders_to_create(self):
@@ -522,6 +878,22 @@ class OrderManager:
     @property
     def active_order_ids(self):
         return [o.order_id for o in self.active_orders]
+
+    def best_active_prices(self):
+        """ Prices of the inner-most active buy and sell orders, None for a stack without active orders """
+        orders = [self.buy_stack.best_order_of_active, self.sell_stack.best_order_of_active]
+        return tuple(o.price if o else None for o in orders)
+
+    def order_ids_in_reach(self, low, high):
+        """ Ids of the active orders the price may have traded through while moving within [low, high]:
+                buy orders at or above `low` and sell orders at or below `high`, inner-most first
+        """
+        buy_tick = self.grid.ceil_tick(low)
+        sell_tick = self.grid.floor_tick(high)
+        # Active orders are sorted from the inner-most, stop at the first one out of reach
+        buy_orders = itertools.takewhile(lambda o: o.tick >= buy_tick, self.buy_stack.active_orders)
+        sell_orders = itertools.takewhile(lambda o: o.tick <= sell_tick, self.sell_stack.active_orders)
+        return [o.order_id for o in itertools.chain(buy_orders, sell_orders)]
     
     # Additional information
     def get_additional(self, key):
@@ -572,14 +944,25 @@ class OrderManager:
 
     def get_order_and_stack_by_order_id(self, order_id):
         """ Find the order and the corresponding stack if exists """
-        order = self.buy_stack.get_order(order_id=order_id)
-        if order:
-            return order, self.buy_stack
-        else:
-            order = self.sell_stack.get_order(order_id=order_id)
-            if order:
-                return order, self.sell_stack
-        return None, None
+        return self.lookup_order_id(order_id)
+
+    def lookup_order_id(self, order_id):
+        """ O(1) lookup of (order, stack) by order_id, (None, None) if not found """
+        if order_id is None:
+            return None, None
+        return self._orders_by_id.get(order_id, (None, None))
+
+    def _index_order(self, order: Order, stack):
+        if order.order_id is not None:
+            self._orders_by_id[order.order_id] = (order, stack)
+
+    def _unindex_order(self, order: Order):
+        order_id = order.order_id
+        if order_id is None:
+            return
+        indexed, _ = self._orders_by_id.get(order_id, (None, None))
+        if indexed is order:
+            del self._orders_by_id[order_id]
             
     def mark_order_on_traded(self, order_id):
         """ Set the status of the order to OnTraded """
@@ -587,11 +970,48 @@ class OrderManager:
         if stack:
             stack.mark_order_on_traded(order)
 
+    def apply_sync_results(self, orders_data, exchange) -> 'SyncResult':
+        """ Apply the orders data retrieved from `exchange` in one pass:
+                fully filled orders are marked OnTraded, cancelled ones are force cancelled
+        """
+        result = SyncResult()
+        traded = []
+        for order_data in orders_data:
+            if exchange.is_order_fullyfilled(order_data=order_data):
+                order, stack = self.lookup_order_id(order_data['order_id'])
+                if order:
+                    order.average_price = order_data['average_price']
+                    traded.append((order, stack))
+                else:
+                    result.missing_order_ids.append(order_data['order_id'])
+            elif exchange.is_order_cancelled(order_data=order_data):
+                order, stack = self.lookup_order_id(order_data['order_id'])
+                if order:
+                    stack.order_force_cancelled(order)
+                    result.cancelled_orders.append(order)
+
+        for order, stack in traded:
+            stack.mark_order_on_traded(order)
+            result.add_traded(order)
+        return result
+
     def orders_traded(self):
         """ Set the status of the orders to Traded """
+        if self.changes.count(OrderStatus.OnTraded) <= 0:
+            return
         self.buy_stack.orders_traded()
         self.sell_stack.orders_traded()
 
+    def pending_changes(self, status):
+        """ Orders waiting to be committed at `status`, buy orders first and each side from the inner-most
+                Orders leave the change set once committed, i.e. on leaving `status`
+        """
+        return sorted(self.changes.get(status), key=self._commit_order_key)
+
+    @staticmethod
+    def _commit_order_key(order: Order):
+        return (order.side != OrderSide.Buy, order.owner._sort_key(order))
+
     # def refill_orders_by_new_price(self, new_price):
     #     self.buy_stack.refill_stack(new_price=new_price)
     #     self.sell_stack.refill_stack(new_price=new_price)
@@ -602,44 +1022,70 @@ class OrderManager:
             # Sell stack takes the priority, i.e. only refill buy stack if sell is not filled
             self.buy_stack.refill_stack_by_pairing(traded_orders=self.sell_stack.on_traded_orders)
 
-    def balance_stacks(self):
+    def balance_stacks(self, price=None):
+        """ Slide the windows of both stacks in one pass when either of them is too thin (or the orders exceed the limit):
+                each stack gets a window of `order_limit // 2` orders, starting from its inner-most live order.
+                A stack without live orders starts from the grid line next to `price`
+                (or two grid lines away from the other stack when `price` is not provided)
+        """
         exp_buy_size = self.buy_stack.expected_size
         exp_sell_size = self.sell_stack.expected_size
-        stack_to_expand = stack_to_shrink = None
 
         logger.debug(f"Expected size "
                     f"[buy: {exp_buy_size}, "
                     f"sell: {exp_sell_size}]")
-        
-        # exceed_limit = exp_buy_size + exp_sell_size > self.order_limit
-        # trigger_balance = min(exp_buy_size, exp_sell_size) <= self.balance_threshold
 
-        # if exceed_limit or trigger_balance:
-        #     self.buy_stack.to_ideal_size(new_price=new_price)
-        #     self.sell_stack.to_ideal_size(new_price=new_price)
-        # return
         exceed_limit = exp_buy_size + exp_sell_size > self.order_limit
-
         if exceed_limit:
             logger.warning(f"The number of orders exceeds the limit {self.order_limit}")
-            pass
-
-        if exp_buy_size <= self.balance_threshold:
-            stack_to_expand = self.buy_stack
-            stack_to_shrink = self.sell_stack
-            size_diff = exp_sell_size - exp_buy_size
-        elif exp_sell_size <= self.balance_threshold:
-            stack_to_expand = self.sell_stack
-            stack_to_shrink = self.buy_stack
-            size_diff = exp_buy_size - exp_sell_size
-        
-        if stack_to_expand and stack_to_shrink:
-            delta = int(size_diff // 2)
-            logger.debug(f"Balancing {delta} orders from "
-                        f"[{stack_to_shrink.side.value}] stack to "
-                        f"[{stack_to_expand.side.value}] stack")
-            stack_to_expand.refill_orders(delta, direction="outer")
-            stack_to_shrink.shrink_outer(delta)
+
+        trigger_balance = min(exp_buy_size, exp_sell_size) <= self.balance_threshold
+        if not (exceed_limit or trigger_balance):
+            return
+
+        buy_tick, sell_tick = self._window_origins(price=price)
+        if buy_tick is None or sell_tick is None:
+            logger.warning(f"Cannot balance the stacks without any live order or the current price.")
+            return
+
+        size = self.order_limit // 2
+        logger.debug(f"Balancing the stacks to {size} orders each from "
+                    f"[buy: {self.buy_stack.tick_to_price(buy_tick)}, "
+                    f"sell: {self.sell_stack.tick_to_price(sell_tick)}]")
+        self.buy_stack.slide_window(inner_tick=buy_tick, size=size)
+        self.sell_stack.slide_window(inner_tick=sell_tick, size=size)
+
+    def recenter(self, cells, price=None):
+        """ Shift the grid by `cells` grid lines (upwards if positive) and slide the windows of both stacks onto it:
+                only the orders falling off one end of the grid are cancelled, the other end is refilled
+        """
+        self.grid.shift(cells)
+        buy_tick, sell_tick = self._window_origins(price=price)
+        if buy_tick is None or sell_tick is None:
+            return
+        size = self.order_limit // 2
+        self.buy_stack.slide_window(inner_tick=buy_tick, size=size)
+        self.sell_stack.slide_window(inner_tick=sell_tick, size=size)
+
+    def _window_origins(self, price=None):
+        """ Ticks of the inner-most grid lines of the buy and sell windows """
+        buy_tick = self.buy_stack.best_live_tick
+        sell_tick = self.sell_stack.best_live_tick
+        if price is not None:
+            if buy_tick is None:
+                # The highest grid line below the price
+                buy_tick = self.grid.ceil_tick(price) - 1
+                if sell_tick is not None:
+                    buy_tick = min(buy_tick, sell_tick - 1)
+            if sell_tick is None:
+                # The lowest grid line above the price
+                sell_tick = self.grid.floor_tick(price) + 1
+                sell_tick = max(sell_tick, buy_tick + 1)
+        elif buy_tick is None and sell_tick is not None:
+            buy_tick = sell_tick - 2
+        elif sell_tick is None and buy_tick is not None:
+            sell_tick = buy_tick + 2
+        return buy_tick, sell_tick
 
 
 ##################
@@ -677,6 +1123,27 @@ class OrderCounter(defaultdict):
         return "[+{}, -{}]".format(self[OrderSide.Buy.value], self[OrderSide.Sell.value])
 
 
+class SyncResult:
+    """ Outcome of applying one sync of orders data to the order manager """
+
+    def __init__(self) -> None:
+        self.counter = OrderCounter()
+        # Orders fully filled in this sync (now OnTraded)
+        self.traded_orders = []
+        # Orders cancelled on the exchange side (now removed)
+        self.cancelled_orders = []
+        # Ids of the fully filled orders which are not managed
+        self.missing_order_ids = []
+
+    def add_traded(self, order: Order):
+        self.traded_orders.append(order)
+        self.counter.increase(order.side)
+
+    @property
+    def total_traded(self):
+        return len(self.traded_orders) + len(self.missing_order_ids)
+
+
 init_formatted_properties(Order)
 
 
@@ -0,0 +1,100 @@
+import sys
+sys.path.append('.')
+
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """ Decide how long a bot sleeps before the next sync.
+            The interval drops to `min_interval` right after fills or when the price is within
+            `near_ratio` * price_interval of a live order, and backs off by `backoff` up to `max_interval`
+            while the price sits mid-cell.
+            With `api_budget` (API calls per minute), syncs are delayed once the calls of the last minute and the next sync
+            would go over it. The calls are counted by the exchange client of the bot (`Exchange.api_calls`: the private
+            calls, e.g. one per order created, and the tickers), the next sync is expected to make as many as the last one.
+            A sync counts as one call if the exchange does not count them
+    """
+    budget_window_sec = 60
+
+    def __init__(self, check_interval, min_interval=None, max_interval=None, near_ratio=0.2, backoff=1.5,
+                api_budget=None) -> None:
+        self.check_interval = check_interval
+        self.min_interval = check_interval if min_interval is None else min(min_interval, check_interval)
+        self.max_interval = check_interval if max_interval is None else max(max_interval, check_interval)
+        self.near_ratio = near_ratio
+        self.backoff = backoff
+        self.api_budget = api_budget
+        self._interval = check_interval
+        self._last_traded_total = None
+        # (time, API calls) of the syncs in the budget window
+        self._syncs = deque()
+        self._last_api_calls = None
+
+    @property
+    def adaptive(self):
+        return self.min_interval < self.max_interval
+
+    def next_interval(self, bot, synced_at=None):
+        """ Seconds from the start of the last sync (at `synced_at`) to the start of the next one """
+        synced_at = time.time() if synced_at is None else synced_at
+        self._record_sync(synced_at, self._api_calls_since_last(bot))
+
+        traded_total = bot.traded_count.total
+        traded = self._last_traded_total is not None and traded_total != self._last_traded_total
+        self._last_traded_total = traded_total
+
+        if not self.adaptive:
+            interval = self.check_interval
+        elif traded or self._near_live_order(bot):
+            interval = self.min_interval
+        else:
+            interval = min(max(self._interval, self.check_interval) * self.backoff, self.max_interval)
+        self._interval = interval
+        return max(interval, self._budget_delay(synced_at))
+
+    def _near_live_order(self, bot):
+        """ Whether the latest price is close enough to the inner-most live order of either side """
+        price_info = bot.price_info
+        if not price_info or not bot.om:
+            # Nothing known about the price, stay alert
+            return True
+        price = price_info['price']
+        threshold = self.near_ratio * bot.om.price_interval
+        best_buy, best_sell = bot.om.best_active_prices()
+        return (best_buy is not None and price - best_buy <= threshold) or \
+            (best_sell is not None and best_sell - price <= threshold)
+
+    def _api_calls_since_last(self, bot):
+        """ API calls made by the bot since the last sync recorded """
+        api_calls = getattr(getattr(bot, 'exchange', None), 'api_calls', None)
+        if api_calls is None:
+            return 1
+        last, self._last_api_calls = self._last_api_calls, api_calls
+        return api_calls - (last or 0)
+
+    def _record_sync(self, synced_at, api_calls):
+        self._syncs.append((synced_at, api_calls))
+        while self._syncs and self._syncs[0][0] <= synced_at - self.budget_window_sec:
+            self._syncs.popleft()
+
+    def _budget_delay(self, synced_at):
+        """ Seconds to wait until the calls of the next sync fit in the API budget """
+        if not self.api_budget:
+            return 0
+        expected = self._syncs[-1][1]
+        used = sum(calls for _, calls in self._syncs)
+        wait_until = synced_at
+        for sync_time, calls in self._syncs:
+            if used + expected <= self.api_budget:
+                break
+            # Wait for the calls of this sync to leave the window
+            used -= calls
+            wait_until = sync_time + self.budget_window_sec
+        return max(wait_until - synced_at, 0)
+
+    def __repr__(self) -> str:
+        return f"PollScheduler({self.min_interval} ~ {self.max_interval} s, budget={self.api_budget} calls/min)"
@@ -0,0 +1,255 @@
+"""
+Run the bots of `grid_bots` sharded across `workers` processes.
+1. Each worker process runs the multi-bot loop of `main.run_supervisor` for its shard
+2. The private API calls of all the workers share one rate limit budget and one nonce sequence (in shared memory)
+3. The parent process restarts crashed or hung workers and aggregates the stats of the bots
+"""
+
+
+import os
+import sys
+import time
+import copy
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+from exchanges import SharedRateLimiter, SharedNonce
+from utils import read_config, config_logging, set_lvl_for_imported_lib
+
+logger = logging.getLogger(__name__)
+
+
+def shard_bot_entries(entries, workers):
+    """ Split the `grid_bots` entries into at most `workers` shards of similar size """
+    shards = [entries[i::workers] for i in range(workers)]
+    return [shard for shard in shards if shard]
+
+
+def run_launcher(config_file):
+    config = read_config(fn=config_file)
+    config_logging(config.get('logging', None))
+    Launcher(config=config).run()
+
+
+class Launcher:
+    """ Parent process of the workers.
+            A worker is restarted when its process exits or it stops sending the stats for `heartbeat_timeout` seconds
+    """
+
+    def __init__(self, config, ctx=None) -> None:
+        self.config = config
+        fleet_config = config.get('fleet', {})
+        self.stats_interval = fleet_config.get('stats_interval', 10)
+        self.heartbeat_timeout = fleet_config.get('heartbeat_timeout', self.stats_interval * 6)
+        self.restart_delay = fleet_config.get('restart_delay', 10)
+        self.report_interval = fleet_config.get('report_interval', 60)
+
+        self.ctx = ctx or multiprocessing.get_context()
+        rate_limit = config['api'].get('rate_limit')
+        self.rate_limiter = SharedRateLimiter(rate=rate_limit, ctx=self.ctx) if rate_limit else None
+        # The workers sign with the same API key, the nonces must increase across them
+        self.nonce = SharedNonce(ctx=self.ctx)
+        self.stats_queue = self.ctx.Queue()
+        self.workers = [Worker(index=i, bot_entries=shard)
+                        for i, shard in enumerate(shard_bot_entries(config['grid_bots'], config.get('workers', 1)))]
+        self._last_report_time = 0
+        # Entry of the worker processes
+        self.worker_target = run_worker
+
+    def run(self):
+        # `docker stop` only signals the parent, stop the workers gracefully in that case
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        interrupted = False
+        for worker in self.workers:
+            self.start_worker(worker)
+        try:
+            while True:
+                self.receive_stats(timeout=1)
+                self.check_workers()
+                self.report()
+        except KeyboardInterrupt:
+            # The workers are interrupted along with the parent
+            interrupted = True
+            logger.info(f"On KeyboardInterrupt, wait for the workers to stop the bots...")
+        finally:
+            self.stop_workers(interrupt=not interrupted)
+
+    def start_worker(self, worker):
+        config = dict(self.config, grid_bots=worker.bot_entries,
+                    logging=worker_logging_config(self.config.get('logging', None), index=worker.index))
+        worker.process = self.ctx.Process(target=self.worker_target, name=f"gridbot-worker-{worker.index}",
+                                        args=(config, worker.index, self.rate_limiter, self.nonce, self.stats_queue,
+                                            self.stats_interval),
+                                        daemon=False)
+        worker.process.start()
+        worker.started_at = worker.last_seen = time.time()
+        logger.info(f"Worker {worker.index} (pid {worker.process.pid}) started with pairs: {worker.pairs}")
+
+    def receive_stats(self, timeout):
+        """ Collect the stats sent by the workers, which are the heartbeats as well """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                index, sent_at, stats = self.stats_queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return
+            worker = self.workers[index]
+            worker.last_seen = max(worker.last_seen, sent_at)
+            worker.stats = stats
+
+    def check_workers(self):
+        """ Restart the workers exited or hung, without waiting for any of them: a hung worker is interrupted
+                and killed by a later check if it is still alive after `heartbeat_timeout`
+        """
+        now = time.time()
+        for worker in self.workers:
+            if worker.kill_deadline is not None:
+                self._check_stopping_worker(worker, now)
+                continue
+            if worker.process.is_alive() and now - worker.last_seen <= self.heartbeat_timeout:
+                continue
+            if now - worker.started_at < self.restart_delay:
+                # Give a crashing worker some time before restarting it again
+                continue
+            if worker.process.is_alive():
+                logger.error(f"Worker {worker.index} has not reported for {now - worker.last_seen:.0f}s. Restart it.")
+                # Let the bots cancel their orders
+                os.kill(worker.process.pid, signal.SIGINT)
+                worker.kill_deadline = now + self.heartbeat_timeout
+                continue
+            worker.process.join()
+            logger.error(f"Worker {worker.index} exited with code {worker.process.exitcode}. Restart it.")
+            self.restart_worker(worker)
+
+    def _check_stopping_worker(self, worker, now):
+        """ Restart the interrupted `worker` once it exits, kill it when it does not exit in time """
+        if worker.process.is_alive():
+            if now >= worker.kill_deadline:
+                logger.error(f"Worker {worker.index} does not stop in {self.heartbeat_timeout}s. "
+                            f"Kill it, please check the orders manually!")
+                worker.process.kill()
+                # Restarted once it is gone
+                worker.kill_deadline = float('inf')
+            return
+        worker.process.join()
+        worker.kill_deadline = None
+        self.restart_worker(worker)
+
+    def restart_worker(self, worker):
+        worker.restarts += 1
+        self.start_worker(worker)
+
+    def aggregate_stats(self):
+        """ Stats of all the bots summed up """
+        bots = [stats for worker in self.workers for stats in worker.stats]
+        traded_count = {}
+        for stats in bots:
+            for side, count in stats['traded_count'].items():
+                traded_count[side] = traded_count.get(side, 0) + count
+        # The bots of a worker share one http pool, count each pool once
+        pools = {stats['http']['pool']: stats['http'] for stats in bots if stats.get('http')}
+        http = {key: sum(pool[key] for pool in pools.values()) for key in ['requests', 'connections', 'reused', 'errors']}
+        return {
+            'workers': len(self.workers),
+            'alive_workers': sum(worker.process.is_alive() for worker in self.workers),
+            'restarts': sum(worker.restarts for worker in self.workers),
+            'bots': len(bots),
+            'active_orders': sum(stats['active_orders'] for stats in bots),
+            'traded_count': traded_count,
+            'http': http,
+        }
+
+    def report(self):
+        now = time.time()
+        if now - self._last_report_time < self.report_interval:
+            return
+        self._last_report_time = now
+        logger.info(f"Fleet stats: {self.aggregate_stats()}")
+
+    def stop_workers(self, interrupt=True):
+        for worker in self.workers:
+            if worker.process is not None:
+                stop_process(worker.process, interrupt=interrupt, timeout=self.heartbeat_timeout)
+
+
+class Worker:
+    """ A worker process running the bots of one shard """
+
+    def __init__(self, index, bot_entries) -> None:
+        self.index = index
+        self.bot_entries = bot_entries
+        self.process = None
+        self.started_at = 0
+        # Time of the latest stats (heartbeat) received
+        self.last_seen = 0
+        self.restarts = 0
+        self.stats = []
+        # Set while a hung worker is being stopped: it is killed if still alive at this time
+        self.kill_deadline = None
+
+    @property
+    def pairs(self):
+        return [entry['pair'] for entry in self.bot_entries]
+
+
+def stop_process(process, interrupt=True, timeout=60):
+    """ Let the bots in `process` cancel their orders (on SIGINT), kill the process if it does not stop in time """
+    if interrupt and process.is_alive():
+        os.kill(process.pid, signal.SIGINT)
+    process.join(timeout)
+    if process.is_alive():
+        logger.error(f"{process.name} does not stop in {timeout}s. Kill it, please check the orders manually!")
+        process.kill()
+        process.join()
+
+
+def worker_logging_config(logging_config, index):
+    """ Each worker logs into its own file: app.log => app.worker0.log """
+    logging_config = copy.deepcopy(logging_config) if logging_config else {}
+    file_config = logging_config.get('file', {})
+    if file_config.get('path'):
+        root, ext = os.path.splitext(file_config['path'])
+        file_config['path'] = f"{root}.worker{index}{ext}"
+    return logging_config
+
+
+def run_worker(config, index, rate_limiter, nonce, stats_queue, stats_interval):
+    """ Entry of the worker processes """
+    # Imported here as `main` runs the launcher
+    from main import setup_fsm, setup_discord, create_http_pool
+
+    set_lvl_for_imported_lib()
+    config_logging(config.get('logging', None))
+    fsm = setup_fsm(config=config)
+    # The connections can not be shared across processes, one pool per worker
+    http_pool = create_http_pool(config=config)
+    discord = setup_discord(config=config, http_pool=http_pool)
+    try:
+        asyncio.run(run_worker_bots(config=config, fsm=fsm, discord=discord, index=index, rate_limiter=rate_limiter,
+                                    stats_queue=stats_queue, stats_interval=stats_interval, http_pool=http_pool,
+                                    nonce=nonce))
+    except KeyboardInterrupt:
+        logger.info(f"Worker {index}: on KeyboardInterrupt, all the bots are stopped")
+
+
+async def run_worker_bots(config, fsm, discord, index, rate_limiter, stats_queue, stats_interval, http_pool=None,
+                        nonce=None):
+    from main import run_async_grid_bots
+
+    registry = {}
+    reporter = asyncio.ensure_future(report_stats(index=index, registry=registry, stats_queue=stats_queue,
+                                                interval=stats_interval))
+    try:
+        await run_async_grid_bots(config=config, fsm=fsm, discord=discord, rate_limiter=rate_limiter, registry=registry,
+                                http_pool=http_pool, nonce=nonce)
+    finally:
+        reporter.cancel()
+
+
+async def report_stats(index, registry, stats_queue, interval):
+    """ Send the stats of the bots to the parent from time to time, which are the heartbeats of the worker as well """
+    while True:
+        stats_queue.put((index, time.time(), [bot.get_stats() for bot in list(registry.values())]))
+        await asyncio.sleep(interval)
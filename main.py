@@ -7,13 +7,18 @@
 """
 
 
+import os
 import sys
 import time
+import asyncio
 import requests
 import logging
-from grid_trade import GridBot, set_precision
-from exchanges import Bitbank
-from utils import read_config, config_logging, set_lvl_for_imported_lib
+from concurrent.futures import ThreadPoolExecutor
+from grid_trade import GridBot, AsyncGridBot
+from grid_trade.async_bot import BackgroundCalls
+from grid_trade.scheduler import PollScheduler
+from exchanges import Bitbank, RateLimiter, HttpPool, LocalStream, BitbankStream
+from utils import read_config, config_logging, set_lvl_for_imported_lib, make_async
 from db.manager import FireStoreManager
 from notification import Discord
 
@@ -26,7 +31,14 @@ def main():
         config_file = sys.argv[1]
     else:
         config_file = './configs/config.yml'
-    run_grid_bot(config_file)
+    config = read_config(fn=config_file)
+    if config.get('grid_bots') and config.get('workers', 1) > 1:
+        from launcher import run_launcher
+        run_launcher(config_file)
+    elif config.get('grid_bots'):
+        run_supervisor(config_file)
+    else:
+        run_grid_bot(config_file)
 
 
 def run_grid_bot(config_file):
@@ -35,61 +47,64 @@ def run_grid_bot(config_file):
 
     fsm = setup_fsm(config=config)
 
-    api_key = config['api']['key']
-    api_secret = config['api']['secret']
-
     bot_config = config['grid_bot']
-    pair = bot_config['pair']
-    grid_num = bot_config['grid_num']
-    base_usage = bot_config['base_usage']
-    quote_usage = bot_config['quote_usage']
-    price_interval = bot_config['price_interval']
-    check_interval = bot_config['check_interval']
-    order_limit = bot_config['order_limit']
     reset_interval_sec = bot_config.get('reset_interval', 99999) * 60 * 60
-    report_interval_sec = bot_config.get('report_interval', 99999) * 60 * 60
+    engine = bot_config.get('engine', 'sync')
 
-    user = config['user']['name']
-
-    discord_info_webhook = config['discord']['info']
-    discord_error_webhook = config['discord']['error']
-    discord = Discord(info_webhook=discord_info_webhook, err_webhook=discord_error_webhook)
+    # Keep-alive connections shared by the exchange client and the notifier
+    http_pool = create_http_pool(config=config)
+    discord = setup_discord(config=config, http_pool=http_pool)
     
-    ex = Bitbank(pair=pair, api_key=api_key, api_secret=api_secret, max_order_count=order_limit)
+    ex = create_exchange(config=config, bot_config=bot_config, http_pool=http_pool)
 
     bot = None
 
-    additional_info = {
-        'pair': pair,
-        'user': user,
-        'exchange': ex.name,
-        'db': fsm,  # Comment this line out if you don't need to store data to db
-        'notifier': discord,
-        'report_interval_sec': report_interval_sec,
-    }
-
-    try:
-        while True:
-            init_price = ex.get_mid_price()
-            basic_info = ex.get_basic_info()
+    additional_info = create_additional_info(config=config, bot_config=bot_config, ex=ex, db=fsm, notifier=discord)
 
-            set_precision(price_precision=basic_info['price_digits'], amount_precision=basic_info['amount_digits'])
+    stream = create_stream(config=config, ex=ex)
+    if stream:
+        stream.start()
 
-            assets = ex.get_assets()
-            init_base = assets['base_amount'] * base_usage
-            init_quote = assets['quote_amount'] * quote_usage
+    if engine == 'async':
+        try:
+            asyncio.run(run_async_grid_bot(ex=ex, bot_config=bot_config, additional_info=additional_info, stream=stream))
+        finally:
+            if stream:
+                stream.stop()
+        return
 
+    warm_restart = bot_config.get('restart', 'cold') == 'warm'
+    # Orders left by the last bot (e.g., of the last run) to adopt
+    snapshot = GridBot.load_snapshot(additional_info['snapshot_path']) if warm_restart else None
+    # Orders handed over and owned by no running bot until the next bot adopts them
+    handed_over = snapshot
+    try:
+        while True:
             bot = GridBot(exchange=ex)
-            param = bot.Parameter.calc_grid_params_by_interval(init_base=init_base, init_quote=init_quote, init_price=init_price,
-                                                    price_interval=price_interval, grid_num=grid_num, pair=pair, fee=basic_info['fee'])
+            param = create_param(ex=ex, bot_config=bot_config, snapshot=snapshot)
 
-            bot.init_and_start(param=param, additional_info=additional_info)
+            if snapshot:
+                bot.warm_start(param=param, additional_info=additional_info, snapshot=snapshot)
+            else:
+                bot.init_and_start(param=param, additional_info=additional_info)
+            handed_over = None
+            if stream:
+                # The polling below stays as the backstop of the events
+                stream.subscribe(ex.pair, bot.on_stream_event)
+            scheduler = create_scheduler(bot_config=bot_config)
             while True:
                 now = time.time()
 
                 if now - bot.started_at > reset_interval_sec:
                     # Stop this bot and restart a new bot
-                    bot.cancel_and_stop()
+                    if stream:
+                        stream.unsubscribe(ex.pair, bot.on_stream_event)
+                    if warm_restart:
+                        # The next bot takes over the orders still on its grid
+                        bot.stop_and_hand_over()
+                        snapshot = handed_over = bot.snapshot()
+                    else:
+                        bot.cancel_and_stop()
                     time.sleep(0.5)
                     break
                 
@@ -99,7 +114,7 @@ def run_grid_bot(config_file):
                     discord.error(e)
 
                 elapsed = time.time() - now
-                to_sleep = check_interval - elapsed
+                to_sleep = scheduler.next_interval(bot, synced_at=now) - elapsed
                 if to_sleep > 0:
                     
                     # logger.debug(f"Sleep for: {to_sleep:.3f}s")
@@ -110,8 +125,237 @@ def run_grid_bot(config_file):
         msg = f"Unknown error stopping the bot: {e}"
         discord.error(msg)
     finally:
+        if stream:
+            stream.stop()
         if bot:
             bot.cancel_and_stop()
+        if handed_over and not (bot and bot.om):
+            # The next bot failed to start
+            cancel_handed_over_orders(ex=ex, snapshot=handed_over, notifier=discord)
+
+
+async def run_async_grid_bot(ex, bot_config, additional_info, registry=None, key=None, stream=None):
+    """ Same as the loop in `run_grid_bot` but driven by the event loop, many of these can run on one loop.
+            The running bot is kept in `registry[key]` (if provided), and receives the events of `stream` (if provided)
+    """
+    reset_interval_sec = bot_config.get('reset_interval', 99999) * 60 * 60
+    discord = additional_info['notifier']
+    warm_restart = bot_config.get('restart', 'cold') == 'warm'
+    snapshot = GridBot.load_snapshot(additional_info['snapshot_path']) if warm_restart else None
+    handed_over = snapshot
+
+    bot = None
+    try:
+        while True:
+            bot = AsyncGridBot(exchange=ex)
+            if registry is not None:
+                registry[key] = bot
+            param = await make_async(create_param, ex=ex, bot_config=bot_config, snapshot=snapshot)
+
+            if snapshot:
+                await bot.warm_start(param=param, additional_info=additional_info, snapshot=snapshot)
+            else:
+                await bot.init_and_start(param=param, additional_info=additional_info)
+            handed_over = None
+            if stream:
+                stream.subscribe(ex.pair, bot.on_stream_event)
+            scheduler = create_scheduler(bot_config=bot_config)
+            while True:
+                now = time.time()
+
+                if now - bot.started_at > reset_interval_sec:
+                    # Stop this bot and restart a new bot
+                    if stream:
+                        stream.unsubscribe(ex.pair, bot.on_stream_event)
+                    if warm_restart:
+                        await bot.stop_and_hand_over()
+                        snapshot = handed_over = bot.snapshot()
+                    else:
+                        await bot.cancel_and_stop()
+                    await asyncio.sleep(0.5)
+                    break
+
+                try:
+                    await bot.sync_and_adjust()
+                except requests.exceptions.ConnectionError as e:
+                    discord.error(e)
+
+                elapsed = time.time() - now
+                to_sleep = scheduler.next_interval(bot, synced_at=now) - elapsed
+                if to_sleep > 0:
+                    await asyncio.sleep(to_sleep)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info(f"On cancellation, cancel all orders and stop the bot...")
+    except Exception as e:
+        msg = f"Unknown error stopping the bot: {e}"
+        discord.error(msg)
+    finally:
+        if bot:
+            if stream:
+                stream.unsubscribe(ex.pair, bot.on_stream_event)
+            await bot.cancel_and_stop()
+        if handed_over and not (bot and bot.om):
+            await make_async(cancel_handed_over_orders, ex=ex, snapshot=handed_over, notifier=discord)
+
+
+def cancel_handed_over_orders(ex, snapshot, notifier):
+    """ Cancel the orders left by `GridBot.stop_and_hand_over` when no bot adopted them """
+    order_ids = [o['order_id'] for o in snapshot['orders']]
+    if not order_ids:
+        return
+    try:
+        ex.cancel_orders(order_ids)
+        notifier.error(f"The next bot failed to start, cancelled the orders handed over to it: {order_ids}")
+    except Exception as e:
+        notifier.error(f"Cancel orders handed over failed for {ex} for orders: {order_ids}. Please check manually!")
+
+
+def run_supervisor(config_file):
+    """ Run all the bots listed in `grid_bots` in one process, each entry overrides the settings of `grid_bot`.
+            The bots run on one event loop and share the exchange clients (connections, rate limiter),
+            the notifier and the db writer. Each bot keeps the precision of its own pair
+    """
+    config = read_config(fn=config_file)
+    config_logging(config.get('logging', None))
+
+    fsm = setup_fsm(config=config)
+    http_pool = create_http_pool(config=config)
+    discord = setup_discord(config=config, http_pool=http_pool)
+    try:
+        asyncio.run(run_async_grid_bots(config=config, fsm=fsm, discord=discord, http_pool=http_pool))
+    except KeyboardInterrupt:
+        logger.info(f"On KeyboardInterrupt, all the bots are stopped")
+
+
+async def run_async_grid_bots(config, fsm, discord, rate_limiter=None, registry=None, http_pool=None, nonce=None):
+    """ Run the bots of `grid_bots` on the running loop, `registry` (if provided) keeps the bots by index """
+    bot_configs = [{**config['grid_bot'], **entry} for entry in config['grid_bots']]
+    executor = ThreadPoolExecutor(max_workers=config.get('api', {}).get('max_connections', 16),
+                                thread_name_prefix='gridbots')
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    # Shared by all the bots: db writes and notifications are sent one after another in the background
+    db = BackgroundCalls(fsm, executor=executor) if fsm else None
+    notifier = BackgroundCalls(discord, executor=executor)
+    base_ex = create_exchange(config=config, bot_config=bot_configs[0], rate_limiter=rate_limiter, http_pool=http_pool,
+                            nonce=nonce)
+    # One stream (connection) for the events of all the pairs
+    stream = create_stream(config=config, ex=base_ex)
+    if stream:
+        await make_async(stream.start, executor=executor)
+
+    runners = []
+    for i, bot_config in enumerate(bot_configs):
+        ex = base_ex.with_pair(bot_config['pair'], max_order_count=bot_config['order_limit'])
+        additional_info = create_additional_info(config=config, bot_config=bot_config, ex=ex, db=db, notifier=notifier)
+        runners.append(run_async_grid_bot(ex=ex, bot_config=bot_config, additional_info=additional_info,
+                                        registry=registry, key=i, stream=stream))
+    logger.info(f"Running {len(runners)} bots: {[c['pair'] for c in bot_configs]}")
+    try:
+        await asyncio.gather(*runners)
+    finally:
+        if stream:
+            stream.stop()
+
+
+def create_exchange(config, bot_config, rate_limiter=None, http_pool=None, nonce=None):
+    """ Bitbank client of the pair of `bot_config`, with a new rate limiter / http pool / nonce if not provided """
+    api_config = config['api']
+    rate_limit = api_config.get('rate_limit')
+    if rate_limiter is None and rate_limit:
+        rate_limiter = RateLimiter(rate=rate_limit)
+    if http_pool is None:
+        http_pool = create_http_pool(config=config)
+    return Bitbank(pair=bot_config['pair'], api_key=api_config['key'], api_secret=api_config['secret'],
+                    max_order_count=bot_config['order_limit'], rate_limiter=rate_limiter, http_pool=http_pool,
+                    nonce=nonce)
+
+
+def create_http_pool(config):
+    """ Keep-alive connections to the exchange (and the webhooks), as many as the threads calling the exchange """
+    api_config = config.get('api', {})
+    http_config = api_config.get('http', {})
+    return HttpPool(pool_size=http_config.get('pool_size', api_config.get('max_connections', 16)),
+                    connect_timeout=http_config.get('connect_timeout', 3.05),
+                    read_timeout=http_config.get('read_timeout', 10),
+                    max_retries=http_config.get('max_retries', 0))
+
+
+def create_stream(config, ex):
+    """ Stream pushing the ticker and the order / trade events to the bots, None to rely on the polling only """
+    stream_config = config.get('stream')
+    if not stream_config:
+        return None
+    source = stream_config.get('source', 'bitbank')
+    if source == 'local':
+        return LocalStream(host=stream_config.get('host', '127.0.0.1'), port=stream_config.get('port', 8765))
+    if source == 'bitbank':
+        return BitbankStream(exchange=ex)
+    raise ValueError(f"Unknown stream source: {source}")
+
+
+def create_additional_info(config, bot_config, ex, db, notifier):
+    return {
+        'pair': bot_config['pair'],
+        'user': config['user']['name'],
+        'exchange': ex.name,
+        'db': db,  # Comment this line out if you don't need to store data to db
+        'notifier': notifier,
+        'report_interval_sec': bot_config.get('report_interval', 99999) * 60 * 60,
+        'order_storage': bot_config.get('order_storage', 'object'),
+        'create_concurrency': bot_config.get('create_concurrency', 1),
+        'order_polling': bot_config.get('order_polling', 'full'),
+        'full_sweep_interval_sec': bot_config.get('full_sweep_interval', 60),
+        'fill_detection': bot_config.get('fill_detection', 'status'),
+        'recenter_drift': bot_config.get('recenter_drift'),
+        'latency_window': bot_config.get('latency_window', 1024),
+        'snapshot_path': create_snapshot_path(bot_config),
+    }
+
+
+def create_snapshot_path(bot_config):
+    """ Local snapshot of the bot of the pair, kept for the warm restart """
+    snapshot_dir = bot_config.get('snapshot_dir')
+    if not snapshot_dir:
+        return None
+    os.makedirs(snapshot_dir, exist_ok=True)
+    return os.path.join(snapshot_dir, f"{bot_config['pair']}.json")
+
+
+def create_param(ex, bot_config, snapshot=None):
+    """ Calculate the grid parameter from the current price and assets, with the precision of the pair.
+            With `snapshot`, the grid is aligned with the grid of that bot for its orders to be adopted
+    """
+    init_price = ex.get_mid_price()
+    basic_info = ex.get_basic_info()
+
+    assets = ex.get_assets()
+    init_base = assets['base_amount'] * bot_config['base_usage']
+    init_quote = assets['quote_amount'] * bot_config['quote_usage']
+
+    param = GridBot.Parameter.calc_grid_params_by_interval(init_base=init_base, init_quote=init_quote, init_price=init_price,
+                                            price_interval=bot_config['price_interval'], grid_num=bot_config['grid_num'],
+                                            pair=bot_config['pair'], fee=basic_info['fee'],
+                                            price_precision=basic_info['price_digits'],
+                                            amount_precision=basic_info['amount_digits'])
+    if snapshot:
+        param.align_with(GridBot.Parameter.from_dict(snapshot['param']))
+    return param
+
+
+def setup_discord(config, http_pool=None):
+    discord_info_webhook = config['discord']['info']
+    discord_error_webhook = config['discord']['error']
+    return Discord(info_webhook=discord_info_webhook, err_webhook=discord_error_webhook, http_pool=http_pool)
+
+
+def create_scheduler(bot_config):
+    """ Sync interval scheduler, a fixed `check_interval` unless the min / max intervals are configured """
+    return PollScheduler(check_interval=bot_config['check_interval'],
+                        min_interval=bot_config.get('min_check_interval'),
+                        max_interval=bot_config.get('max_check_interval'),
+                        near_ratio=bot_config.get('near_order_ratio', 0.2),
+                        api_budget=bot_config.get('api_budget'))
 
 
 def setup_fsm(config):
@@ -9,11 +9,13 @@ class Discord:
     color_buy = 43127
     color_sell = 15859772
 
-    def __init__(self, info_webhook, err_webhook, also_print=True, no_http=False) -> None:
+    def __init__(self, info_webhook, err_webhook, also_print=True, no_http=False, http_pool=None) -> None:
         self.info_webhook = info_webhook
         self.err_webhook = err_webhook
         self.also_print = also_print
         self.no_http = no_http
+        # Keep-alive connections (e.g., `exchanges.HttpPool` shared with the exchange), a new connection per message if None
+        self.http_pool = http_pool
 
     def info(self, message, logger=None):
         self.send(message=message, info_type='info', logger=logger)
@@ -64,7 +66,8 @@ class Discord:
         headers = {
             'Content-Type': 'application/json',
         }
-        requests.request("POST", url, headers=headers, data=payload)
+        http = self.http_pool or requests
+        http.request("POST", url, headers=headers, data=payload)
 
     @staticmethod
     def get_traceback_message():
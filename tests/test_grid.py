@@ -0,0 +1,71 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import pytest
+from grid_trade.grid import PriceGrid
+
+
+class TestPriceGrid:
+
+    def setup_method(self, method):
+        self.grid = PriceGrid(init_price=10000, price_interval=100, grid_num=10, price_precision=0)
+
+    def test_table(self):
+        grid = self.grid
+        assert len(grid) == 11
+        assert grid.lowest_price == 9500 and grid.highest_price == 10500
+        assert list(grid.prices[:3]) == [9500, 9600, 9700]
+        with pytest.raises(ValueError):
+            grid.prices[0] = 0
+
+        assert grid.price_of(-5) == 9500
+        assert grid.price_of(0) == 10000
+        # Out of the table
+        assert grid.price_of(7) == 10700
+        assert grid.tick_of(10200) == 2
+        assert grid.tick_of(10720) == 7
+
+    def test_nearest_ticks(self):
+        grid = self.grid
+        assert grid.floor_tick(10250) == 2
+        assert grid.ceil_tick(10250) == 3
+        assert grid.floor_tick(10200) == grid.ceil_tick(10200) == 2
+        assert grid.floor_tick(10000.0000000001) == 0
+        assert grid.ceil_tick(9999.9999999999) == 0
+        # Out of the table
+        assert grid.floor_tick(10650) == 6
+        assert grid.ceil_tick(9350) == -6
+
+    def test_shift(self):
+        grid = self.grid
+        table = grid.prices
+        grid.shift(3)
+        assert grid.lowest_price == 9800 and grid.highest_price == 10800
+        assert grid.center_tick == 3 and grid.center_price == 10300
+        # The ticks of the prices stay the same
+        assert grid.tick_of(10200) == 2
+        assert grid.floor_tick(10750) == 7
+        grid.shift(-5)
+        assert (grid.lowest_tick, grid.highest_tick) == (-7, 3)
+        assert grid.lowest_price == 9300
+        assert grid.floor_tick(9350) == -7 and grid.ceil_tick(10450) == 5
+        # Shifting does not lay out the table again
+        assert grid.prices is table and len(grid) == 11
+
+    def test_fractional_prices(self):
+        grid = PriceGrid(init_price=1.2, price_interval=0.1, grid_num=10, price_precision=1)
+        assert grid.price_of(-3) == 0.9
+        assert grid.tick_of(0.30000000000000004 + 0.9) == 0
+        assert grid.floor_tick(1.25) == 0
+        assert grid.ceil_tick(1.25) == 1
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
@@ -3,12 +3,16 @@
 import sys
 sys.path.append('.')
 
+import time
+import asyncio
+import threading
 import requests
 import pytest
 import python_bitbankcc
-from grid_trade import GridBot, set_precision
+from grid_trade import GridBot, AsyncGridBot, set_precision
 from grid_trade.orders import Order, OrderSide, OrderCounter
-from exchanges import Bitbank
+from exchanges import Exchange, Bitbank, LocalStream, LocalStreamServer
+from exchanges import bitbank
 import logging
 from utils import setup_logging
 
@@ -44,7 +48,7 @@ source = {
 
 
 class BitbankPublicMock:
-    def __init__(self) -> None:
+    def __init__(self, *args, **kwargs) -> None:
         self.ticker_count = -1
 
     def get_ticker(self, pair):
@@ -83,6 +87,116 @@ class BitbankPrivateMock:
         return {'orders': orders}
 
 
+class FakeExchange(Exchange):
+    """ An in-memory exchange: orders are filled once the price set by `move_to` crosses them """
+    name = 'fake'
+
+    def __init__(self, price, max_order_count=4, delay=0) -> None:
+        super().__init__(pair='eth_jpy', max_order_count=max_order_count)
+        self.price = price
+        self.orders = {}
+        self.next_id = 0
+        self.calls = []
+        # Seconds each order creation takes, and the creations in flight
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.creating = 0
+        self.max_creating = 0
+        self.created_prices = []
+        self.polled_ids = []
+        self.trades = []
+        # Miliseconds the clock of the exchange is ahead of the local one
+        self.clock_offset = 0
+
+    def move_to(self, price):
+        self.price = price
+        for od in self.orders.values():
+            if od['status'] not in [OrderStatus.Unfilled.value, OrderStatus.PartiallyFilled.value]:
+                continue
+            if (od['side'] == 'buy' and od['price'] >= price) or (od['side'] == 'sell' and od['price'] <= price):
+                self.fill(od['order_id'], od['remaining_amount'])
+
+    def fill(self, order_id, amount):
+        od = self.orders[order_id]
+        od['remaining_amount'] = round(od['remaining_amount'] - amount, 8)
+        od['status'] = OrderStatus.FullyFilled.value if od['remaining_amount'] <= 0 else OrderStatus.PartiallyFilled.value
+        self.trades.append({'trade_id': len(self.trades) + 1, 'order_id': order_id, 'amount': str(amount),
+                            'price': str(od['price']), 'executed_at': int(time.time() * 1000) + self.clock_offset})
+
+    def get_latest_prices(self):
+        self.calls.append('get_latest_prices')
+        return {'price': self.price, 'best_bid': self.price, 'best_ask': self.price, 'mid_price': self.price}
+
+    def create_order(self, order):
+        with self.lock:
+            self.calls.append('create_order')
+            self.created_prices.append(order.price)
+            self.creating += 1
+            self.max_creating = max(self.max_creating, self.creating)
+        time.sleep(self.delay)
+        with self.lock:
+            self.creating -= 1
+            self.next_id += 1
+            order_id = self.next_id
+            self.orders[order_id] = {'order_id': order_id, 'side': order.side.value, 'price': order.price,
+                                    'average_price': order.price, 'start_amount': order.amount,
+                                    'remaining_amount': order.amount, 'status': OrderStatus.Unfilled.value}
+        order.order_id = order_id
+        order.ordered_at = 0
+        return order
+
+    def cancel_orders(self, order_ids):
+        self.calls.append('cancel_orders')
+        for oid in order_ids:
+            self.orders[oid]['status'] = OrderStatus.CancelledUnfilled.value
+        return [dict(self.orders[oid]) for oid in order_ids]
+
+    def get_orders_data(self, order_ids):
+        self.calls.append('get_orders_data')
+        self.polled_ids.extend(order_ids)
+        return [dict(self.orders[oid], executed_amount=round(self.orders[oid]['start_amount'] - self.orders[oid]['remaining_amount'], 8))
+                for oid in order_ids]
+
+    def get_active_orders_data(self):
+        self.calls.append('get_active_orders_data')
+        return [dict(od, executed_amount=round(od['start_amount'] - od['remaining_amount'], 8))
+                for od in self.orders.values()
+                if od['status'] in [OrderStatus.Unfilled.value, OrderStatus.PartiallyFilled.value]]
+
+    def get_new_trades(self, since=None):
+        self.calls.append('get_new_trades')
+        return [dict(t) for t in self.trades if since is None or t['executed_at'] >= since]
+
+    def get_latest_trade(self):
+        self.calls.append('get_latest_trade')
+        return dict(self.trades[-1]) if self.trades else None
+
+    is_order_cancelled = Bitbank.is_order_cancelled
+    is_order_fullyfilled = Bitbank.is_order_fullyfilled
+    order_data_from_fills = Bitbank.order_data_from_fills
+
+
+class RecordingNotifier:
+    def __init__(self) -> None:
+        self.messages = []
+
+    def info(self, message, logger=None):
+        self.messages.append(('info', message))
+
+    def error(self, message, logger=None):
+        self.messages.append(('error', message))
+
+    def send_trade_msg(self, message, side='buy'):
+        self.messages.append((side, message))
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
 class TestGridBot:
     @pytest.fixture
     def mock_bitbank(self, monkeypatch):
@@ -90,6 +204,9 @@ class TestGridBot:
         monkeypatch.setattr(requests, 'post', None)
         monkeypatch.setattr(python_bitbankcc, 'public', BitbankPublicMock)
         monkeypatch.setattr(python_bitbankcc, 'private', BitbankPrivateMock)
+        # The clients of Bitbank send the requests on the pooled connections
+        monkeypatch.setattr(bitbank, 'BitbankPublicExt', BitbankPublicMock)
+        monkeypatch.setattr(bitbank, 'BitbankPrivateExt', BitbankPrivateMock)
 
     def test_ticker(self, mock_bitbank):
         pub = python_bitbankcc.public()
@@ -239,6 +356,514 @@ class TestGridBot:
         self.check_ids(bot, [8, 7, 9])
 
 
+    def test_async_bot(self):
+        """ AsyncGridBot should end up the same as GridBot """
+        prices = [10150, 10250, 9850, 9650, 9950, 10350]
+        results = []
+        for bot_class in [GridBot, AsyncGridBot]:
+            bot, param, additional = self.create_bot(max_order_count=4)
+            exchange = FakeExchange(price=param.init_price, max_order_count=4)
+            notifier = RecordingNotifier()
+            bot = bot_class(exchange)
+            additional = dict(additional, notifier=notifier, report_interval_sec=99999)
+
+            async def run():
+                await bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    await bot.sync_and_adjust()
+                await bot.cancel_and_stop()
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(run())
+            else:
+                bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    bot.sync_and_adjust()
+                bot.cancel_and_stop()
+
+            orders = sorted((od['price'], od['side'], od['status']) for od in exchange.orders.values())
+            messages = [(kind, message) for kind, message in notifier.messages if kind in ['buy', 'sell']]
+            # The ticker is fetched along with the orders on every sync
+            assert exchange.calls.count('get_latest_prices') == len(prices)
+            # Both bots time the same phases of the syncs
+            latency = bot.get_latency_stats()
+            assert latency['sync']['count'] == len(prices)
+            assert latency['get_latest_prices']['count'] == len(prices)
+            assert bot.get_stats()['latency'] == latency
+            results.append((orders, sorted(exchange.calls), dict(bot.traded_count), messages, sorted(latency)))
+
+        assert results[0] == results[1]
+        assert results[0][2] == {'buy': 4, 'sell': 6}
+        assert {'retrieve_orders', 'sync_order_status', 'prepare_orders', 'commit_create', 'db_update'} <= set(results[0][4])
+
+    def test_selective_polling(self):
+        """ Polling only the orders in reach of the ticker should end up the same as polling all of them """
+        prices = [10150, 10250, 9850, 9650, 9950, 10350]
+        results = []
+        for bot_class, polling in [(GridBot, 'full'), (GridBot, 'selective'), (AsyncGridBot, 'selective')]:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            bot = bot_class(exchange)
+            additional = dict(additional, order_polling=polling, full_sweep_interval_sec=99999)
+
+            async def run():
+                await bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    await bot.sync_and_adjust()
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(run())
+            else:
+                bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    bot.sync_and_adjust()
+
+            orders = sorted((od['price'], od['side'], od['status']) for od in exchange.orders.values())
+            results.append((orders, dict(bot.traded_count), len(exchange.polled_ids)))
+
+            if bot_class is GridBot and polling == 'selective':
+                # No order is in reach while the price stays between the grid lines
+                exchange.polled_ids.clear()
+                bot.sync_and_adjust()
+                assert exchange.polled_ids == []
+                assert 'get_orders_data' not in exchange.calls[-1:]
+
+        full, selective, async_selective = results
+        assert selective[:2] == full[:2] == async_selective[:2]
+        assert selective[2] == async_selective[2] < full[2]
+
+    def test_fills_from_trades(self):
+        """ Detecting the fills from the trade history should end up the same as polling the order status """
+        prices = [10150, 10250, 9850, 9650, 9950, 10350]
+        results = []
+        for bot_class, detection in [(GridBot, 'status'), (GridBot, 'trades'), (AsyncGridBot, 'trades')]:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            bot = bot_class(exchange)
+            additional = dict(additional, fill_detection=detection, full_sweep_interval_sec=99999)
+
+            async def run():
+                await bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    await bot.sync_and_adjust()
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(run())
+            else:
+                bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    bot.sync_and_adjust()
+
+            orders = sorted((od['price'], od['side'], od['status']) for od in exchange.orders.values())
+            results.append((orders, dict(bot.traded_count), exchange.calls.count('get_orders_data')))
+
+        status, trades, async_trades = results
+        assert trades[:2] == status[:2] == async_trades[:2]
+        # The order status is only polled by the first sync (full sweep)
+        assert trades[2] == async_trades[2] == 1 < status[2]
+
+    def test_partial_fills_from_trades(self):
+        _, param, additional = self.create_bot(max_order_count=4)
+        exchange = FakeExchange(price=param.init_price, max_order_count=4)
+        bot = GridBot(exchange)
+        bot.init_and_start(param=param, additional_info=dict(additional, fill_detection='trades',
+                                                                full_sweep_interval_sec=99999))
+        bot.sync_and_adjust()
+        order = bot.om.buy_stack.best_order_of_active
+        half = order.amount / 2
+
+        exchange.fill(order.order_id, half)
+        bot.sync_and_adjust()
+        assert bot._partial_fills == {order.order_id: [half, half * order.price]}
+        assert order in bot.om.active_orders
+
+        # Trades already seen are skipped
+        exchange.fill(order.order_id, half)
+        bot.sync_and_adjust()
+        assert order not in bot.om.active_orders
+        assert bot.traded_count.total_of(OrderSide.Buy) == 1
+        assert bot._partial_fills == {}
+        # Only the first sync polls the order status
+        assert exchange.calls.count('get_orders_data') == 1
+
+    def test_trade_cursor_from_exchange(self):
+        """ The trade cursor follows the trades of the exchange, whatever the local clock says """
+        for clock_offset in [-5000, 5000]:
+            _, param, additional = self.create_bot(max_order_count=4)
+            exchange = FakeExchange(price=param.init_price, max_order_count=4)
+            exchange.clock_offset = clock_offset
+            bot = GridBot(exchange)
+            bot.init_and_start(param=param, additional_info=dict(additional, fill_detection='trades',
+                                                                    full_sweep_interval_sec=99999))
+            order = bot.om.buy_stack.best_order_of_active
+            half = order.amount / 2
+            exchange.fill(order.order_id, half)
+            # The first sync sweeps the order status, the fill is in the executed amount
+            bot.sync_and_adjust()
+            exchange.fill(order.order_id, half / 2)
+            bot.sync_and_adjust()
+            assert order in bot.om.active_orders
+            assert bot._partial_fills[order.order_id][0] == pytest.approx(half * 1.5)
+
+    def test_trade_cursor_selective_sweep(self):
+        """ Polling some of the orders (the trades failed to be read) does not skip the fills of the others """
+        _, param, additional = self.create_bot(max_order_count=6)
+        exchange = FakeExchange(price=param.init_price, max_order_count=6)
+        bot = GridBot(exchange)
+        bot.init_and_start(param=param, additional_info=dict(additional, fill_detection='trades', order_polling='selective',
+                                                                full_sweep_interval_sec=99999))
+        bot.sync_and_adjust()
+        far = bot.om.buy_stack.worst_order_of_active
+        half = far.amount / 2
+        exchange.fill(far.order_id, half)
+        time.sleep(0.01)
+        get_new_trades = exchange.get_new_trades
+
+        def fail_once(since=None):
+            exchange.get_new_trades = get_new_trades
+            raise ConnectionError("trade history not available")
+
+        exchange.get_new_trades = fail_once
+        # Polls the orders in reach of the price only
+        bot.sync_and_adjust()
+        assert far.order_id not in exchange.polled_ids[-3:]
+        bot.sync_and_adjust()
+        assert bot._partial_fills == {far.order_id: [half, half * far.price]}
+
+    def test_stream_events(self):
+        """ Reacting to the events pushed by the stream should end up the same as polling """
+        # At most one order is traded per move, which is one sync of the polling
+        prices = [10150, 10250, 10150, 10050, 9950, 9850, 9950, 10050]
+        server = LocalStreamServer()
+        server.start()
+        results = []
+        for bot_class in [None, GridBot, AsyncGridBot]:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            bot = (bot_class or GridBot)(exchange)
+            stream = LocalStream(*server.address, retry_interval=0.1)
+            applied = []
+
+            def on_event(event):
+                future = bot.on_stream_event(event)
+                if future is not None:
+                    # Applied in the loop of AsyncGridBot
+                    future.result()
+                applied.append(event)
+
+            def publish(price):
+                seen = len(exchange.trades)
+                server.publish({'type': 'ticker', 'pair': 'eth_jpy', 'data': {'price': price, 'best_bid': price,
+                                                                            'best_ask': price}})
+                exchange.move_to(price)
+                for trade in exchange.trades[seen:]:
+                    server.publish({'type': 'trade', 'pair': 'eth_jpy', 'data': trade})
+                return len(exchange.trades) - seen + 1
+
+            async def run():
+                await bot.init_and_start(param=param, additional_info=additional)
+                published = 0
+                for price in prices:
+                    published += publish(price)
+                    while len(applied) < published:
+                        await asyncio.sleep(0.01)
+
+            if bot_class is None:
+                # Polling only
+                bot.init_and_start(param=param, additional_info=additional)
+                for price in prices:
+                    exchange.move_to(price)
+                    bot.sync_and_adjust()
+            else:
+                stream.subscribe('eth_jpy', on_event)
+                stream.start()
+                assert stream.connected.wait(timeout=5)
+                wait_until(lambda: server.client_count == 1)
+                exchange.calls.clear()
+                if bot_class is AsyncGridBot:
+                    asyncio.run(run())
+                else:
+                    bot.init_and_start(param=param, additional_info=additional)
+                    published = 0
+                    for price in prices:
+                        published += publish(price)
+                        wait_until(lambda: len(applied) >= published)
+                stream.stop()
+                wait_until(lambda: server.client_count == 0)
+                # Neither the order status nor the ticker is polled
+                assert 'get_orders_data' not in exchange.calls
+                assert 'get_latest_prices' not in exchange.calls
+
+            orders = sorted((od['price'], od['side'], od['status']) for od in exchange.orders.values())
+            results.append((orders, dict(bot.traded_count)))
+        server.stop()
+
+        polling, stream_sync, stream_async = results
+        assert stream_sync == polling == stream_async
+        assert polling[1] == {'buy': 3, 'sell': 3}
+
+    def test_warm_restart(self, tmp_path):
+        """ The next bot adopts the orders on its grid and only cancels / creates the difference """
+        for bot_class, storage in [(GridBot, 'object'), (GridBot, 'array'), (AsyncGridBot, 'object')]:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            additional = dict(additional, order_storage=storage, snapshot_path=str(tmp_path / f"{storage}.json"))
+            old_bot, new_bot = bot_class(exchange), bot_class(exchange)
+            # The grid of the next bot is laid out around the latest price
+            new_param = GridBot.Parameter.from_dict(dict(param.to_dict(), init_price=10230))
+
+            async def run():
+                await old_bot.init_and_start(param=param, additional_info=additional)
+                exchange.move_to(10150)
+                await old_bot.sync_and_adjust()
+                await old_bot.stop_and_hand_over()
+                exchange.calls.clear()
+                snapshot = GridBot.load_snapshot(additional['snapshot_path'])
+                await new_bot.warm_start(param=new_param.align_with(GridBot.Parameter.from_dict(snapshot['param'])),
+                                        additional_info=additional, snapshot=snapshot)
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(run())
+            else:
+                old_bot.init_and_start(param=param, additional_info=additional)
+                exchange.move_to(10150)
+                old_bot.sync_and_adjust()
+                # Not placed by the bot, left untouched
+                manual_order = Order(price=5000, amount=1, side=OrderSide.Buy)
+                exchange.create_order(manual_order)
+                old_bot.stop_and_hand_over()
+                exchange.calls.clear()
+                snapshot = GridBot.load_snapshot(additional['snapshot_path'])
+                new_bot.warm_start(param=new_param.align_with(GridBot.Parameter.from_dict(snapshot['param'])),
+                                    additional_info=additional, snapshot=snapshot)
+                assert exchange.orders[manual_order.order_id]['status'] == OrderStatus.Unfilled.value
+
+            assert new_bot.param.init_price == 10200
+            old_prices = {o['order_id']: o['price'] for o in snapshot['orders']}
+            assert sorted(old_prices.values()) == [9800, 9900, 10000, 10200, 10300, 10400]
+            live = {oid: od['price'] for oid, od in exchange.orders.items()
+                    if od['status'] == OrderStatus.Unfilled.value and od['price'] != 5000}
+            assert sorted(live) == sorted(new_bot.om.active_order_ids)
+            assert sorted(live.values()) == [9900, 10000, 10100, 10300, 10400, 10500]
+            # Adopted: 9900, 10000, 10300, 10400. Cancelled: 9800, 10200. Created: 10100, 10500
+            assert sorted(live[oid] for oid in set(old_prices) & set(live)) == [9900, 10000, 10300, 10400]
+            assert exchange.calls.count('get_active_orders_data') == 1
+            assert exchange.calls.count('cancel_orders') == 1
+            assert exchange.calls.count('create_order') == 2
+
+            # The adopted orders are traded as usual
+            exchange.move_to(10350)
+            if bot_class is AsyncGridBot:
+                asyncio.run(new_bot.sync_and_adjust())
+            else:
+                new_bot.sync_and_adjust()
+            assert dict(new_bot.traded_count) == {'sell': 1}
+
+    def test_warm_restart_cancelling(self, tmp_path):
+        """ The orders the last bot was cancelling at the hand-over are cancelled by the next bot, never adopted """
+        _, param, additional = self.create_bot(max_order_count=6)
+        exchange = FakeExchange(price=param.init_price, max_order_count=6)
+        additional = dict(additional, snapshot_path=str(tmp_path / "snapshot.json"))
+        old_bot, new_bot = GridBot(exchange), GridBot(exchange)
+        old_bot.init_and_start(param=param, additional_info=additional)
+        order = old_bot.om.buy_stack.worst_order_of_active
+        order.mark_cancel()
+        old_bot.stop_and_hand_over()
+        snapshot = GridBot.load_snapshot(additional['snapshot_path'])
+        assert order.order_id in [o['order_id'] for o in snapshot['orders']]
+
+        new_bot.warm_start(param=param, additional_info=additional, snapshot=snapshot)
+        assert exchange.orders[order.order_id]['status'] == OrderStatus.CancelledUnfilled.value
+        assert order.order_id not in new_bot.om.active_order_ids
+        # Created again at the same price
+        assert sorted(o.price for o in new_bot.om.active_orders) == [9700, 9800, 9900, 10100, 10200, 10300]
+
+    def test_warm_restart_partial_fill(self, tmp_path):
+        """ A fill seen in the executed amount of an adopted order is not counted again from the trades """
+        _, param, additional = self.create_bot(max_order_count=6)
+        exchange = FakeExchange(price=param.init_price, max_order_count=6)
+        additional = dict(additional, fill_detection='trades', full_sweep_interval_sec=99999,
+                        snapshot_path=str(tmp_path / "snapshot.json"))
+        old_bot, new_bot = GridBot(exchange), GridBot(exchange)
+        old_bot.init_and_start(param=param, additional_info=additional)
+        old_bot.stop_and_hand_over()
+        order_id = old_bot.om.buy_stack.best_order_of_active.order_id
+        half = old_bot.om.buy_stack.best_order_of_active.amount / 2
+        get_active_orders_data = exchange.get_active_orders_data
+
+        def fill_then_get_active_orders_data():
+            # Filled after the next bot started, before its orders fetch
+            exchange.fill(order_id, half)
+            # The fetch reads the orders in a later millisecond than the fill, as any round trip does
+            time.sleep(0.002)
+            return get_active_orders_data()
+
+        exchange.get_active_orders_data = fill_then_get_active_orders_data
+        new_bot.warm_start(param=param, additional_info=additional, snapshot=GridBot.load_snapshot(additional['snapshot_path']))
+        assert new_bot._partial_fills == {order_id: [half, half * 9900]}
+        for _ in range(2):
+            # A full sweep, then the trades
+            new_bot.sync_and_adjust()
+        assert order_id in new_bot.om.active_order_ids
+        assert new_bot._partial_fills == {order_id: [half, half * 9900]}
+        assert exchange.calls.count('get_new_trades') == 1
+
+    def test_recenter_on_drift(self):
+        """ The grid follows the price out of its range by whole grid lines, the traded counts go on """
+        prices = [10150, 10250, 10350, 10450, 10550, 10650, 10750, 10850, 10750, 10650]
+        results = []
+        for storage in ['object', 'array']:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            bot = GridBot(exchange)
+            bot.init_and_start(param=param, additional_info=dict(additional, order_storage=storage, recenter_drift=0.8))
+            assert bot.price_range == (9500, 10500)
+            for price in prices:
+                exchange.move_to(price)
+                bot.sync_and_adjust()
+                lowest_price, highest_price = bot.price_range
+                assert all(lowest_price <= o.price <= highest_price for o in bot.om.active_orders)
+
+            # Shifted by 4 grid lines at 10450 and 10850 each
+            assert bot.recentered_cells == 8
+            assert bot.price_range == (10300, 11300)
+            assert bot.param.init_price == 10000
+            live = sorted((od['price'], od['side']) for od in exchange.orders.values()
+                          if od['status'] == OrderStatus.Unfilled.value)
+            results.append((live, dict(bot.traded_count)))
+
+        assert results[0] == results[1]
+        assert results[0] == ([(10400, 'buy'), (10500, 'buy'), (10600, 'buy'), (10800, 'sell'), (10900, 'sell'),
+                               (11000, 'sell')], {'sell': 8, 'buy': 1})
+
+    def test_drift_on_latest_ticker(self):
+        """ Without trades, the drift is judged on the ticker of the same sync even if it arrives late """
+        for bot_class in [GridBot, AsyncGridBot]:
+            _, param, additional = self.create_bot(max_order_count=6)
+            exchange = FakeExchange(price=param.init_price, max_order_count=6)
+            get_latest_prices = exchange.get_latest_prices
+
+            def slow_latest_prices():
+                time.sleep(0.05)
+                return get_latest_prices()
+
+            exchange.get_latest_prices = slow_latest_prices
+            bot = bot_class(exchange)
+            additional = dict(additional, recenter_drift=0.8)
+            # The ticker jumps before any order is filled
+            exchange.price = 10450
+
+            async def run():
+                await bot.init_and_start(param=param, additional_info=additional)
+                await bot.sync_and_adjust()
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(run())
+            else:
+                bot.init_and_start(param=param, additional_info=additional)
+                bot.sync_and_adjust()
+            assert bot.recentered_cells == 4
+
+    def test_precision_per_bot(self):
+        """ Bots of pairs with different precision run side by side without touching the class-level precision """
+        class_precision = (Order.get_precision('price'), Order.get_precision('amount'))
+        eth_param = GridBot.Parameter.calc_grid_params_by_interval(10, 700000, 10000, price_interval=100, grid_num=10,
+                                            pair='eth_jpy', price_precision=0, amount_precision=4)
+        xrp_param = GridBot.Parameter.calc_grid_params_by_interval(1000, 70000, 50.5, price_interval=0.125, grid_num=10,
+                                            pair='xrp_jpy', price_precision=3, amount_precision=1)
+        assert xrp_param.unit_amount == round(xrp_param.unit_amount, 1)
+        assert xrp_param.init_price_s == '50.500'
+
+        bots = {}
+        for param in [eth_param, xrp_param]:
+            exchange = FakeExchange(price=param.init_price, max_order_count=4).with_pair(param.pair)
+            bots[param.pair] = bot = GridBot(exchange)
+            bot.init_and_start(param=param, additional_info={'pair': param.pair})
+
+        eth_order = bots['eth_jpy'].om.buy_stack.best_order_of_active
+        xrp_order = bots['xrp_jpy'].om.buy_stack.best_order_of_active
+        assert (eth_order.price, eth_order.price_s) == (9900, '9900')
+        assert (xrp_order.price, xrp_order.price_s) == (50.375, '50.375')
+        assert xrp_order.amount_s == format(xrp_param.unit_amount, '.1f')
+        assert (Order.get_precision('price'), Order.get_precision('amount')) == class_precision
+
+    def test_concurrent_creation(self):
+        for bot_class in [GridBot, AsyncGridBot]:
+            _, param, additional = self.create_bot()
+            exchange = FakeExchange(price=param.init_price, max_order_count=8, delay=0.05)
+            bot = bot_class(exchange)
+            additional = dict(additional, create_concurrency=2)
+
+            if bot_class is AsyncGridBot:
+                asyncio.run(bot.init_and_start(param=param, additional_info=additional))
+            else:
+                bot.init_and_start(param=param, additional_info=additional)
+
+            assert exchange.max_creating == 2
+            # Nearest to the price first
+            assert sorted(exchange.created_prices[:2]) == [9900, 10100]
+            assert sorted(o.price for o in bot.om.active_orders) == [9600, 9700, 9800, 9900, 10100, 10200, 10300, 10400]
+            assert sorted(bot.om.active_order_ids) == list(range(1, 9))
+
+    def test_async_errors(self):
+        """ A cancelled creation is not confirmed, the error of a stream event is reported """
+        _, param, additional = self.create_bot()
+        exchange = FakeExchange(price=param.init_price, max_order_count=4)
+        notifier = RecordingNotifier()
+        bot = AsyncGridBot(exchange)
+        call = bot._call
+
+        async def cancel_9800(func, *args, **kwargs):
+            if func == exchange.create_order and args[0].price == 9800:
+                raise asyncio.CancelledError()
+            return await call(func, *args, **kwargs)
+
+        async def run():
+            bot._call = cancel_9800
+            with pytest.raises(asyncio.CancelledError):
+                await bot.init_and_start(param=param, additional_info=dict(additional, notifier=notifier))
+            assert sorted(o.price for o in bot.om.active_orders) == [9900, 10100, 10200]
+            assert [o.price for o in bot.om.orders_to_create] == [9800]
+
+            bot._call = call
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(None, bot.on_stream_event, {'type': 'order', 'data': None})
+            with pytest.raises(Exception):
+                await asyncio.wrap_future(future)
+            await asyncio.sleep(0.01)
+            await bot.flush()
+
+        asyncio.run(run())
+        assert any(kind == 'error' and 'stream event' in message for kind, message in notifier.messages)
+
+    def test_cancel_while_creating(self):
+        """ Orders sent to the exchange before the bot is cancelled are confirmed, so stopping cancels them """
+        _, param, additional = self.create_bot()
+        exchange = FakeExchange(price=param.init_price, max_order_count=4, delay=0.05)
+        bot = AsyncGridBot(exchange)
+
+        async def run():
+            task = asyncio.ensure_future(bot.init_and_start(param=param,
+                                                            additional_info=dict(additional, create_concurrency=2)))
+            # Two creations in flight, two waiting for their turn
+            while exchange.creating < 2:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert len(exchange.orders) == 2
+            assert len(bot.om.active_orders) == 2 and len(bot.om.orders_to_create) == 2
+            await bot.cancel_and_stop()
+
+        asyncio.run(run())
+        assert [od['status'] for od in exchange.orders.values()] == [OrderStatus.CancelledUnfilled.value] * 2
+
     @staticmethod
     def check_sides(bot, buy, sell):
         exp_sides = ['Buy'] *  buy + ['Sell'] * sell
@@ -0,0 +1,167 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import json
+import hmac
+import hashlib
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from exchanges import HttpPool
+from exchanges.bitbank import BitbankPublicExt, BitbankPrivateExt
+
+
+class ApiServer(ThreadingHTTPServer):
+    """ Keep-alive server answering {'success': 1, 'data': ...} and recording the requests """
+    daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            self.server.connections += 1
+
+        def do_GET(self):
+            self._answer(body=None)
+
+        def do_POST(self):
+            self._answer(body=self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+
+        def _answer(self, body):
+            self.server.received.append((self.command, self.path, dict(self.headers), body))
+            answer = {'success': 1, 'data': {'last': '100'}}
+            nonce = self.headers.get('ACCESS-NONCE')
+            if nonce is not None and self.server.check_nonce:
+                # The nonce has to increase over the requests arrived
+                with self.server.lock:
+                    if int(nonce) <= self.server.last_nonce:
+                        answer = {'success': 0, 'data': {'code': 20001}}
+                    else:
+                        self.server.last_nonce = int(nonce)
+            data = json.dumps(answer).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), self.Handler)
+        self.connections = 0
+        self.received = []
+        self.check_nonce = False
+        self.last_nonce = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class TestHttpPool:
+
+    def setup_method(self, method):
+        self.server = ApiServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def teardown_method(self, method):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        pool = HttpPool(pool_size=2)
+        for _ in range(5):
+            assert pool.get(self.server.url + '/ticker').json()['success'] == 1
+        stats = pool.stats()
+        assert self.server.connections == 1
+        assert (stats['requests'], stats['connections'], stats['reused'], stats['errors']) == (5, 1, 4, 0)
+
+        # A new connection per call without the pool
+        plain = HttpPool(pool_size=2)
+        plain.get(self.server.url + '/ticker')
+        plain.close()
+        assert self.server.connections == 2
+        pool.close()
+
+    def test_count_evicted_pools(self):
+        # More hosts than the pools kept per HttpPool (4): the evicted pools' connections still count
+        servers = [ApiServer() for _ in range(4)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        pool = HttpPool(pool_size=2)
+        try:
+            for server in [self.server, *servers, self.server]:
+                pool.get(server.url + '/ticker')
+            stats = pool.stats()
+            assert (stats['requests'], stats['connections'], stats['reused']) == (6, 6, 0)
+            assert self.server.connections == 2
+        finally:
+            pool.close()
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_shared_by_clients(self):
+        pool = HttpPool(pool_size=2)
+        pub = BitbankPublicExt(http_pool=pool)
+        prv = BitbankPrivateExt(api_key='key', api_secret='secret', http_pool=pool)
+        prv.end_point = self.server.url + '/v1'
+
+        assert pub._query(self.server.url + '/eth_jpy/ticker') == {'last': '100'}
+        prv._get_query('/user/spot/active_orders?', {'pair': 'eth_jpy'})
+        prv._post_query('/user/spot/cancel_orders', {'pair': 'eth_jpy', 'order_ids': [1, 2]})
+        assert self.server.connections == 1
+        assert pool.stats()['reused'] == 2
+
+        (_, _, _, _), (_, get_path, get_headers, _), (_, _, post_headers, post_body) = self.server.received
+        assert get_path == '/v1/user/spot/active_orders?pair=eth_jpy'
+        # Signed as the official api does
+        for headers, message in [(get_headers, get_path), (post_headers, post_body)]:
+            nonce = headers['ACCESS-NONCE']
+            expected = hmac.new(b'secret', (nonce + message).encode('utf-8'), hashlib.sha256).hexdigest()
+            assert headers['ACCESS-KEY'] == 'key'
+            assert headers['ACCESS-SIGNATURE'] == expected
+        # The nonce increases even within a millisecond
+        assert int(post_headers['ACCESS-NONCE']) > int(get_headers['ACCESS-NONCE'])
+        pool.close()
+
+    def test_nonce_out_of_order(self):
+        """ A request overtaken by one signed later is rejected by the nonce, then sent again with a new one """
+        self.server.check_nonce = True
+        pool = HttpPool(pool_size=2)
+        prv = BitbankPrivateExt(api_key='key', api_secret='secret', http_pool=pool)
+        prv.end_point = self.server.url + '/v1'
+        post = pool.post
+        signed, overtaken = threading.Event(), threading.Event()
+
+        def slow_first_post(url, **kwargs):
+            if not signed.is_set():
+                # The first signed request waits (e.g., for a new connection) until the second one arrived
+                signed.set()
+                overtaken.wait(timeout=5)
+            return post(url, **kwargs)
+
+        pool.post = slow_first_post
+        results = []
+        first = threading.Thread(target=lambda: results.append(prv._post_query('/user/spot/order', {'price': 1})))
+        first.start()
+        signed.wait(timeout=5)
+        results.append(prv._post_query('/user/spot/order', {'price': 2}))
+        overtaken.set()
+        first.join()
+
+        assert results == [{'last': '100'}] * 2
+        nonces = [int(headers['ACCESS-NONCE']) for _, _, headers, _ in self.server.received]
+        # Second, first (rejected), first again with a new nonce
+        assert len(nonces) == 3 and nonces[1] < nonces[0] < nonces[2]
+        pool.close()
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,53 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import time
+import pytest
+from grid_trade.latency import LatencyRecorder
+
+
+class TestLatencyRecorder:
+
+    def test_percentiles(self):
+        latency = LatencyRecorder()
+        for i in range(1, 101):
+            latency.record('get_orders', i / 1000)
+        stats = latency.summary()['get_orders']
+        assert stats['count'] == 100
+        assert stats['p50'] == pytest.approx(50.5)
+        assert stats['p99'] == pytest.approx(99.01)
+        assert stats['max'] == pytest.approx(100)
+
+    def test_window(self):
+        latency = LatencyRecorder(window=10)
+        for i in range(100):
+            latency.record('sync', 1 if i < 90 else 0.001)
+        stats = latency.summary()['sync']
+        # Only the latest durations count for the percentiles
+        assert stats['count'] == 100
+        assert stats['max'] == pytest.approx(1)
+
+    def test_time(self):
+        latency = LatencyRecorder()
+        with latency.time('sleep'):
+            time.sleep(0.01)
+        with pytest.raises(ValueError):
+            with latency.time('error'):
+                raise ValueError()
+        sleep = latency.timed('sleep', time.sleep)
+        sleep(0.01)
+        summary = latency.summary()
+        assert list(summary) == ['sleep', 'error']
+        assert summary['sleep']['count'] == 2
+        assert summary['sleep']['p50'] >= 10
+        assert 'sleep' in latency.to_markdown()
+
+        latency.reset()
+        assert latency.summary() == {}
+        assert latency.to_markdown() == ""
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
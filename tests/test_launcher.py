@@ -0,0 +1,133 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import os
+import time
+import signal
+import multiprocessing
+import pytest
+from exchanges import SharedRateLimiter, SharedNonce
+from launcher import Launcher, shard_bot_entries, worker_logging_config
+
+
+def acquire_tokens(limiter, count):
+    for _ in range(count):
+        limiter.acquire()
+
+
+def take_nonces(nonce, count, queue):
+    queue.put([nonce.next() for _ in range(count)])
+
+
+def hang(config, index, rate_limiter, nonce, stats_queue, stats_interval):
+    # Neither reports nor stops on SIGINT
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def exit_at_once(config, index, rate_limiter, nonce, stats_queue, stats_interval):
+    http = {'pool': f"pool-{index}", 'requests': 10, 'connections': 2, 'reused': 8, 'errors': 0}
+    stats_queue.put((index, time.time(), [{'pair': config['grid_bots'][0]['pair'], 'active_orders': 4,
+                                            'traded_count': {'buy': 1}, 'http': http}]))
+
+
+def get_config(workers):
+    return {
+        'api': {'key': '', 'secret': '', 'rate_limit': 50},
+        'workers': workers,
+        'grid_bots': [{'pair': 'eth_jpy'}, {'pair': 'xrp_jpy'}, {'pair': 'btc_jpy'}],
+        'fleet': {'stats_interval': 0.1, 'restart_delay': 0.2, 'report_interval': 99999},
+    }
+
+
+class TestLauncher:
+
+    def test_shards(self):
+        entries = [{'pair': p} for p in ['a', 'b', 'c', 'd', 'e']]
+        assert shard_bot_entries(entries, 2) == [entries[0::2], entries[1::2]]
+        assert len(shard_bot_entries(entries, 8)) == 5
+
+        logging_config = {'file': {'path': './logs/app.log', 'backup_count': 3}}
+        assert worker_logging_config(logging_config, index=1)['file'] == {'path': './logs/app.worker1.log', 'backup_count': 3}
+        assert logging_config['file']['path'] == './logs/app.log'
+
+    def test_shared_rate_limit(self):
+        limiter = SharedRateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        processes = [multiprocessing.Process(target=acquire_tokens, args=(limiter, 3)) for _ in range(2)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        # 6 calls across the processes, 1 of them in the burst
+        assert time.monotonic() - started >= 5 / 50
+
+    def test_shared_nonce(self):
+        nonce = SharedNonce()
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=take_nonces, args=(nonce, 200, queue)) for _ in range(2)]
+        for p in processes:
+            p.start()
+        nonces = [queue.get(timeout=10) for _ in processes]
+        for p in processes:
+            p.join()
+        # Increasing in each process, never the same across the processes
+        assert all(n == sorted(n) for n in nonces)
+        assert len(set(nonces[0]) | set(nonces[1])) == 400
+
+    def test_stop_hung_worker(self):
+        config = get_config(workers=1)
+        config['fleet'].update(heartbeat_timeout=0.3, restart_delay=0)
+        launcher = Launcher(config=config)
+        launcher.worker_target = hang
+        worker = launcher.workers[0]
+        launcher.start_worker(worker)
+        hung = worker.process
+        try:
+            time.sleep(0.4)
+            started = time.monotonic()
+            launcher.check_workers()
+            # Interrupted, the monitor loop does not wait for it
+            assert time.monotonic() - started < 0.1
+            assert worker.process is hung and hung.is_alive()
+
+            deadline = time.time() + 5
+            while time.time() < deadline and worker.restarts < 1:
+                launcher.check_workers()
+                time.sleep(0.05)
+            # Killed after the timeout and restarted
+            assert worker.restarts == 1 and not hung.is_alive()
+            assert worker.process is not hung
+        finally:
+            launcher.stop_workers(interrupt=False)
+
+    def test_restart_workers(self):
+        launcher = Launcher(config=get_config(workers=2))
+        launcher.worker_target = exit_at_once
+        assert [w.pairs for w in launcher.workers] == [['eth_jpy', 'btc_jpy'], ['xrp_jpy']]
+        for worker in launcher.workers:
+            launcher.start_worker(worker)
+        try:
+            deadline = time.time() + 5
+            while time.time() < deadline and not all(w.restarts >= 1 for w in launcher.workers):
+                launcher.receive_stats(timeout=0.1)
+                launcher.check_workers()
+            assert all(w.restarts >= 1 for w in launcher.workers)
+
+            stats = launcher.aggregate_stats()
+            assert stats['bots'] == 2 and stats['active_orders'] == 8
+            assert stats['traded_count'] == {'buy': 2}
+            assert stats['http'] == {'requests': 20, 'connections': 4, 'reused': 16, 'errors': 0}
+        finally:
+            launcher.stop_workers(interrupt=False)
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
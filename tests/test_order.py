@@ -4,7 +4,7 @@ import sys
 sys.path.append('.')
 
 import pytest
-from grid_trade.orders import Order, OrderSide
+from grid_trade.orders import Order, OrderContext, OrderSide
 from utils import init_formatted_properties
 
 
@@ -38,6 +38,25 @@ class TestOrder:
         assert o.price_s == '1.2'
         assert o.amount_s == '1.23'
 
+    def test_context(self):
+        context = OrderContext(pair='eth_jpy', user='user', exchange='bitbank', price_precision=0, amount_precision=3)
+        o = Order(price=10000.4, amount=0.12345, side=OrderSide.Sell, tick=3, context=context)
+
+        assert not hasattr(o, '__dict__')
+        assert o.pair == 'eth_jpy' and o.user == 'user'
+        assert o.price_s == '10000'
+        assert o.amount_s == '0.123'
+
+        c = o.copy(price_interval=100, direction='outer')
+        assert c.context is context
+        assert c.price == 10100.4 and c.tick == 4
+        assert c.order_id is None and c.owner is None
+
+        data = o.to_dict()
+        assert data['pair'] == 'eth_jpy' and data['side'] == 'sell'
+        assert 'context' not in data and 'db' not in data
+        assert Order.from_dict(dict(data)).to_dict() == data
+
 
 if __name__ == '__main__':
     import os
@@ -4,7 +4,8 @@ import sys
 sys.path.append('.')
 
 import pytest
-from grid_trade.orders import OrderManager, OrderSide, OrderStatus
+from grid_trade.orders import Order, OrderManager, OrderSide, OrderStatus
+from grid_trade.orderbook import OrderBook
 
 OrderStack = OrderManager.OrderStack
 
@@ -14,7 +15,7 @@ class TestOrderStack:
         self.om: OrderManager = self.get_om()
 
     @staticmethod
-    def get_om():
+    def get_om(cls=OrderManager):
         pair = 'eth_jpy'
 
         additional_info = {
@@ -24,7 +25,7 @@ class TestOrderStack:
         unit_amount=0.2
         grid_num=100
         order_limit=6
-        om = OrderManager(price_interval=price_interval, unit_amount=unit_amount,
+        om = cls(price_interval=price_interval, unit_amount=unit_amount,
                         grid_num=grid_num,order_limit=order_limit, additional_info=additional_info)        
         return om
 
@@ -96,6 +97,191 @@ class TestOrderStack:
         assert [o.price for o in stack.all_orders] == [9800, 9900, 10000, 10100, 10200, 10300]
         assert filled_count == 3
 
+    def test_fractional_price_ticks(self):
+        price_precision = Order.price_precision
+        Order.set_precision(price_precision=1, amount_precision=Order.amount_precision)
+        try:
+            om = OrderManager(price_interval=0.1, unit_amount=1, grid_num=100, order_limit=6,
+                            additional_info={'pair': 'xrp_jpy'})
+            om.init_stacks(init_price=1.2)
+
+            assert [o.tick for o in om.buy_stack.all_orders] == [-1, -2, -3]
+            assert [o.price for o in om.buy_stack.all_orders] == [1.1, 1.0, 0.9]
+            assert [o.price for o in om.sell_stack.all_orders] == [1.3, 1.4, 1.5]
+            assert om.buy_stack.price_to_tick(0.30000000000000004 + 0.9) == 0
+
+            om.sell_stack.refill_stack_by_pairing(traded_orders=om.buy_stack.all_orders)
+            assert [o.price for o in om.sell_stack.all_orders] == [1.0, 1.1, 1.2, 1.3, 1.4, 1.5]
+        finally:
+            Order.set_precision(price_precision=price_precision, amount_precision=Order.amount_precision)
+
+    def test_prepare_duplicate_price(self):
+        init_price = 10000
+        stack = self.om.buy_stack
+        stack.prepare_init(init_price=init_price)
+
+        # Duplicates of orders to create are rejected as well
+        assert not stack.prepare_order_at_price(price=9800)
+        o = stack.to_create[0]
+        o.order_id = 1
+        stack.order_create_ok(order=o)
+        assert not stack.prepare_order_at_price(price=9900)
+        assert len(stack.all_orders) == 3
+
+        stack.mark_order_on_traded(o)
+        assert stack.prepare_order_at_price(price=9900)
+        assert [o.price for o in stack.all_orders] == [9900, 9900, 9800, 9700]
+
+    def test_order_id_index(self):
+        # The same lookups on both storages
+        for cls in [OrderManager, OrderBook]:
+            init_price = 10000
+            om = self.get_om(cls)
+            om.init_stacks(init_price=init_price)
+
+            for i, o in enumerate(om.orders_to_create, start=1):
+                o.order_id = i
+                om.order_create_ok(order=o)
+
+            order, stack = om.get_order_and_stack_by_order_id(order_id=5)
+            assert stack is om.sell_stack
+            assert order.price == 10200
+            assert om.buy_stack.get_order(order_id=5) is None
+            assert om.get_order_by_id(order_id=100) is None
+
+            om.mark_order_on_traded(order_id=5)
+            om.orders_traded()
+            assert om.get_order_by_id(order_id=5) is None
+
+            om.order_force_cancelled(order_id=1)
+            assert om.get_order_by_id(order_id=1) is None
+            assert om.get_order_by_id(order_id=2).price == 9800
+
+            om.cancel_all()
+            assert om.get_order_by_id(order_id=2) is None
+
+    def test_status_buckets(self):
+        init_price = 10000
+        stack = self.om.buy_stack
+        stack.prepare_init(init_price=init_price)
+        assert [o.price for o in stack.to_create] == [9900, 9800, 9700]
+        assert len(stack.active_orders) == 0
+
+        for i, o in enumerate(list(stack.to_create), start=1):
+            o.order_id = i
+            stack.order_create_ok(order=o)
+        assert len(stack.to_create) == 0
+        assert [o.price for o in stack.active_orders] == [9900, 9800, 9700]
+
+        stack.mark_order_on_traded(stack.get_order(order_id=2))
+        assert [o.price for o in stack.active_orders] == [9900, 9700]
+        assert [o.price for o in stack.on_traded_orders] == [9800]
+
+        stack.shrink_outer(count=1)
+        assert [o.price for o in stack.to_cancel] == [9700]
+        assert stack.expected_size == 1
+        # Merged from the buckets, sorted from the inner-most
+        by_status = stack.get_orders_by_status([OrderStatus.ToCancel, OrderStatus.Created, OrderStatus.OnTraded])
+        assert [o.price for o in by_status] == [9900, 9800, 9700]
+        assert [o.price for o in stack.get_orders_by_status([OrderStatus.ToCancel, OrderStatus.Created])] == [9900, 9700]
+
+        stack.orders_traded()
+        assert len(stack.on_traded_orders) == 0
+        assert [o.price for o in stack.all_orders] == [9900, 9700]
+
+    def test_pending_changes(self):
+        init_price = 10000
+        om = self.om
+        om.init_stacks(init_price=init_price)
+        assert [o.price for o in om.pending_changes(OrderStatus.ToCreate)] == [9900, 9800, 9700, 10100, 10200, 10300]
+
+        for i, o in enumerate(om.pending_changes(OrderStatus.ToCreate), start=1):
+            o.order_id = i
+            om.order_create_ok(order=o)
+        assert len(om.changes) == 0
+
+        om.mark_order_on_traded(order_id=4)
+        om.refill_orders_at_opposite_position()
+        om.sell_stack.shrink_outer(count=1)
+        assert [o.price for o in om.pending_changes(OrderStatus.OnTraded)] == [10100]
+        assert [o.price for o in om.pending_changes(OrderStatus.ToCreate)] == [10000]
+        assert [o.price for o in om.pending_changes(OrderStatus.ToCancel)] == [10300]
+
+        # A pending order leaves the change set when it is committed or dropped
+        om.orders_traded()
+        om.order_force_cancelled(order=om.pending_changes(OrderStatus.ToCreate)[0])
+        assert len(om.changes) == 1
+        om.cancel_all()
+        assert len(om.changes) == 0
+
+    def test_balance_stacks(self):
+        init_price = 10000
+        om = self.om
+        om.init_stacks(init_price=init_price)
+        for i, o in enumerate(om.pending_changes(OrderStatus.ToCreate), start=1):
+            o.order_id = i
+            om.order_create_ok(order=o)
+
+        # The price jumps over all the sell orders
+        for order_id in [4, 5, 6]:
+            om.mark_order_on_traded(order_id=order_id)
+        om.refill_orders_at_opposite_position()
+        assert om.buy_stack.expected_size == 6 and om.sell_stack.expected_size == 0
+
+        # Both stacks reach the target shape in one pass
+        om.balance_stacks(price=10350)
+        assert [o.price for o in om.pending_changes(OrderStatus.ToCreate)] == [10200, 10100, 10000, 10400, 10500, 10600]
+        assert [o.price for o in om.pending_changes(OrderStatus.ToCancel)] == [9900, 9800, 9700]
+
+        # Nothing to do once balanced
+        om.balance_stacks(price=10350)
+        assert len(om.pending_changes(OrderStatus.ToCreate)) == 6
+
+    def test_slide_window(self):
+        om = OrderManager(price_interval=100, unit_amount=0.2, grid_num=1000, order_limit=30,
+                        additional_info={'pair': 'eth_jpy'})
+        om.init_stacks(init_price=100000)
+        stack = om.buy_stack
+        assert stack.virtual_size(inner_tick=-1) == 500
+        assert [o.tick for o in stack.to_create] == list(range(-1, -16, -1))
+        for i, o in enumerate(list(stack.to_create), start=1):
+            o.order_id = i
+            stack.order_create_ok(order=o)
+
+        # Only the boundaries are touched
+        stack.slide_window(inner_tick=-3, size=15)
+        assert [o.tick for o in stack.to_cancel] == [-1, -2]
+        assert [o.tick for o in stack.to_create] == [-16, -17]
+
+        # Holes are filled
+        stack.order_force_cancelled(stack.get_order(order_id=8))
+        stack.slide_window(inner_tick=-3, size=15)
+        assert [o.tick for o in stack.to_create] == [-8, -16, -17]
+
+        # Clipped by the edge of the grid
+        stack.slide_window(inner_tick=-495, size=15)
+        assert stack.virtual_size(inner_tick=-495) == 6
+        assert [o.tick for o in stack.to_create] == list(range(-495, -501, -1))
+        assert stack.expected_size == 6
+
+    def test_best_worst_order(self):
+        init_price = 10000
+        stack = self.om.sell_stack
+        stack.prepare_init(init_price=init_price)
+        for i, o in enumerate(list(stack.to_create), start=1):
+            o.order_id = i
+            stack.order_create_ok(order=o)
+
+        stack.refill_orders(direction='inner', count=2)
+        assert stack.best_order_of_all.price == 9900
+        assert stack.worst_order_of_all.price == 10300
+        assert stack.best_order_of_active.price == 10100
+        assert stack.worst_order_of_active.price == 10300
+
+        stack.mark_order_on_traded(stack.get_order(order_id=3))
+        assert stack.worst_order_of_active.price == 10200
+        assert stack.worst_order_of_all.price == 10300
+
 
 if __name__ == '__main__':
     import os
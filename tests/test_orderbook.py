@@ -0,0 +1,136 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import random
+import pytest
+from grid_trade.orders import OrderManager, OrderSide, OrderStatus
+from grid_trade.orderbook import OrderBook
+
+
+class TestOrderBook:
+
+    @staticmethod
+    def get_om(cls, order_limit=6, capacity=64):
+        additional_info = {
+            'pair': 'eth_jpy',
+        }
+        kwargs = {'capacity': capacity} if cls is OrderBook else {}
+        return cls(price_interval=100, unit_amount=0.2, grid_num=100, order_limit=order_limit,
+                    additional_info=additional_info, **kwargs)
+
+    @staticmethod
+    def commit(om, next_id):
+        om.orders_traded()
+        for o in list(om.orders_to_cancel):
+            om.order_cancel_ok(o)
+        for o in list(om.orders_to_create):
+            next_id += 1
+            o.order_id = next_id
+            om.order_create_ok(o)
+        return next_id
+
+    @staticmethod
+    def snapshot(om):
+        if isinstance(om, OrderBook):
+            sides = [om.orders_of_side(OrderSide.Buy), om.orders_of_side(OrderSide.Sell)]
+        else:
+            sides = [om.buy_stack.all_orders, om.sell_stack.all_orders]
+        return [[(o.price, o.status, o.order_id) for o in orders] for orders in sides]
+
+    def test_init_and_fill(self):
+        book = self.get_om(OrderBook, capacity=2)
+        book.init_stacks(init_price=10000)
+        assert [o.price for o in book.orders_to_create] == [9900, 9800, 9700, 10100, 10200, 10300]
+
+        self.commit(book, 0)
+        assert book.active_order_ids == [1, 2, 3, 4, 5, 6]
+        assert book.get_order_by_id(5).price == 10200
+
+        book.mark_orders_on_traded([4, 5])
+        assert book.active_order_ids == [1, 2, 3, 6]
+        book.refill_orders_at_opposite_position()
+        assert [o.price for o in book.orders_to_create] == [10100, 10000]
+
+        book.orders_traded()
+        assert book.get_order_by_id(4) is None
+        assert book.stack_brief_info == "[+5, -1]"
+        order, stack = book.get_order_and_stack_by_order_id(6)
+        assert (order.price, stack) == (10300, book.sell_stack)
+        assert [o.price for o in book.orders_of_side(OrderSide.Sell)] == [10300]
+        assert [o.price for o in book.orders_of_side(OrderSide.Buy)] == [10100, 10000, 9900, 9800, 9700]
+
+    def test_apply_sync_results(self):
+        class FakeExchange:
+            @classmethod
+            def is_order_fullyfilled(cls, order_data):
+                return order_data['status'] == 'FULLY_FILLED'
+
+            @classmethod
+            def is_order_cancelled(cls, order_data):
+                return order_data['status'] == 'CANCELED_UNFILLED'
+
+        orders_data = [
+            {'order_id': 5, 'status': 'FULLY_FILLED', 'average_price': 10201},
+            {'order_id': 1, 'status': 'CANCELED_UNFILLED'},
+            {'order_id': 4, 'status': 'FULLY_FILLED', 'average_price': 10100},
+            {'order_id': 2, 'status': 'UNFILLED'},
+            {'order_id': 100, 'status': 'FULLY_FILLED', 'average_price': 1},
+        ]
+        for cls in [OrderManager, OrderBook]:
+            om = self.get_om(cls)
+            om.init_stacks(init_price=10000)
+            self.commit(om, 0)
+
+            result = om.apply_sync_results(orders_data, exchange=FakeExchange)
+            assert [o.order_id for o in result.traded_orders] == [5, 4]
+            assert result.traded_orders[0].average_price == 10201
+            assert result.traded_orders[0].status == OrderStatus.OnTraded
+            assert [o.order_id for o in result.cancelled_orders] == [1]
+            assert result.missing_order_ids == [100]
+            assert result.counter.preview == "[+0, -2]"
+            assert result.total_traded == 3
+            assert om.active_order_ids == [2, 3, 6]
+
+    def test_order_ids_in_reach(self):
+        for cls in [OrderManager, OrderBook]:
+            om = self.get_om(cls)
+            om.init_stacks(init_price=10000)
+            self.commit(om, 0)
+            # Buy ids 1-3 at 9900 ~ 9700, sell ids 4-6 at 10100 ~ 10300
+            assert om.order_ids_in_reach(low=9950, high=10050) == []
+            assert om.order_ids_in_reach(low=9800, high=10150) == [1, 2, 4]
+            assert om.order_ids_in_reach(low=9000, high=11000) == [1, 2, 3, 4, 5, 6]
+
+    def test_same_as_order_manager(self):
+        """ Both storages should end up with the same orders on a random walk of the price """
+        for seed in range(5):
+            states = []
+            for cls in [OrderManager, OrderBook]:
+                random.seed(seed)
+                om = self.get_om(cls, order_limit=10)
+                om.init_stacks(init_price=10000)
+                next_id = self.commit(om, 0)
+                price = 10000
+                history = []
+                for _ in range(100):
+                    price += random.choice([-250, -120, 0, 120, 250])
+                    for o in om.active_orders:
+                        if (o.side == OrderSide.Buy and o.price >= price) or (o.side == OrderSide.Sell and o.price <= price):
+                            om.mark_order_on_traded(order_id=o.order_id)
+                    om.refill_orders_at_opposite_position()
+                    om.balance_stacks(price=price)
+                    next_id = self.commit(om, next_id)
+                    history.append(self.snapshot(om))
+                states.append(history)
+            assert states[0] == states[1]
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
@@ -0,0 +1,50 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import time
+import threading
+import pytest
+from exchanges import Bitbank, RateLimiter
+
+
+class TestRateLimiter:
+
+    def test_burst_and_rate(self):
+        limiter = RateLimiter(rate=20, burst=2)
+        started = time.monotonic()
+        waits = [limiter.acquire() for _ in range(4)]
+        elapsed = time.monotonic() - started
+        # The burst goes through at once, the rest waits for the tokens
+        assert waits[:2] == [0, 0]
+        assert waits[2] > 0
+        assert 0.09 <= elapsed < 0.5
+
+    def test_shared_by_threads(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert time.monotonic() - started >= 0.09
+
+    def test_shared_by_pairs(self):
+        limiter = RateLimiter(rate=5)
+        eth = Bitbank(pair='eth_jpy', max_order_count=10, rate_limiter=limiter)
+        xrp = eth.with_pair('xrp_jpy', max_order_count=6)
+        assert (xrp.pair, xrp.max_order_count) == ('xrp_jpy', 6)
+        assert (eth.pair, eth.max_order_count) == ('eth_jpy', 10)
+        assert xrp.rate_limiter is limiter
+        assert xrp.prv is eth.prv and xrp.pub is eth.pub
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
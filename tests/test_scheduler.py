@@ -0,0 +1,85 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import pytest
+from grid_trade.orders import OrderManager, OrderSide, OrderCounter, OrderStatus
+from grid_trade.scheduler import PollScheduler
+
+
+class FakeExchange:
+    def __init__(self) -> None:
+        self.api_calls = 0
+
+
+class FakeBot:
+    def __init__(self, price) -> None:
+        self.om = OrderManager(price_interval=100, unit_amount=0.2, grid_num=100, order_limit=6,
+                            additional_info={'pair': 'eth_jpy'})
+        self.om.init_stacks(init_price=10000)
+        for i, o in enumerate(self.om.pending_changes(OrderStatus.ToCreate), start=1):
+            o.order_id = i
+            self.om.order_create_ok(order=o)
+        self.traded_count = OrderCounter()
+        self.exchange = FakeExchange()
+        self.move_to(price)
+
+    def move_to(self, price):
+        self.price_info = {'price': price, 'best_bid': price, 'best_ask': price}
+
+
+class TestPollScheduler:
+
+    def test_fixed_interval(self):
+        scheduler = PollScheduler(check_interval=1)
+        bot = FakeBot(price=9910)
+        assert not scheduler.adaptive
+        assert scheduler.next_interval(bot, synced_at=0) == 1
+
+    def test_adaptive_interval(self):
+        scheduler = PollScheduler(check_interval=1, min_interval=0.5, max_interval=3, near_ratio=0.2, backoff=2)
+        # Active orders: buy 9900, sell 10100
+        bot = FakeBot(price=9910)
+        assert scheduler.next_interval(bot, synced_at=0) == 0.5
+
+        # Mid-cell: back off up to the max interval
+        bot.move_to(10000)
+        assert [scheduler.next_interval(bot, synced_at=t) for t in [1, 3, 6]] == [2, 3, 3]
+
+        # Right after fills
+        bot.traded_count.increase(OrderSide.Buy)
+        assert scheduler.next_interval(bot, synced_at=9) == 0.5
+        assert scheduler.next_interval(bot, synced_at=10) == 2
+
+        bot.move_to(10085)
+        assert scheduler.next_interval(bot, synced_at=12) == 0.5
+
+    def test_api_budget(self):
+        scheduler = PollScheduler(check_interval=1, min_interval=0.5, max_interval=3, api_budget=10)
+        bot = FakeBot(price=9900)
+        intervals = []
+        # Syncs making 2, 3 then 4 API calls
+        for synced_at, calls in [(0, 2), (0.5, 3), (1, 4)]:
+            bot.exchange.api_calls += calls
+            intervals.append(scheduler.next_interval(bot, synced_at=synced_at))
+        # 9 calls in the window and 4 more expected: wait for the first two syncs to leave it
+        assert intervals == [0.5, 0.5, 59.5]
+        bot.exchange.api_calls += 1
+        assert scheduler.next_interval(bot, synced_at=60) == 0.5
+
+    def test_sync_budget_without_counter(self):
+        """ Each sync counts as one call when the exchange does not count them """
+        scheduler = PollScheduler(check_interval=1, min_interval=0.5, max_interval=3, api_budget=3)
+        bot = FakeBot(price=9900)
+        bot.exchange = None
+        assert [scheduler.next_interval(bot, synced_at=t) for t in [0, 0.5, 1]] == [0.5, 0.5, 59]
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
@@ -0,0 +1,95 @@
+# https://realpython.com/pytest-python-testing/
+
+import sys
+sys.path.append('.')
+
+import time
+import pytest
+from exchanges import LocalStream, LocalStreamServer
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+class TestLocalStream:
+
+    @pytest.fixture
+    def server(self):
+        server = LocalStreamServer()
+        server.start()
+        yield server
+        server.stop()
+
+    def test_dispatch_by_pair(self, server):
+        stream = LocalStream(*server.address, retry_interval=0.1)
+        eth_events, xrp_events = [], []
+        stream.subscribe('eth_jpy', eth_events.append)
+        stream.subscribe('xrp_jpy', xrp_events.append)
+        stream.start()
+        wait_until(lambda: server.client_count == 1)
+
+        ticker = {'type': 'ticker', 'pair': 'eth_jpy', 'data': {'price': 10000, 'best_bid': 9990, 'best_ask': 10010}}
+        trade = {'type': 'trade', 'pair': 'xrp_jpy', 'data': {'trade_id': 1, 'order_id': 2, 'amount': '1',
+                                                                'price': '50', 'executed_at': 0}}
+        server.publish(ticker)
+        server.publish({'type': 'unknown', 'pair': 'eth_jpy', 'data': {}})
+        server.publish(trade)
+        wait_until(lambda: xrp_events)
+        assert eth_events == [ticker]
+        assert xrp_events == [trade]
+
+        stream.unsubscribe('eth_jpy', eth_events.append)
+        assert stream.pairs == ['xrp_jpy']
+        stream.stop()
+        wait_until(lambda: server.client_count == 0)
+
+    def test_handler_error(self, server):
+        """ A failing handler does not stop the stream """
+        stream = LocalStream(*server.address, retry_interval=0.1)
+        events = []
+
+        def fail(event):
+            raise ValueError()
+
+        stream.subscribe('eth_jpy', fail)
+        stream.subscribe('eth_jpy', events.append)
+        stream.start()
+        wait_until(lambda: server.client_count == 1)
+        for i in range(2):
+            server.publish({'type': 'ticker', 'pair': 'eth_jpy', 'data': {'price': i}})
+        wait_until(lambda: len(events) == 2)
+        stream.stop()
+
+    def test_reconnect(self):
+        server = LocalStreamServer()
+        host, port = server.address
+        server.start()
+        stream = LocalStream(host, port, retry_interval=0.1)
+        events = []
+        stream.subscribe('eth_jpy', events.append)
+        stream.start()
+        wait_until(lambda: server.client_count == 1)
+        server.stop()
+        wait_until(lambda: not stream.connected.is_set())
+
+        # Back on the same port
+        server = LocalStreamServer(host, port)
+        server.start()
+        wait_until(lambda: server.client_count == 1)
+        server.publish({'type': 'ticker', 'pair': 'eth_jpy', 'data': {'price': 1}})
+        wait_until(lambda: events)
+        stream.stop()
+        server.stop()
+
+
+if __name__ == '__main__':
+    import os
+    from utils import setup_logging
+    log_file_path = os.path.basename(__file__) + '.log'
+    setup_logging(log_file_path='./logs/testing/' + log_file_path, backup_count=1)
+    # https://stackoverflow.com/a/41616391/1938012
+    retcode = pytest.main(['-x', __file__])
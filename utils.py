@@ -3,6 +3,7 @@ import logging
 import logging.handlers
 from datetime import datetime
 import asyncio
+import functools
 import yaml
 
 
@@ -15,9 +16,10 @@ def ensure_in_miliseconds(timestamp):
     return None
 
 
-async def make_async(func, *args):
+async def make_async(func, *args, executor=None, **kwargs):
+    """ Run the blocking `func` in `executor` (the default executor of the loop if None) and await the result """
     loop = asyncio.get_event_loop()
-    res = await loop.run_in_executor(None, func, *args)
+    res = await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
     return res
 
 
@@ -90,11 +92,15 @@ def init_formatted_properties(cls, default_precision=4):
     def get_formatter(field, precision=2, is_rate=False):
         # Save the parameters in this closure
         def format_field(obj):
-            v = round(getattr(obj, field), precision)
+            p = precision
+            if hasattr(obj, 'get_field_precision'):
+                # Instances may override the class-level precision
+                p = obj.get_field_precision(field, default=precision)
+            v = round(getattr(obj, field), p)
             if is_rate:
-                res = format_rate(rate=v, precision=precision)
+                res = format_rate(rate=v, precision=p)
             else:
-                res = format_float(value=v, precision=precision)
+                res = format_float(value=v, precision=p)
             return res
         return property(format_field)
 